@@ -4,15 +4,19 @@
 # set_verbose(True)
 
 import json
-from fastapi.responses import StreamingResponse
+import weakref
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi import FastAPI, Depends, HTTPException, status
 from pydantic import BaseModel
 from typing import List, Optional
 from decouple import config
-from api.llms import initialize_llm
+from api.llms import get_llm, get_llm_model_name, get_llm_provider
 from api.chains.stream.python_edit import create_python_edit_stream_query_chain
-from api.chains.stream.sql_edit import create_sql_edit_stream_query_chain
+from api.chains.stream.sql_edit import create_sql_edit_stream_query_chain, select_table_info
+from api.response_cache import ResponseCache
+from api.limiter import ConcurrencyLimiter, QueueFullError, QueueTimeoutError
+from api.metrics import Gauge, GenerationMetrics, registry, requests_total
 import secrets
 
 
@@ -20,6 +24,41 @@ app = FastAPI()
 
 security = HTTPBasic()
 
+# how much of the prompt the most relevant tables of the data source can take
+sql_edit_table_info_max_tokens = config("SQL_EDIT_TABLE_INFO_MAX_TOKENS", default=8000, cast=int)
+
+# identical concurrent requests always share a generation, completed ones are only kept when this is set
+response_cache = ResponseCache(max_bytes=config("AI_RESPONSE_CACHE_MAX_BYTES", default=0, cast=int))
+
+def parse_concurrency_limits(value):
+    # eg. "openai=16,bedrock=4"
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            provider, limit = item.split("=", 1)
+            limits[provider.strip()] = int(limit)
+    return limits
+
+limiter = ConcurrencyLimiter(
+    limits=parse_concurrency_limits(config("AI_CONCURRENCY_LIMITS", default="")),
+    default_limit=config("AI_CONCURRENCY_LIMIT", default=8, cast=int),
+    max_queue=config("AI_MAX_QUEUED_REQUESTS", default=64, cast=int),
+    queue_timeout=config("AI_QUEUE_TIMEOUT", default=30, cast=float),
+)
+
+registry.register(Gauge(
+    "ai_response_cache",
+    "Response cache counters and sizes.",
+    ("stat",),
+    lambda: [((stat,), value) for stat, value in response_cache.stats().items()],
+))
+registry.register(Gauge(
+    "ai_limiter",
+    "Running and queued generations, and their limit, per provider.",
+    ("provider", "stat"),
+    lambda: [((provider, stat), value) for provider, stats in limiter.stats().items() for stat, value in stats.items()],
+))
+
 def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
     correct_username = secrets.compare_digest(credentials.username, config("BASIC_AUTH_USERNAME"))
     correct_password = secrets.compare_digest(credentials.password, config("BASIC_AUTH_PASSWORD"))
@@ -32,6 +71,56 @@ def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
     return credentials.username
 
 
+async def stream_response(endpoint, key, model_id, workspace_id, generate):
+    """
+    Streams the response for key through the response cache. Requests that
+    need a new generation first wait for a slot of their provider, answering
+    429 when the queue is full and 503 when the wait times out.
+    """
+    slot = None
+    if not response_cache.contains(key):
+        provider = get_llm_provider(model_id)
+        try:
+            slot = await limiter.acquire(provider, workspace_id or "")
+        except QueueFullError as e:
+            requests_total.inc(endpoint=endpoint, status=429)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail={"queueLength": e.queue_length, "queuePosition": e.queue_position},
+                headers={"Retry-After": str(limiter.retry_after(provider, e.queue_position))},
+            )
+        except QueueTimeoutError as e:
+            requests_total.inc(endpoint=endpoint, status=503)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={"queuePosition": e.queue_position},
+                headers={"Retry-After": str(limiter.retry_after(provider, e.queue_position))},
+            )
+        if response_cache.contains(key):
+            # an identical request started generating while this one was queued
+            slot.release()
+            slot = None
+
+    # nothing is awaited since the last contains, so the generation is
+    # registered before any other request gets to check for it
+    lines = response_cache.stream(key, generate)
+
+    async def body():
+        try:
+            async for line in lines:
+                yield line
+        finally:
+            if slot is not None:
+                slot.release()
+
+    requests_total.inc(endpoint=endpoint, status=200)
+    iterator = body()
+    if slot is not None:
+        # when the client goes away before the body is iterated its finally never runs
+        weakref.finalize(iterator, slot.release)
+    return StreamingResponse(iterator, media_type="text/plain")
+
+
 class SQLEditInputData(BaseModel):
     query: str
     instructions: str
@@ -39,17 +128,45 @@ class SQLEditInputData(BaseModel):
     tableInfo: Optional[str] = None
     modelId: Optional[str] = None
     openaiApiKey: Optional[str] = None
+    workspaceId: Optional[str] = None
+    # stream {"delta": ...} lines with the text each token adds, then the whole object
+    streamDeltas: bool = False
+    # how long the caller took to fetch tableInfo, reported in the metrics
+    tableInfoSeconds: Optional[float] = None
 
 @app.post("/v1/stream/sql/edit")
 async def v1_steam_sql_edit(data: SQLEditInputData, _ = Depends(get_current_username)):
-    llm = initialize_llm(model_id=data.modelId, openai_api_key=data.openaiApiKey)
-    chain = create_sql_edit_stream_query_chain(llm, data.dialect, data.tableInfo)
+    llm = get_llm(model_id=data.modelId, openai_api_key=data.openaiApiKey)
+    key = ResponseCache.key(
+        "sql/edit",
+        data.query,
+        data.instructions,
+        data.dialect,
+        data.tableInfo,
+        data.modelId,
+        data.openaiApiKey,
+        data.streamDeltas,
+    )
 
     async def generate():
-        async for result in chain.astream({"query": data.query, "instructions": data.instructions}):
+        metrics = GenerationMetrics(
+            "sql/edit",
+            get_llm_provider(data.modelId),
+            get_llm_model_name(data.modelId),
+            schema_fetch_seconds=data.tableInfoSeconds,
+        )
+        with metrics.time("prompt_build"):
+            table_info = select_table_info(
+                data.tableInfo,
+                data.query,
+                data.instructions,
+                max_tokens=sql_edit_table_info_max_tokens,
+            )
+            chain = create_sql_edit_stream_query_chain(llm, data.dialect, table_info, deltas=data.streamDeltas)
+        async for result in metrics.stream(chain, {"query": data.query, "instructions": data.instructions}):
             yield json.dumps(result) + "\n"
 
-    return StreamingResponse(generate(), media_type="text/plain")
+    return await stream_response("sql/edit", key, data.modelId, data.workspaceId, generate)
 
 class PythonEditInputData(BaseModel):
     source: str
@@ -58,15 +175,30 @@ class PythonEditInputData(BaseModel):
     variables: str
     modelId: Optional[str] = None
     openaiApiKey: Optional[str] = None
+    workspaceId: Optional[str] = None
+    # stream {"delta": ...} lines with the text each token adds, then the whole object
+    streamDeltas: bool = False
 
 
 @app.post("/v1/stream/python/edit")
 async def v1_stream_python_edit(data: PythonEditInputData, _ = Depends(get_current_username)):
-    llm = initialize_llm(model_id=data.modelId, openai_api_key=data.openaiApiKey)
-    chain = create_python_edit_stream_query_chain(llm)
+    llm = get_llm(model_id=data.modelId, openai_api_key=data.openaiApiKey)
+    key = ResponseCache.key(
+        "python/edit",
+        data.source,
+        data.instructions,
+        data.allowedLibraries,
+        data.variables,
+        data.modelId,
+        data.openaiApiKey,
+        data.streamDeltas,
+    )
 
     async def generate():
-        stream = chain.astream({
+        metrics = GenerationMetrics("python/edit", get_llm_provider(data.modelId), get_llm_model_name(data.modelId))
+        with metrics.time("prompt_build"):
+            chain = create_python_edit_stream_query_chain(llm, deltas=data.streamDeltas)
+        stream = metrics.stream(chain, {
             "source": data.source,
             "instructions": data.instructions,
             "allowed_libraries": data.allowedLibraries,
@@ -75,7 +207,19 @@ async def v1_stream_python_edit(data: PythonEditInputData, _ = Depends(get_curre
         async for result in stream:
             yield json.dumps(result) + "\n"
 
-    return StreamingResponse(generate(), media_type="text/plain")
+    return await stream_response("python/edit", key, data.modelId, data.workspaceId, generate)
+
+@app.get("/v1/stats/response-cache")
+async def v1_stats_response_cache(_ = Depends(get_current_username)):
+    return response_cache.stats()
+
+@app.get("/v1/stats/limiter")
+async def v1_stats_limiter(_ = Depends(get_current_username)):
+    return limiter.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(_ = Depends(get_current_username)):
+    return registry.render()
 
 @app.get("/ping")
 async def ping():
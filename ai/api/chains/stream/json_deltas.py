@@ -0,0 +1,191 @@
+import json
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableGenerator
+from langchain_core.utils.json import parse_json_markdown
+
+
+def is_high_surrogate(escape):
+    return escape[1] == "u" and 0xD800 <= int(escape[2:6], 16) <= 0xDBFF
+
+
+class JsonDeltaParser:
+    """
+    Parses the JSON object a model streams a chunk at a time, looking at each
+    character once. String values come out as the text appended to them by
+    each chunk, other values once they are complete. Anything before the
+    object, like a markdown fence, and anything after it is ignored.
+    """
+
+    def __init__(self):
+        self.result = {}
+        self.state = "start"
+        self.key = ""
+        self.escape = ""
+        self.raw = ""
+        self.depth = 0
+        self.in_string = False
+
+    def feed(self, text):
+        """Returns {key: appended text} for the strings that grew, and the values that completed."""
+        deltas = {}
+        value = []
+
+        for c in text:
+            state = self.state
+            if state == "value" or state == "key":
+                if self.escape:
+                    self.escape += c
+                    decoded, rest = self._decode_escape()
+                    if decoded is None:
+                        continue
+                    if state == "value":
+                        value.append(decoded)
+                    else:
+                        self.key += decoded
+                    if rest is None:
+                        continue
+                    # a lone high surrogate, the char after it is read as usual
+                    c = rest
+                if c == "\\":
+                    self.escape = c
+                elif c == '"':
+                    if state == "value":
+                        self._append(deltas, value)
+                        self.state = "after_value"
+                    else:
+                        self.state = "colon"
+                elif state == "value":
+                    value.append(c)
+                else:
+                    self.key += c
+            elif state == "start":
+                if c == "{":
+                    self.state = "key_or_end"
+            elif state == "key_or_end":
+                if c == '"':
+                    self.key = ""
+                    self.state = "key"
+                elif c == "}":
+                    self.state = "end"
+            elif state == "colon":
+                if c == ":":
+                    self.state = "value_start"
+            elif state == "value_start":
+                if c == '"':
+                    self.result[self.key] = ""
+                    self.state = "value"
+                elif not c.isspace():
+                    self.raw = ""
+                    self.depth = 0
+                    self.in_string = False
+                    self.state = "raw_value"
+                    self._feed_raw(c, deltas)
+            elif state == "raw_value":
+                self._feed_raw(c, deltas)
+            elif state == "after_value":
+                if c == ",":
+                    self.state = "key_or_end"
+                elif c == "}":
+                    self.state = "end"
+
+        if self.state == "value":
+            self._append(deltas, value)
+        return deltas
+
+    def _append(self, deltas, value):
+        if value:
+            text = "".join(value)
+            value.clear()
+            self.result[self.key] += text
+            deltas[self.key] = deltas.get(self.key, "") + text
+
+    def _decode_escape(self):
+        """
+        Returns the decoded escape once it is complete, and the char that
+        followed a high surrogate which turned out not to be part of a pair.
+        """
+        escape = self.escape
+        if escape[1] != "u":
+            complete = len(escape) == 2
+        elif len(escape) < 6:
+            complete = False
+        elif not is_high_surrogate(escape):
+            complete = True
+        elif len(escape) == 6:
+            complete = False
+        elif (
+            escape[6] != "\\"
+            or (len(escape) >= 8 and escape[7] != "u")
+            or (len(escape) == 12 and not 0xDC00 <= int(escape[8:12], 16) <= 0xDFFF)
+        ):
+            self.escape = ""
+            decoded = json.loads(f'"{escape[:6]}"')
+            if len(escape) >= 8:
+                # not a pair, but an escape of its own
+                self.escape = escape[6:]
+                decoded_rest, rest = self._decode_escape()
+                return decoded + (decoded_rest or ""), rest
+            return decoded, escape[6]
+        else:
+            complete = len(escape) == 12
+
+        if not complete:
+            return None, None
+        self.escape = ""
+        return json.loads(f'"{escape}"'), None
+
+    def _feed_raw(self, c, deltas):
+        if self.in_string:
+            if self.escape:
+                self.escape = ""
+            elif c == "\\":
+                self.escape = c
+            elif c == '"':
+                self.in_string = False
+        elif c == '"':
+            self.in_string = True
+        elif c in "[{":
+            self.depth += 1
+        elif c in "]}" and self.depth > 0:
+            self.depth -= 1
+        elif c in ",}" and self.depth == 0:
+            self._complete_raw(deltas)
+            self.state = "key_or_end" if c == "," else "end"
+            return
+        self.raw += c
+
+    def _complete_raw(self, deltas):
+        try:
+            self.result[self.key] = json.loads(self.raw)
+        except ValueError:
+            # left for the parse of the whole text at the end
+            return
+        deltas[self.key] = self.result[self.key]
+
+
+async def _stream_json_deltas(chunks):
+    parser = JsonDeltaParser()
+    text = []
+    async for chunk in chunks:
+        text.append(chunk)
+        deltas = parser.feed(chunk)
+        if deltas:
+            yield {"delta": deltas}
+
+    # the whole object closes the stream, parsed like the full mode parses it
+    try:
+        result = parse_json_markdown("".join(text))
+    except ValueError:
+        result = parser.result
+    if result:
+        yield result
+
+
+def json_deltas():
+    """
+    Output parser for chains streaming JSON objects, yielding {"delta": ...}
+    with what each chunk added and then the whole object. Unlike
+    SimpleJsonOutputParser, which yields the whole object after every chunk,
+    the streamed output grows linearly with the generated text.
+    """
+    return StrOutputParser() | RunnableGenerator(_stream_json_deltas)
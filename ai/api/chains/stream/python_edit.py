@@ -1,4 +1,5 @@
 from langchain.output_parsers.json import SimpleJsonOutputParser
+from api.chains.stream.json_deltas import json_deltas
 from langchain.prompts import PromptTemplate
 
 template = """You're a senior python programmer and data scientist.
@@ -22,9 +23,9 @@ instructions: ```{instructions}```
 Your response must contain just a JSON object with an `source` key.
 """
 
-def create_python_edit_stream_query_chain(llm):
+def create_python_edit_stream_query_chain(llm, deltas=False):
     prompt = PromptTemplate(
         template=template,
         input_variables=["allowed_libraries", "source", "instructions", "variables"]
     )
-    return prompt | llm | SimpleJsonOutputParser()
+    return prompt | llm | (json_deltas() if deltas else SimpleJsonOutputParser())
@@ -1,9 +1,10 @@
-from langchain_community.utilities import SQLDatabase
 from langchain.output_parsers.json import SimpleJsonOutputParser
+from api.chains.stream.json_deltas import json_deltas
 from langchain.prompts import PromptTemplate
-from sqlalchemy import inspect
-from sqlalchemy import create_engine
-from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from functools import lru_cache
+import math
+import re
 
 template = """You're an expert in creating queries.
 
@@ -32,57 +33,93 @@ instructions: ```{instructions}```
 Your response must contain just a JSON object with an `sql` key do not explain your thought process or the steps you took to get to the final query. The `sql` key should contain the final query you created.
 """
 
-def get_schema_table_info(engine, schema):
-    db = SQLDatabase(engine=engine, schema=schema, sample_rows_in_table_info=0)
-    return db.get_table_info()
-
-
-def get_catalog_table_info(catalog_engine):
-    inspector = inspect(catalog_engine)
-    schemas = inspector.get_schema_names()
-    with ThreadPoolExecutor() as executor:
-        results = executor.map(lambda schema: get_schema_table_info(catalog_engine, schema), schemas)
-    return "\n\n".join(results)
-
-
-def get_table_info(engine):
-    table_info = ""
-
-    if not engine:
+identifier_re = re.compile(r"[A-Za-z0-9]+")
+camel_case_re = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text):
+    """
+    Splits identifiers into their words, eg. "orderItems.created_at" gives
+    "orderitems", "order", "items", "created", "at".
+    """
+    tokens = []
+    for word in identifier_re.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        parts = camel_case_re.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+@lru_cache(maxsize=8)
+def get_table_index(table_info):
+    """
+    The BM25 index of the tables in table_info. It is kept around because
+    requests for the same data source keep sending the same table info.
+    """
+    tables = [t.strip() for t in table_info.split("\n\n") if t.strip()]
+    documents = []
+    for table in tables:
+        name = table.split("\n", 1)[0]
+        document = Counter(tokenize(name) + tokenize(table))
+        documents.append((document, sum(document.values())))
+
+    average_length = sum(length for _, length in documents) / max(len(documents), 1)
+    document_frequency = Counter(token for document, _ in documents for token in document)
+    return tables, documents, average_length, document_frequency
+
+
+def select_table_info(table_info, query, instructions, max_tokens=8000, k1=1.5, b=0.75):
+    """
+    Keeps the tables of table_info that are most relevant to the query and
+    the instructions, ranked with BM25, until max_tokens is reached. Tables
+    are the blocks separated by blank lines, the first line of a block, its
+    name, counts twice. Additional information about the data source is
+    always kept, and when nothing matches the original order is kept.
+    """
+    if not table_info:
         return table_info
 
-    if engine.dialect.name == "trino":
-        if engine.url.database:
-            inspector = inspect(engine)
-            schemas = inspector.get_schema_names()
-            with ThreadPoolExecutor() as executor:
-                results = executor.map(lambda schema: get_schema_table_info(engine, schema), schemas)
-            table_info = "\n\n".join(results)
-        else:
-            system_catalogs = ["system", "information_schema", "current", "jmx", "memory"]
-            all_catalogs = [row[0] for row in engine.execute("SHOW CATALOGS").fetchall()]
-            user_catalogs = list(filter(lambda c: c not in system_catalogs, all_catalogs))
-            with ThreadPoolExecutor() as executor:
-                catalog_engines = [create_engine(engine.url.set(database=catalog)) for catalog in user_catalogs]
-                results = executor.map(lambda ce: get_catalog_table_info(ce), catalog_engines)
-            table_info = "\n\n".join(results)
-
-    elif engine.dialect.name == "awsathena":
-        inspector = inspect(engine)
-        schemas = inspector.get_schema_names()
-        with ThreadPoolExecutor() as executor:
-            results = executor.map(lambda schema: get_schema_table_info(engine, schema), schemas)
-        table_info = "\n\n".join(results)
-
-    else:
-        db = SQLDatabase(engine=engine)
-        table_info = db.get_table_info()
-
-    # truncate table_info to 100000 chars
-    return table_info[:100000]
-
-
-def create_sql_edit_stream_query_chain(llm, dialect, table_info):
+    additional_info = ""
+    separator = "\nAdditional information:\n"
+    if separator in table_info:
+        table_info, additional_info = table_info.split(separator, 1)
+        additional_info = f"{separator}{additional_info}"
+
+    # a token is roughly 4 characters
+    budget = max_tokens * 4 - len(additional_info)
+    if len(table_info) <= budget:
+        return table_info + additional_info
+
+    tables, documents, average_length, document_frequency = get_table_index(table_info)
+    terms = set(tokenize(f"{query}\n{instructions}"))
+
+    scores = []
+    for document, length in documents:
+        score = 0.0
+        for term in terms:
+            frequency = document.get(term, 0)
+            if frequency == 0:
+                continue
+            n = document_frequency[term]
+            idf = math.log(1 + (len(documents) - n + 0.5) / (n + 0.5))
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+        scores.append(score)
+
+    # sorted is stable, so ties keep their original order
+    ranked = sorted(range(len(tables)), key=lambda i: -scores[i])
+    selected = []
+    for i in ranked:
+        if len(tables[i]) + 2 > budget:
+            continue
+        selected.append(tables[i])
+        budget -= len(tables[i]) + 2
+
+    return "\n\n".join(selected) + additional_info
+
+
+def create_sql_edit_stream_query_chain(llm, dialect, table_info, deltas=False):
     prompt = PromptTemplate(
         template=template,
         input_variables=["query", "instructions"],
@@ -92,4 +129,4 @@ def create_sql_edit_stream_query_chain(llm, dialect, table_info):
         },
     )
 
-    return prompt | llm | SimpleJsonOutputParser()
+    return prompt | llm | (json_deltas() if deltas else SimpleJsonOutputParser())
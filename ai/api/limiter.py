@@ -0,0 +1,156 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+
+class QueueFullError(Exception):
+    def __init__(self, queue_length, queue_position):
+        super().__init__(f"Queue is full with {queue_length} requests")
+        self.queue_length = queue_length
+        self.queue_position = queue_position
+
+
+class QueueTimeoutError(Exception):
+    def __init__(self, queue_position, waited):
+        super().__init__(f"Timed out at position {queue_position} after {waited:.1f}s")
+        self.queue_position = queue_position
+        self.waited = waited
+
+
+class Slot:
+    def __init__(self, limiter, provider):
+        self.limiter = limiter
+        self.provider = provider
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter._release(self.provider, time.monotonic() - self.acquired_at)
+
+
+class ConcurrencyLimiter:
+    """
+    Limits how many generations run at once per provider, so a burst of
+    requests waits here instead of piling up connections to the provider.
+    Waiting requests are served round robin across workspaces, this way a
+    workspace sending lots of requests can't starve the others. Requests that
+    find the queue full, or wait longer than queue_timeout, fail right away
+    so clients can back off.
+    Limits are per process, with multiple workers each one gets its own.
+    """
+
+    def __init__(self, limits, default_limit, max_queue, queue_timeout):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = {}
+        # moving average of how long a generation holds its slot, for retry hints
+        self.average_duration = 10.0
+        # provider -> workspace -> waiters, workspaces ordered by whose turn is next
+        self.queues = {}
+
+    def stats(self):
+        return {
+            provider: {
+                "running": self.running.get(provider, 0),
+                "queued": self._queue_length(provider),
+                "limit": self.limits.get(provider, self.default_limit),
+            }
+            for provider in set(self.running) | set(self.queues)
+        }
+
+    async def acquire(self, provider, workspace_id):
+        limit = self.limits.get(provider, self.default_limit)
+        queue_length = self._queue_length(provider)
+        if queue_length == 0 and self.running.get(provider, 0) < limit:
+            self.running[provider] = self.running.get(provider, 0) + 1
+            return Slot(self, provider)
+
+        if queue_length >= self.max_queue:
+            raise QueueFullError(queue_length, self.queue_position(provider, workspace_id))
+
+        waiter = asyncio.get_running_loop().create_future()
+        queues = self.queues.setdefault(provider, OrderedDict())
+        queues.setdefault(workspace_id, deque()).append(waiter)
+        started_at = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # unless the slot got handed over right as the wait timed out
+            if not waiter.done():
+                position = self.queue_position(provider, workspace_id, queues[workspace_id].index(waiter))
+                waiter.cancel()
+                self._remove(provider, workspace_id, waiter)
+                raise QueueTimeoutError(position, time.monotonic() - started_at)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over while the request was going away
+                self._release(provider)
+            else:
+                waiter.cancel()
+                self._remove(provider, workspace_id, waiter)
+            raise
+
+        return Slot(self, provider)
+
+    def retry_after(self, provider, queue_position):
+        """Roughly how many seconds until a request at queue_position gets served."""
+        limit = self.limits.get(provider, self.default_limit)
+        return max(1, math.ceil(queue_position / limit * self.average_duration))
+
+    def _release(self, provider, duration=None):
+        if duration is not None:
+            self.average_duration = 0.9 * self.average_duration + 0.1 * duration
+
+        queues = self.queues.get(provider)
+        while queues:
+            workspace_id, waiters = next(iter(queues.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                # the workspace goes to the end of the line for its next request
+                queues.move_to_end(workspace_id)
+            else:
+                del queues[workspace_id]
+
+            if not waiter.done():
+                # the slot goes straight to the waiter, running stays the same
+                waiter.set_result(None)
+                return
+
+        self.running[provider] -= 1
+
+    def _queue_length(self, provider):
+        return sum(len(waiters) for waiters in self.queues.get(provider, {}).values())
+
+    def queue_position(self, provider, workspace_id, index=None):
+        """
+        Where the index-th waiting request of the workspace is served, 1 being
+        next, given the round robin across workspaces. Without index, it is
+        where a new request of the workspace would be.
+        """
+        queues = self.queues.get(provider, {})
+        lengths = {w: len(waiters) for w, waiters in queues.items()}
+        if index is None:
+            index = lengths.get(workspace_id, 0)
+            lengths[workspace_id] = index + 1
+
+        position = 0
+        for turn in range(index + 1):
+            for w, length in lengths.items():
+                if length > turn:
+                    position += 1
+                    if w == workspace_id and turn == index:
+                        return position
+        return position
+
+    def _remove(self, provider, workspace_id, waiter):
+        queues = self.queues.get(provider, {})
+        waiters = queues.get(workspace_id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del queues[workspace_id]
@@ -1,3 +1,8 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import cache
 from langchain_aws import BedrockLLM
 from langchain_openai import ChatOpenAI, AzureChatOpenAI
 from decouple import config
@@ -16,25 +21,38 @@ def str_to_bool(value):
 
     return value.lower() in ['true', '1', 't', 'y', 'yes']
 
-def initialize_llm(model_id=None, openai_api_key=None):
-    openai_api_key = openai_api_key or config("OPENAI_API_KEY")
-    use_azure = config("USE_AZURE", default=False, cast=str_to_bool)
+@cache
+def get_llm_settings():
+    # the environment doesn't change while the service runs, so only read it once
+    return {
+        "openai_api_key": config("OPENAI_API_KEY", default=None),
+        "use_azure": config("USE_AZURE", default=False, cast=str_to_bool),
+        "azure_endpoint": config("AZURE_OPENAI_ENDPOINT", default=""),
+        "azure_deployment": config("AZURE_DEPLOYMENT", default=""),
+        "azure_api_version": config("AZURE_API_VERSION", default=""),
+        "openai_default_model_name": config("OPENAI_DEFAULT_MODEL_NAME", default=None),
+        "client_cache_size": config("LLM_CLIENT_CACHE_SIZE", default=32, cast=int),
+        "client_cache_ttl": config("LLM_CLIENT_CACHE_TTL", default=3600, cast=int),
+    }
 
+def initialize_llm(model_id=None, openai_api_key=None):
+    settings = get_llm_settings()
+    openai_api_key = openai_api_key or settings["openai_api_key"]
 
     if model_id in bedrock_model_ids:
         # Initialize Bedrock using default AWS credentials provider chain
         llm = BedrockLLM(
             model_id=model_id,
         )
-    elif use_azure:
+    elif settings["use_azure"]:
         # Initialize Azure OpenAI using the environment variables for API key and model name
         llm = AzureChatOpenAI(
             temperature=0,
             verbose=False,
             openai_api_key=openai_api_key,
-            azure_endpoint=config("AZURE_OPENAI_ENDPOINT", default=""),
-            azure_deployment=config("AZURE_DEPLOYMENT", default=""),
-            api_version=config("AZURE_API_VERSION", default=""),
+            azure_endpoint=settings["azure_endpoint"],
+            azure_deployment=settings["azure_deployment"],
+            api_version=settings["azure_api_version"],
         )
     else:
         # Initialize OpenAI using environment variables for API key and model name
@@ -42,6 +60,74 @@ def initialize_llm(model_id=None, openai_api_key=None):
             temperature=0,
             verbose=False,
             openai_api_key=openai_api_key,
-            model_name=model_id if model_id else config("OPENAI_DEFAULT_MODEL_NAME"),
+            model_name=model_id if model_id else settings["openai_default_model_name"],
         )
     return llm
+
+class LLMClientCache:
+    """
+    Keeps the llm clients around so requests reuse their pooled http
+    connections, or boto3 session, instead of setting up new ones. The least
+    recently used client is evicted once there are more than max_size of them,
+    and clients older than ttl seconds are rebuilt so they don't hold on to
+    connections forever.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, build):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.clients.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.clients.move_to_end(key)
+                return entry[0]
+
+        client = build()
+        with self.lock:
+            self.clients[key] = (client, now)
+            self.clients.move_to_end(key)
+            while len(self.clients) > self.max_size:
+                self.clients.popitem(last=False)
+
+        return client
+
+@cache
+def get_llm_client_cache():
+    settings = get_llm_settings()
+    return LLMClientCache(settings["client_cache_size"], settings["client_cache_ttl"])
+
+def get_llm_provider(model_id=None):
+    if model_id in bedrock_model_ids:
+        return "bedrock"
+    if get_llm_settings()["use_azure"]:
+        return "azure"
+    return "openai"
+
+def get_llm_model_name(model_id=None):
+    provider = get_llm_provider(model_id)
+    if provider == "bedrock":
+        return model_id
+    if provider == "azure":
+        return get_llm_settings()["azure_deployment"]
+    return model_id or get_llm_settings()["openai_default_model_name"]
+
+def get_llm(model_id=None, openai_api_key=None):
+    settings = get_llm_settings()
+    provider = get_llm_provider(model_id)
+    if provider == "bedrock":
+        key = (provider, model_id, None)
+    else:
+        openai_api_key = openai_api_key or settings["openai_api_key"] or ""
+        # requests can bring their own api key, only a hash of it goes in the cache key
+        api_key_hash = hashlib.sha256(openai_api_key.encode()).hexdigest()
+        key = (provider, get_llm_model_name(model_id), api_key_hash)
+
+    return get_llm_client_cache().get(
+        key,
+        lambda: initialize_llm(model_id=model_id, openai_api_key=openai_api_key),
+    )
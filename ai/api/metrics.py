@@ -0,0 +1,341 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from decouple import config
+from langchain_core.callbacks import AsyncCallbackHandler
+from api.llms import str_to_bool
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.on_change = None
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+        if self.on_change is not None:
+            self.on_change()
+
+    def snapshot(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+    def render(self, snapshots=()):
+        """Renders the values of this process summed with the snapshots of other ones."""
+        values = dict(self.values)
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in values.items():
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = sorted(buckets)
+        # labels -> [count per bucket, the last one being +Inf, sum]
+        self.series = {}
+        self.on_change = None
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        if self.on_change is not None:
+            self.on_change()
+
+    def snapshot(self):
+        return [[list(key), counts, total] for key, (counts, total) in self.series.items()]
+
+    def render(self, snapshots=()):
+        """Renders the series of this process summed with the snapshots of other ones."""
+        series = {key: [list(counts), total] for key, (counts, total) in self.series.items()}
+        for snapshot in snapshots:
+            for key, counts, total in snapshot:
+                merged = series.setdefault(tuple(key), [[0] * len(counts), 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in series.items():
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                labels = format_labels(self.labels, key, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose values are read from collect, a function returning (labels, value) pairs, when rendered."""
+
+    def __init__(self, name, help, labels, collect):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def render(self, extra=()):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in self.collect():
+            lines.append(f"{self.name}{format_labels(self.labels, key, extra)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics in the Prometheus text format. Each worker process keeps its own,
+    when directory is set they also save their counters and histograms there
+    as they change, so whichever worker gets scraped serves the totals of all
+    of them. Gauges are read when rendered, they only cover the scraped worker
+    and carry its pid in a worker label.
+    The directory has to be emptied before the workers start, otherwise the
+    counters of the previous run get added to the new ones.
+    """
+
+    def __init__(self, directory=None):
+        self.metrics = []
+        self.directory = directory
+        self.save_scheduled = False
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        if self.directory and hasattr(metric, "snapshot"):
+            metric.on_change = self.changed
+        return metric
+
+    def changed(self):
+        if self.save_scheduled:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+
+        # updates made in one go, eg. when a generation ends, get a single write
+        self.save_scheduled = True
+        loop.call_soon(self.save)
+
+    def save(self):
+        self.save_scheduled = False
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({metric.name: metric.snapshot() for metric in self.metrics if hasattr(metric, "snapshot")}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def load(self):
+        """The snapshots the other workers saved, by metric name."""
+        snapshots = {}
+        if not self.directory:
+            return snapshots
+
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json") or file_name == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, snapshot in worker.items():
+                snapshots.setdefault(name, []).append(snapshot)
+        return snapshots
+
+    def render(self):
+        snapshots = self.load()
+        worker = [("worker", os.getpid())] if self.directory else []
+        lines = []
+        for metric in self.metrics:
+            if hasattr(metric, "snapshot"):
+                lines.extend(metric.render(snapshots.get(metric.name, [])))
+            else:
+                lines.extend(metric.render(worker))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry(directory=config("AI_METRICS_DIR", default="") or None)
+
+generation_labels = ("endpoint", "provider", "model")
+seconds_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+requests_total = registry.register(Counter(
+    "ai_requests_total",
+    "Requests to the edit endpoints by response status.",
+    ("endpoint", "status"),
+))
+generations_total = registry.register(Counter(
+    "ai_generations_total",
+    "Generations by how they ended, ok, error or cancelled.",
+    (*generation_labels, "status"),
+))
+schema_fetch_seconds = registry.register(Histogram(
+    "ai_schema_fetch_seconds",
+    "Time the caller spent fetching the table info sent along with the request.",
+    generation_labels,
+    seconds_buckets,
+))
+prompt_build_seconds = registry.register(Histogram(
+    "ai_prompt_build_seconds",
+    "Time to select the table info and build the chain.",
+    generation_labels,
+    seconds_buckets,
+))
+time_to_first_token_seconds = registry.register(Histogram(
+    "ai_time_to_first_token_seconds",
+    "Time from calling the model to its first token.",
+    generation_labels,
+    seconds_buckets,
+))
+stream_duration_seconds = registry.register(Histogram(
+    "ai_stream_duration_seconds",
+    "Time from calling the model to its last token.",
+    generation_labels,
+    seconds_buckets,
+))
+output_tokens = registry.register(Histogram(
+    "ai_output_tokens",
+    "Tokens streamed by the model per generation.",
+    generation_labels,
+    (16, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+))
+tokens_per_second = registry.register(Histogram(
+    "ai_tokens_per_second",
+    "Tokens per second the model streamed after its first token.",
+    generation_labels,
+    (5, 10, 20, 40, 60, 80, 100, 150, 200, 300),
+))
+
+
+@contextmanager
+def timed(timings, name):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started_at
+
+
+def get_request_logger():
+    logger = logging.getLogger("api.requests")
+    if config("AI_REQUEST_LOGS", default=False, cast=str_to_bool) and not logger.handlers:
+        logger.addHandler(logging.StreamHandler(sys.stdout))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+request_logger = get_request_logger()
+
+
+class GenerationMetrics(AsyncCallbackHandler):
+    """
+    Times one generation, the model reports its tokens through the callbacks
+    of the chain. When it ends the timings go to the histograms and, with
+    AI_REQUEST_LOGS set, to a json log line.
+    """
+
+    def __init__(self, endpoint, provider, model, schema_fetch_seconds=None):
+        self.labels = {"endpoint": endpoint, "provider": provider, "model": model or ""}
+        self.timings = {}
+        if schema_fetch_seconds is not None:
+            self.timings["schema_fetch"] = schema_fetch_seconds
+        self.llm_started_at = None
+        self.first_token_at = None
+        self.last_token_at = None
+        self.tokens = 0
+
+    def time(self, name):
+        return timed(self.timings, name)
+
+    async def on_llm_start(self, serialized, prompts, **kwargs):
+        if self.llm_started_at is None:
+            self.llm_started_at = time.perf_counter()
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        if self.llm_started_at is None:
+            self.llm_started_at = time.perf_counter()
+
+    async def on_llm_new_token(self, token, **kwargs):
+        self.last_token_at = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = self.last_token_at
+        self.tokens += 1
+
+    async def stream(self, chain, input):
+        """Streams the chain with these callbacks, recording the generation once it ends."""
+        status = "error"
+        try:
+            async for result in chain.astream(input, config={"callbacks": [self]}):
+                yield result
+            status = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            status = "cancelled"
+            raise
+        finally:
+            self.finish(status)
+
+    def finish(self, status):
+        if self.llm_started_at is not None and self.first_token_at is not None:
+            self.timings["time_to_first_token"] = self.first_token_at - self.llm_started_at
+            self.timings["stream_duration"] = self.last_token_at - self.llm_started_at
+
+        generations_total.inc(status=status, **self.labels)
+        for name, histogram in [
+            ("schema_fetch", schema_fetch_seconds),
+            ("prompt_build", prompt_build_seconds),
+            ("time_to_first_token", time_to_first_token_seconds),
+            ("stream_duration", stream_duration_seconds),
+        ]:
+            if name in self.timings:
+                histogram.observe(self.timings[name], **self.labels)
+
+        rate = None
+        if self.tokens:
+            output_tokens.observe(self.tokens, **self.labels)
+            streaming = self.last_token_at - self.first_token_at
+            if self.tokens > 1 and streaming > 0:
+                rate = (self.tokens - 1) / streaming
+                tokens_per_second.observe(rate, **self.labels)
+
+        if request_logger.isEnabledFor(logging.INFO):
+            request_logger.info(json.dumps({
+                **self.labels,
+                "status": status,
+                **{f"{name}_seconds": round(seconds, 4) for name, seconds in self.timings.items()},
+                "tokens": self.tokens,
+                "tokens_per_second": round(rate, 1) if rate is not None else None,
+            }))
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+import weakref
+from collections import OrderedDict
+
+
+class Flight:
+    """A generation in progress, whose lines every request waiting on it replays."""
+
+    def __init__(self):
+        self.lines = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task = None
+
+
+class ResponseCache:
+    """
+    Streams responses of the AI endpoints, coalescing concurrent identical
+    requests into a single generation. When max_bytes is set, completed
+    responses are also kept, least recently used first out, and identical
+    requests replay them instead of calling the model again.
+    """
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "maxBytes": self.max_bytes,
+        }
+
+    def contains(self, key):
+        """Whether a request for key would be served without a new generation."""
+        return key in self.entries or key in self.flights
+
+    def stream(self, key, generate):
+        """
+        Returns an async iterator over the lines of the response for key,
+        generate is only called when no identical request is cached or running
+        already. The generation is registered right away, not once iterating
+        starts, so identical requests coming in meanwhile join it.
+        """
+        lines = self.entries.get(key)
+        if lines is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self._replay(lines)
+
+        flight = self.flights.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = Flight()
+            self.flights[key] = flight
+            flight.task = asyncio.create_task(self._generate(key, flight, generate))
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+
+        async def follow():
+            try:
+                i = 0
+                while True:
+                    async with flight.changed:
+                        await flight.changed.wait_for(lambda: i < len(flight.lines) or flight.done)
+                    while i < len(flight.lines):
+                        yield flight.lines[i]
+                        i += 1
+                    if flight.done:
+                        break
+
+                if flight.error is not None:
+                    raise flight.error
+            finally:
+                leave()
+
+        iterator = follow()
+        # when the iterator is dropped before being iterated its finally never runs
+        leave = weakref.finalize(iterator, self._leave, key, flight)
+        leave.atexit = False
+        return iterator
+
+    async def _replay(self, lines):
+        for line in lines:
+            yield line
+
+    def _leave(self, key, flight):
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            # nobody is waiting on the response anymore, stop generating it
+            # and let the next identical request start over
+            self._unlink(key, flight)
+            flight.task.cancel()
+
+    async def _generate(self, key, flight, generate):
+        try:
+            async for line in generate():
+                async with flight.changed:
+                    flight.lines.append(line)
+                    flight.changed.notify_all()
+        except BaseException as e:
+            flight.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            self._store(key, flight.lines)
+        finally:
+            self._unlink(key, flight)
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    def _unlink(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def _store(self, key, lines):
+        size = sum(len(line) for line in lines)
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = lines
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= sum(len(line) for line in evicted)
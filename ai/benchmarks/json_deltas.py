@@ -0,0 +1,74 @@
+"""
+Compares streaming a long python edit as the whole object after every token,
+like SimpleJsonOutputParser does, against streaming the deltas.
+
+    python -m benchmarks.json_deltas [--lines 100]
+
+The tokens are a synthetic source split the way models tend to split code,
+the time reported is the parsing and serialization done per response.
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from langchain_core.utils.json import parse_partial_json
+from api.chains.stream.json_deltas import JsonDeltaParser
+
+
+def make_tokens(lines, rng):
+    statements = [
+        "df = df[df['amount'] > 0]",
+        "totals = df.groupby('country')['amount'].sum()",
+        "fig, ax = plt.subplots(figsize=(10, 6))",
+        "for name, group in df.groupby('region'):",
+        "    print(f\"{name}: {len(group)} rows\")",
+        "df['created_at'] = pd.to_datetime(df['created_at'])",
+    ]
+    source = "\n".join(rng.choice(statements) for _ in range(lines))
+    text = json.dumps({"source": source})
+    return re.findall(r"\w+|\s+|[^\w\s]", text)
+
+
+def full(tokens):
+    lines = []
+    text = ""
+    previous = None
+    for token in tokens:
+        text += token
+        result = parse_partial_json(text)
+        if result is not None and result != previous:
+            lines.append(json.dumps(result) + "\n")
+            previous = result
+    return lines
+
+
+def deltas(tokens):
+    lines = []
+    parser = JsonDeltaParser()
+    for token in tokens:
+        delta = parser.feed(token)
+        if delta:
+            lines.append(json.dumps({"delta": delta}) + "\n")
+    lines.append(json.dumps(json.loads("".join(tokens))) + "\n")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=100)
+    args = parser.parse_args()
+
+    tokens = make_tokens(args.lines, random.Random(42))
+    print(f"{args.lines} lines of source, {len(tokens)} tokens\n")
+    print(f"{'mode':<8} {'lines':>7} {'bytes':>12} {'ms':>9}")
+    for name, stream in [("full", full), ("deltas", deltas)]:
+        start = time.perf_counter()
+        lines = stream(tokens)
+        ms = (time.perf_counter() - start) * 1000
+        print(f"{name:<8} {len(lines):>7} {sum(len(line) for line in lines):>12} {ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
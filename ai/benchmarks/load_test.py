@@ -0,0 +1,186 @@
+"""
+Load tests the AI api against a stub llm server, to see how it queues and
+sheds load without spending tokens.
+
+    python -m benchmarks.load_test [--requests 200] [--workspaces 5] [--workers 1]
+
+A stub of the OpenAI chat completions api streams a fixed sql edit slowly,
+the AI api is started pointing at it, and the requests are all sent at once
+spread over the workspaces, each with its own instructions so none get
+coalesced. It reports the status codes, time to the first line and total
+latency per status, and how many generations the stub saw at once.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+stub = FastAPI()
+stub_state = {"running": 0, "peak": 0, "total": 0, "token_delay": 0.05}
+
+
+@stub.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    tokens = ['{"', 'sql', '":', ' "', "SELECT", " *", " FROM", " orders", " LIMIT", " 10", '"}']
+
+    async def generate():
+        stub_state["running"] += 1
+        stub_state["total"] += 1
+        stub_state["peak"] = max(stub_state["peak"], stub_state["running"])
+        try:
+            for token in tokens:
+                await asyncio.sleep(stub_state["token_delay"])
+                chunk = {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {
+                "id": "stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            stub_state["running"] -= 1
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+def start_stub(port):
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def start_api(port, stub_port, args):
+    env = os.environ.copy()
+    env.update({
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_DEFAULT_MODEL_NAME": "gpt-4o",
+        "BASIC_AUTH_USERNAME": "load",
+        "BASIC_AUTH_PASSWORD": "test",
+        "AI_CONCURRENCY_LIMIT": str(args.concurrency_limit),
+        "AI_MAX_QUEUED_REQUESTS": str(args.max_queued),
+        "AI_QUEUE_TIMEOUT": str(args.queue_timeout),
+    })
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.app:app", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/ping")
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("AI api did not start")
+
+
+async def send(client, port, i, workspace_id):
+    started_at = time.perf_counter()
+    first_line_at = None
+    payload = {
+        "query": "SELECT * FROM orders",
+        "instructions": f"limit it to 10 rows ({i})",
+        "dialect": "postgresql",
+        "workspaceId": workspace_id,
+    }
+    async with client.stream("POST", f"http://127.0.0.1:{port}/v1/stream/sql/edit", json=payload) as response:
+        lines = []
+        async for line in response.aiter_lines():
+            if first_line_at is None:
+                first_line_at = time.perf_counter()
+            lines.append(line)
+        detail = json.loads("".join(lines)).get("detail") if response.status_code >= 400 else None
+        return {
+            "status": response.status_code,
+            "workspace": workspace_id,
+            "ttfl": (first_line_at or time.perf_counter()) - started_at,
+            "latency": time.perf_counter() - started_at,
+            "retryAfter": response.headers.get("retry-after"),
+            "detail": detail,
+        }
+
+
+async def run(port, args):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(auth=("load", "test"), timeout=None, limits=limits) as client:
+        return await asyncio.gather(*[
+            send(client, port, i, f"workspace-{i % args.workspaces}") for i in range(args.requests)
+        ])
+
+
+def percentile(values, p):
+    return statistics.quantiles(values, n=100)[p - 1] if len(values) > 1 else values[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workspaces", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency-limit", type=int, default=8)
+    parser.add_argument("--max-queued", type=int, default=64)
+    parser.add_argument("--queue-timeout", type=float, default=30)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8911)
+    args = parser.parse_args()
+
+    stub_state["token_delay"] = args.token_delay
+    stub_server = start_stub(args.port + 1)
+    api = start_api(args.port, args.port + 1, args)
+    try:
+        started_at = time.perf_counter()
+        results = asyncio.run(run(args.port, args))
+        elapsed = time.perf_counter() - started_at
+    finally:
+        api.terminate()
+        api.wait()
+        stub_server.should_exit = True
+
+    print(f"{args.requests} requests from {args.workspaces} workspaces in {elapsed:.1f}s, {args.workers} worker(s)")
+    print(f"stub llm saw {stub_state['total']} generations, at most {stub_state['peak']} at once\n")
+    print(f"{'status':>6} {'count':>6} {'ttfl p50':>9} {'ttfl p95':>9} {'lat p50':>8} {'lat p95':>8}")
+    for status in sorted({r["status"] for r in results}):
+        group = [r for r in results if r["status"] == status]
+        ttfl = [r["ttfl"] for r in group]
+        latency = [r["latency"] for r in group]
+        print(
+            f"{status:>6} {len(group):>6} {percentile(ttfl, 50):>8.2f}s {percentile(ttfl, 95):>8.2f}s"
+            f" {percentile(latency, 50):>7.2f}s {percentile(latency, 95):>7.2f}s"
+        )
+
+    rejected = [r for r in results if r["status"] in (429, 503)]
+    if rejected:
+        print(f"\nfirst rejection: status {rejected[0]['status']}, detail {rejected[0]['detail']}, retry after {rejected[0]['retryAfter']}s")
+
+    print("\nsuccesses per workspace:")
+    for workspace_id in sorted({r["workspace"] for r in results}):
+        count = sum(1 for r in results if r["workspace"] == workspace_id and r["status"] == 200)
+        print(f"  {workspace_id}: {count}")
+
+
+if __name__ == "__main__":
+    main()
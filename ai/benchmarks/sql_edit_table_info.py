@@ -0,0 +1,112 @@
+"""
+Compares the table info sent along with sql edit requests before and after
+ranking the tables by relevance, on a synthetic warehouse.
+
+    python -m benchmarks.sql_edit_table_info [--tables 3000] [--stream]
+
+Prompt sizes are always reported. With --stream the edits are also sent to
+the configured model, the same way the api does, to measure the time to the
+first streamed token, this needs the same .env as the service.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import tiktoken
+from api.chains.stream.sql_edit import select_table_info, template
+
+domains = {
+    "sales": ["orders", "order_items", "invoices", "refunds", "discounts"],
+    "crm": ["customers", "contacts", "accounts", "leads", "opportunities"],
+    "product": ["products", "categories", "inventory", "suppliers", "prices"],
+    "web": ["sessions", "page_views", "events", "campaigns", "referrers"],
+    "finance": ["payments", "ledger_entries", "budgets", "expenses", "taxes"],
+}
+column_types = ["integer", "bigint", "varchar", "text", "timestamp", "date", "numeric", "boolean"]
+column_names = [
+    "id", "created_at", "updated_at", "status", "amount", "currency", "name",
+    "email", "country", "region", "source", "quantity", "price", "total",
+    "description", "external_id", "owner_id", "deleted_at", "score", "notes",
+]
+questions = [
+    ("sales.orders", "total revenue of orders per month in 2024"),
+    ("crm.customers", "customers that signed up last week by country"),
+    ("web.page_views", "top 10 pages by page views yesterday"),
+    ("finance.refunds", "sum of refund amounts grouped by reason"),
+    ("product.inventory", "products with inventory quantity below 5"),
+]
+
+
+def make_table_info(tables, rng):
+    """Table info in the format the api sends, one block per table."""
+    blocks = []
+    for i in range(tables):
+        domain = rng.choice(list(domains))
+        name = rng.choice(domains[domain])
+        # the first copy of each table keeps its plain name, the rest are partitions and staging copies
+        suffix = "" if i < 25 else f"_{rng.choice(['stg', 'tmp', 'archive', 'p'])}{i}"
+        columns = [f"{name.rstrip('s')}_id integer"] + [
+            f"{c} {rng.choice(column_types)}" for c in rng.sample(column_names, rng.randint(5, 20))
+        ]
+        blocks.append(f"{domain}.{name}{suffix}\n" + "\n".join(columns))
+    refunds = "finance.refunds\nrefund_id integer\norder_id integer\namount numeric\nreason varchar\ncreated_at timestamp"
+    blocks.insert(rng.randint(len(blocks) // 2, len(blocks)), refunds)
+    return "\n\n".join(blocks)
+
+
+def legacy_table_info(table_info):
+    # what used to reach the prompt
+    return table_info[:100000]
+
+
+async def time_to_first_token(table_info, instructions):
+    from api.chains.stream.sql_edit import create_sql_edit_stream_query_chain
+    from api.llms import get_llm
+
+    chain = create_sql_edit_stream_query_chain(get_llm(), "postgresql", table_info)
+    start = time.perf_counter()
+    async for _ in chain.astream({"query": "", "instructions": instructions}):
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=int, default=3000)
+    parser.add_argument("--max-tokens", type=int, default=8000)
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    encoding = tiktoken.get_encoding("cl100k_base")
+    table_info = make_table_info(args.tables, rng)
+    print(f"{args.tables} tables, {len(table_info)} chars of table info\n")
+
+    header = f"{'question':<55} {'before':>14} {'after':>14} {'rank ms':>8} {'hit b/a':>8}"
+    if args.stream:
+        header += f" {'ttft before':>12} {'ttft after':>11}"
+    print(header)
+
+    for table, instructions in questions:
+        before = legacy_table_info(table_info)
+
+        start = time.perf_counter()
+        after = select_table_info(table_info, "", instructions, max_tokens=args.max_tokens)
+        rank_ms = (time.perf_counter() - start) * 1000
+
+        sizes = []
+        for info in (before, after):
+            prompt = template.format(dialect="postgresql", table_info=info, query="", instructions=instructions)
+            sizes.append(f"{len(encoding.encode(prompt))} tokens")
+
+        hits = "/".join("y" if f"{table}\n" in info else "n" for info in (before, after))
+        line = f"{instructions:<55} {sizes[0]:>14} {sizes[1]:>14} {rank_ms:>8.1f} {hits:>8}"
+        if args.stream:
+            ttft_before = asyncio.run(time_to_first_token(before, instructions))
+            ttft_after = asyncio.run(time_to_first_token(after, instructions))
+            line += f" {ttft_before:>11.2f}s {ttft_after:>10.2f}s"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,11 +11,13 @@ const base64Credentials = () =>
   ).toString('base64')
 
 export async function sqlEditStreamed(
+  workspaceId: string,
   query: string,
   instructions: string,
   dialect: string,
   onSQL: (sql: string) => void,
   tableInfo: string | null,
+  tableInfoSeconds: number | null,
   modelId: string | null,
   openaiApiKey: string | null
 ): Promise<{
@@ -30,10 +32,15 @@ export async function sqlEditStreamed(
       instructions,
       dialect,
       tableInfo,
+      // reported in the metrics of the ai api, apart from the model latency
+      tableInfoSeconds,
       modelId,
       openaiApiKey: openaiApiKey
         ? decrypt(openaiApiKey, config().WORKSPACE_SECRETS_ENCRYPTION_KEY)
         : null,
+      // the ai api queues requests fairly across workspaces
+      workspaceId,
+      streamDeltas: true,
     },
     {
       headers: {
@@ -53,12 +60,23 @@ export async function sqlEditStreamed(
 
         let success = false
         let error: Error | null = null
+        let sql = ''
         response.data
           .pipe(split2(JSON.parse))
           .on('data', (obj: any) => {
-            const parse = z.object({ sql: z.string() }).safeParse(obj)
+            const parse = z
+              .union([
+                z.object({ delta: z.object({ sql: z.string() }) }),
+                z.object({ sql: z.string() }),
+              ])
+              .safeParse(obj)
             if (parse.success) {
-              onSQL(parse.data.sql)
+              // deltas append text, the last line has the whole sql
+              sql =
+                'delta' in parse.data
+                  ? sql + parse.data.delta.sql
+                  : parse.data.sql
+              onSQL(sql)
               success = true
             } else {
               error = parse.error
@@ -121,6 +139,7 @@ function dataframesToPython(dataframes: DataFrame[]): string {
 }
 
 export async function pythonEditStreamed(
+  workspaceId: string,
   source: string,
   instructions: string,
   dataFrames: DataFrame[],
@@ -149,6 +168,9 @@ export async function pythonEditStreamed(
       openaiApiKey: openaiApiKey
         ? decrypt(openaiApiKey, config().WORKSPACE_SECRETS_ENCRYPTION_KEY)
         : null,
+      // the ai api queues requests fairly across workspaces
+      workspaceId,
+      streamDeltas: true,
     },
     {
       headers: {
@@ -166,12 +188,23 @@ export async function pythonEditStreamed(
         const response = await responseP
         let success = false
         let error: Error | null = null
+        let source = ''
         response.data
           .pipe(split2(JSON.parse))
           .on('data', (obj: any) => {
-            const parse = z.object({ source: z.string() }).safeParse(obj)
+            const parse = z
+              .union([
+                z.object({ delta: z.object({ source: z.string() }) }),
+                z.object({ source: z.string() }),
+              ])
+              .safeParse(obj)
             if (parse.success) {
-              onSource(parse.data.source)
+              // deltas append text, the last line has the whole source
+              source =
+                'delta' in parse.data
+                  ? source + parse.data.delta.source
+                  : parse.data.source
+              onSource(source)
               success = true
             } else {
               error = parse.error
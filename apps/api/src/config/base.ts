@@ -6,6 +6,19 @@ type FeatureFlags = {
   visualizationsV2: boolean
 }
 
+const queryDumpCompressions = [
+  'zstd',
+  'snappy',
+  'lz4',
+  'gzip',
+  'brotli',
+  'none',
+] as const
+export type QueryDumpCompression = (typeof queryDumpCompressions)[number]
+
+const aggregationEngines = ['pandas', 'duckdb'] as const
+export type AggregationEngine = (typeof aggregationEngines)[number]
+
 export interface IBaseConfig {
   NODE_ENV: string
   ALLOW_HTTP: boolean
@@ -37,6 +50,8 @@ export interface IBaseConfig {
   WORKSPACE_SECRETS_ENCRYPTION_KEY: string
   DISABLE_CUSTOM_OAI_KEY: boolean
   YJS_DOCS_CACHE_SIZE_MB: number
+  QUERY_DUMP_COMPRESSION: QueryDumpCompression
+  AGGREGATION_ENGINE: AggregationEngine
   DISABLE_ANONYMOUS_TELEMETRY: boolean
   DISABLE_UPDATE_CHECK: boolean
   FEATURE_FLAGS: FeatureFlags
@@ -72,6 +87,8 @@ export class BaseConfig implements IBaseConfig {
   public readonly DATASOURCES_ENCRYPTION_KEY: string
   public readonly WORKSPACE_SECRETS_ENCRYPTION_KEY: string
   public readonly YJS_DOCS_CACHE_SIZE_MB: number
+  public readonly QUERY_DUMP_COMPRESSION: QueryDumpCompression
+  public readonly AGGREGATION_ENGINE: AggregationEngine
   public readonly DISABLE_CUSTOM_OAI_KEY: boolean
   public readonly DISABLE_ANONYMOUS_TELEMETRY: boolean
   public readonly DISABLE_UPDATE_CHECK: boolean
@@ -131,6 +148,8 @@ export class BaseConfig implements IBaseConfig {
       // can't be 0 because LRUCache doesn't allow that
       1 / 1024 / 1024
     )
+    this.QUERY_DUMP_COMPRESSION = this.getQueryDumpCompression()
+    this.AGGREGATION_ENGINE = this.getAggregationEngine()
     this.DISABLE_CUSTOM_OAI_KEY = this.getBooleanVar(
       'DISABLE_CUSTOM_OAI_KEY',
       false
@@ -193,6 +212,42 @@ export class BaseConfig implements IBaseConfig {
     return null
   }
 
+  private getQueryDumpCompression(): QueryDumpCompression {
+    const value = process.env['QUERY_DUMP_COMPRESSION']?.toLowerCase().trim()
+    if (!value) {
+      return 'zstd'
+    }
+
+    const compression = queryDumpCompressions.find((c) => c === value)
+    if (!compression) {
+      logger().warn(
+        { value, options: queryDumpCompressions },
+        'Invalid QUERY_DUMP_COMPRESSION, falling back to zstd'
+      )
+      return 'zstd'
+    }
+
+    return compression
+  }
+
+  private getAggregationEngine(): AggregationEngine {
+    const value = process.env['AGGREGATION_ENGINE']?.toLowerCase().trim()
+    if (!value) {
+      return 'pandas'
+    }
+
+    const engine = aggregationEngines.find((e) => e === value)
+    if (!engine) {
+      logger().warn(
+        { value, options: aggregationEngines },
+        'Invalid AGGREGATION_ENGINE, falling back to pandas'
+      )
+      return 'pandas'
+    }
+
+    return engine
+  }
+
   private getFeatureFlags(): FeatureFlags {
     return {
       visualizationsV2: !this.getBooleanVar(
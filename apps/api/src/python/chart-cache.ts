@@ -0,0 +1,108 @@
+// Python code shared by the visualization runners to cache what building a
+// chart prints. It is meant to be prepended to the code that builds the chart,
+// which then goes through _briefer_chart_cache.run, so charts of dataframes
+// that didn't change since they were built, like the ones of a dashboard
+// being reloaded, are printed without being built again.
+//
+// The cache lives in the kernel and is kept across runs, it is only replaced
+// when a newer version of it is prepended.
+export function getChartCacheCode(): string {
+  return `
+def _briefer_make_chart_cache():
+    import collections
+    import contextlib
+    import hashlib
+    import io
+    import json
+    import sys
+    import weakref
+
+    class BrieferChartCache:
+        """
+        The output of charts by dataframe and chart options, the least recently
+        used ones are dropped once the outputs add up to more than max_chars.
+
+        An output is only reused while its dataframe is the very same object
+        and no code stored in the history ran since it was built, as running
+        code is what can change a dataframe in place. Dataframes replaced by a
+        query are new objects, so they miss the cache too. Entries don't keep
+        their dataframes alive and go away with them.
+        """
+
+        version = 1
+
+        def __init__(self, max_chars):
+            self.max_chars = max_chars
+            self.chars = 0
+            self.entries = collections.OrderedDict()
+
+        def key(self, filters, render_filter_value, *options):
+            """
+            Returns the key of a chart built with options, which include its
+            filters, or None when it shouldn't be cached. Filter values are
+            templates rendered against the notebook variables, so their
+            rendered values are part of the key, and a filter that fails to
+            render is never cached.
+            """
+            with contextlib.redirect_stdout(io.StringIO()):
+                values = [render_filter_value(dict(f)) for f in filters]
+            if any(value is None for value in values):
+                return None
+
+            key = json.dumps([options, values], sort_keys=True, default=str)
+            return hashlib.sha256(key.encode()).hexdigest()
+
+        def run(self, df, key, create):
+            """Prints what create prints, which is taken from the cache when df and key didn't change."""
+            if key is None:
+                create()
+                return
+
+            try:
+                execution_count = get_ipython().execution_count
+            except NameError:
+                execution_count = None
+
+            entry_key = (id(df), key)
+            entry = self.entries.get(entry_key)
+            if entry is not None:
+                ref, entry_execution_count, output = entry
+                if ref() is df and entry_execution_count == execution_count:
+                    self.entries.move_to_end(entry_key)
+                    sys.stdout.write(output)
+                    return
+                self._remove(entry_key)
+
+            buffer = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(buffer):
+                    create()
+            finally:
+                output = buffer.getvalue()
+                sys.stdout.write(output)
+
+            if len(output) > self.max_chars:
+                return
+
+            def on_collected(ref):
+                entry = self.entries.get(entry_key)
+                if entry is not None and entry[0] is ref:
+                    self._remove(entry_key)
+
+            self.entries[entry_key] = (weakref.ref(df, on_collected), execution_count, output)
+            self.chars += len(output)
+            while self.chars > self.max_chars:
+                self._remove(next(iter(self.entries)))
+
+        def _remove(self, entry_key):
+            _, _, output = self.entries.pop(entry_key)
+            self.chars -= len(output)
+
+    # about 64MB of outputs
+    return BrieferChartCache(max_chars=64 * 1024 * 1024)
+
+if getattr(globals().get("_briefer_chart_cache"), "version", None) != 1:
+    _briefer_chart_cache = _briefer_make_chart_cache()
+del _briefer_make_chart_cache
+`
+}
@@ -0,0 +1,302 @@
+import {
+  AggregateFunction,
+  DataFrame,
+  DataFrameBooleanColumn,
+  DataFrameColumn,
+  DataFrameDateColumn,
+  DataFrameNumberColumn,
+  DataFrameStringColumn,
+  VisualizationFilter,
+} from '@briefer/types'
+import { VisualizationV2BlockInput } from '@briefer/editor'
+import { createVisualizationV2 } from './visualizations-v2'
+import { getPivotTableEngineCode } from './pivot-table'
+import { JupyterManager } from '../jupyter/manager'
+import { getVar } from '../config'
+import { getPythonRunner } from './test-utils'
+import { IJupyterManager } from '../jupyter'
+
+const amountColumn: DataFrameNumberColumn = { type: 'int', name: 'amount' }
+const priceColumn: DataFrameNumberColumn = { type: 'float', name: 'price' }
+const discountColumn: DataFrameNumberColumn = {
+  type: 'float',
+  name: 'discount',
+}
+const categoryColumn: DataFrameStringColumn = { type: 'str', name: 'category' }
+const paidColumn: DataFrameBooleanColumn = { type: 'bool', name: 'paid' }
+const createdAtColumn: DataFrameDateColumn = {
+  type: 'datetime64',
+  name: 'created_at',
+}
+
+const df: DataFrame = {
+  name: 'parity_df',
+  columns: [
+    amountColumn,
+    priceColumn,
+    discountColumn,
+    categoryColumn,
+    paidColumn,
+    createdAtColumn,
+  ],
+}
+
+const filters: VisualizationFilter[][] = [
+  [],
+  [
+    {
+      id: '6b0e4f3c-3f4e-4c6e-9a55-0d1f7f0a2a01',
+      column: amountColumn,
+      operator: 'gt',
+      value: '30',
+    },
+  ],
+  [
+    {
+      id: '6b0e4f3c-3f4e-4c6e-9a55-0d1f7f0a2a02',
+      column: categoryColumn,
+      operator: 'in',
+      value: ['category 1', 'category 3'],
+    },
+    {
+      id: '6b0e4f3c-3f4e-4c6e-9a55-0d1f7f0a2a03',
+      column: discountColumn,
+      operator: 'ne',
+      value: '2.5',
+    },
+  ],
+  [
+    {
+      id: '6b0e4f3c-3f4e-4c6e-9a55-0d1f7f0a2a04',
+      column: createdAtColumn,
+      operator: 'after',
+      value: '2024-03-01T00:00:00Z',
+    },
+  ],
+  [
+    {
+      id: '6b0e4f3c-3f4e-4c6e-9a55-0d1f7f0a2a05',
+      column: amountColumn,
+      operator: 'lte',
+      value: '{{ 10 * 2 }}',
+    },
+  ],
+]
+
+type XAxis = [DataFrameColumn, VisualizationV2BlockInput['xAxisGroupFunction']]
+
+function getInput(
+  xAxis: DataFrameColumn,
+  xAxisGroupFunction: VisualizationV2BlockInput['xAxisGroupFunction'],
+  aggregateFunction: AggregateFunction,
+  groupBy: DataFrameColumn | null,
+  filters: VisualizationFilter[]
+): VisualizationV2BlockInput {
+  return {
+    dataframeName: df.name,
+    chartType: 'line',
+    xAxis,
+    xAxisName: null,
+    xAxisSort: 'ascending',
+    xAxisGroupFunction,
+    xAxisDateFormat: null,
+    xAxisNumberFormat: null,
+    yAxes: [
+      {
+        id: 'yAxis-1',
+        name: null,
+        series: [
+          {
+            id: 'series-1',
+            chartType: null,
+            column: priceColumn,
+            aggregateFunction,
+            groupBy,
+            name: null,
+            color: null,
+            groups: null,
+            dateFormat: null,
+            numberFormat: null,
+          },
+          {
+            id: 'series-2',
+            chartType: 'groupedColumn',
+            column: discountColumn,
+            aggregateFunction,
+            groupBy: null,
+            name: null,
+            color: null,
+            groups: null,
+            dateFormat: null,
+            numberFormat: null,
+          },
+        ],
+      },
+    ],
+    histogramFormat: 'count',
+    histogramBin: { type: 'auto' },
+    filters,
+    dataLabels: {
+      show: false,
+      frequency: 'all',
+    },
+  }
+}
+
+describe('duckdb aggregation engine', () => {
+  let manager: IJupyterManager
+  let pythonRunner: Awaited<ReturnType<typeof getPythonRunner>>
+
+  beforeAll(async () => {
+    manager = new JupyterManager(
+      'http',
+      'localhost',
+      8888,
+      getVar('JUPYTER_TOKEN')
+    )
+    pythonRunner = await getPythonRunner(manager, 'workspaceId', 'sessionId')
+
+    // prices and discounts are quarters, so sums come out the same whatever
+    // order they are added in
+    await (
+      await pythonRunner.runPython(
+        'workspaceId',
+        'sessionId',
+        `import numpy as np
+import pandas as pd
+_rng = np.random.default_rng(7)
+parity_df = pd.DataFrame({
+    "amount": _rng.integers(0, 60, 20000),
+    "price": _rng.integers(0, 400, 20000) / 4,
+    "discount": np.where(_rng.random(20000) > 0.9, np.nan, _rng.integers(0, 20, 20000) / 4),
+    "category": _rng.choice([f"category {i}" for i in range(5)], 20000),
+    "paid": _rng.random(20000) > 0.5,
+    "created_at": pd.Timestamp("2024-01-01") + pd.to_timedelta(_rng.integers(0, 10**7, 20000), unit="s"),
+})
+parity_df.loc[::7, "category"] = None
+del _rng`,
+        () => {},
+        { storeHistory: false }
+      )
+    ).promise
+  })
+
+  afterAll(async () => {
+    await pythonRunner.dispose()
+    await manager.stop()
+  })
+
+  it('builds the same charts as pandas', async () => {
+    const xAxes: XAxis[] = [
+      [amountColumn, null],
+      [priceColumn, null],
+      [categoryColumn, null],
+      [paidColumn, null],
+      [createdAtColumn, null],
+      [createdAtColumn, 'week'],
+      [createdAtColumn, 'month'],
+    ]
+    const aggregateFunctions: AggregateFunction[] = [
+      'sum',
+      'mean',
+      'median',
+      'count',
+      'min',
+      'max',
+    ]
+
+    let i = 0
+    for (const [xAxis, xAxisGroupFunction] of xAxes) {
+      for (const groupBy of [null, categoryColumn, paidColumn]) {
+        for (const f of filters) {
+          const input = getInput(
+            xAxis,
+            xAxisGroupFunction,
+            aggregateFunctions[i++ % aggregateFunctions.length]!,
+            groupBy,
+            f
+          )
+          const results = []
+          for (const engine of ['pandas', 'duckdb'] as const) {
+            results.push(
+              await (
+                await createVisualizationV2(
+                  'workspaceId',
+                  'sessionId',
+                  df,
+                  input,
+                  manager,
+                  pythonRunner.runPython,
+                  engine
+                )
+              ).promise
+            )
+          }
+
+          expect(results[0]!.success).toBe(true)
+          expect(results[1]).toEqual(results[0])
+        }
+      }
+    }
+  }, 300_000)
+
+  it('builds the same pivot tables as pandas', async () => {
+    const code = `${getPivotTableEngineCode()}
+def _briefer_test_pivot_tables():
+    import itertools
+    import json
+
+    metrics = [
+        [{"name": "price", "aggregateFunction": f}, {"name": "discount", "aggregateFunction": g}]
+        for f, g in itertools.product(["sum", "mean", "median", "count", "min", "max"], repeat=2)
+    ]
+    checked = 0
+    mismatches = []
+    for rows, columns in [
+        (["category"], []),
+        (["category"], ["paid"]),
+        ([], ["paid", "category"]),
+        (["amount", "category"], ["paid"]),
+        (["created_at"], []),
+        (["paid", "created_at"], ["category"]),
+    ]:
+        for m in metrics:
+            _briefer_pivot_cache.clear()
+            expected = _briefer_pivot_table(parity_df, rows, columns, m, "pandas")
+            result = _briefer_pivot_table(parity_df, rows, columns, m, "duckdb")
+            checked += _briefer_pivot_duckdb_aggregates(parity_df, rows + columns, m) is not None
+            try:
+                pd.testing.assert_frame_equal(expected, result, check_exact=False, rtol=1e-12)
+            except AssertionError as e:
+                mismatches.append({"rows": rows, "columns": columns, "metrics": m, "error": str(e)})
+    print(json.dumps({"checked": checked, "mismatches": mismatches}))
+
+_briefer_test_pivot_tables()
+del _briefer_test_pivot_tables`
+
+    let stdout = ''
+    let error: string | null = null
+    await (
+      await pythonRunner.runPython(
+        'workspaceId',
+        'sessionId',
+        code,
+        (outputs) => {
+          for (const output of outputs) {
+            if (output.type === 'stdio' && output.name === 'stdout') {
+              stdout += output.text
+            } else if (output.type === 'error') {
+              error = `${output.ename}: ${output.evalue}`
+            }
+          }
+        },
+        { storeHistory: false }
+      )
+    ).promise
+
+    expect(error).toBeNull()
+    const result = JSON.parse(stdout)
+    expect(result.mismatches).toEqual([])
+    expect(result.checked).toBe(6 * 36)
+  }, 300_000)
+})
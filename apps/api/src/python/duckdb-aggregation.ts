@@ -0,0 +1,207 @@
+// Python code shared by pivot tables and charts to have DuckDB filter, group
+// and aggregate dataframes instead of pandas. DuckDB scans the dataframe in
+// place, with as many threads as there are cores, and only the aggregates
+// come back to pandas.
+//
+// Every helper here gives up, returning None, when DuckDB wouldn't come up
+// with the very same result pandas does, so callers fall back to pandas for
+// columns of other types, filters and aggregates it doesn't translate, or
+// when duckdb is not installed in the kernel.
+export function getDuckDBAggregationCode(): string {
+  return `
+def _briefer_duckdb_supported(column):
+    """
+    Whether DuckDB reads the values of a column as pandas has them, which is
+    the case for numpy booleans, numbers and timezone naive datetimes, and
+    for objects that are all strings.
+    """
+    import numpy as np
+    import pandas as pd
+
+    dtype = column.dtype
+    if not isinstance(dtype, np.dtype):
+        return False
+    if dtype.kind in "biuf":
+        return dtype.kind != "f" or dtype.itemsize == 8
+    if dtype.kind == "M":
+        return True
+    if dtype.kind == "O":
+        return pd.api.types.infer_dtype(column, skipna=True) == "string"
+    return False
+
+
+def _briefer_duckdb_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _briefer_duckdb_aggregate(column, func):
+    """
+    The SQL aggregating a supported column like groupby does with func and
+    the dtype pandas gives it, or None when they wouldn't agree. The SQL has
+    a {} where the column goes.
+    """
+    import numpy as np
+
+    kind = column.dtype.kind
+    if func == "count":
+        return "count({})", np.dtype("int64")
+    if func == "sum":
+        # sums of groups that are all null are 0 for pandas
+        if kind in "bi":
+            return "coalesce(sum({}::BIGINT), 0)::BIGINT", np.dtype("int64")
+        if kind == "u":
+            return "coalesce(sum({}), 0)::UBIGINT", np.dtype("uint64")
+        if kind == "f":
+            return "coalesce(fsum({}), 0)", np.dtype("float64")
+    elif func == "mean":
+        if kind in "iuf":
+            return "fsum({}::DOUBLE) / count({})", np.dtype("float64")
+    elif func == "median":
+        if kind in "iuf":
+            return "median({}::DOUBLE)", np.dtype("float64")
+    elif func in ("min", "max"):
+        if kind in "biufM":
+            return func + "({})", column.dtype
+    return None
+
+
+def _briefer_duckdb_filter(df, column_name, operator, value):
+    """
+    The SQL condition and parameters of a chart filter, which keeps the rows
+    the filters of charts keep with pandas, or None when it can't be written
+    in SQL. Operators charts don't know about keep every row.
+    """
+    import numpy as np
+    import pandas as pd
+
+    column = df[column_name]
+    if not _briefer_duckdb_supported(column):
+        return None
+
+    c = _briefer_duckdb_identifier(column_name)
+    if operator == "isNull":
+        return f"{c} IS NULL", []
+    if operator == "isNotNull":
+        return f"{c} IS NOT NULL", []
+
+    comparisons = {
+        "eq": "=",
+        "lt": "<",
+        "lte": "<=",
+        "gt": ">",
+        "gte": ">=",
+        "before": "<",
+        "beforeOrEq": "<=",
+        "after": ">",
+        "afterOrEq": ">=",
+    }
+    kind = column.dtype.kind
+    if kind in "iuf":
+        if operator not in ("eq", "ne", "lt", "lte", "gt", "gte"):
+            return "TRUE", []
+        value = pd.to_numeric(value, errors="coerce")
+        if not np.isscalar(value) or pd.isna(value):
+            return None
+        if isinstance(value, np.generic):
+            value = value.item()
+    elif kind == "O":
+        if operator in ("in", "notIn"):
+            if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+                return None
+            if not value:
+                return ("FALSE", []) if operator == "in" else ("TRUE", [])
+            values = ", ".join("?" for _ in value)
+            if operator == "in":
+                return f"{c} IN ({values})", value
+            return f"({c} NOT IN ({values}) OR {c} IS NULL)", value
+
+        if not isinstance(value, str):
+            return None
+        if operator in ("startsWith", "endsWith"):
+            # pandas can't filter by the nulls of these
+            if column.hasnans:
+                return None
+            return ("prefix" if operator == "startsWith" else "suffix") + f"({c}, ?)", [value]
+        if operator not in ("eq", "ne"):
+            # contains takes a python regular expression
+            return None if operator in ("contains", "notContains") else ("TRUE", [])
+    elif kind == "M":
+        if operator not in ("eq", "ne", "before", "beforeOrEq", "after", "afterOrEq"):
+            return "TRUE", []
+        if not isinstance(value, str):
+            return None
+        try:
+            value = pd.to_datetime(value)
+        except Exception:
+            return None
+        if pd.isna(value) or value.nanosecond:
+            return None
+        # charts compare datetimes in UTC, and columns without a timezone are in UTC
+        if value.tzinfo is not None:
+            value = value.tz_convert("UTC").tz_localize(None)
+        value = value.to_pydatetime()
+    else:
+        return None
+
+    if operator == "ne":
+        return f"({c} <> ? OR {c} IS NULL)", [value]
+    return f"{c} {comparisons[operator]} ?", [value]
+
+
+def _briefer_duckdb_query(df, query, dtypes):
+    """
+    Runs a query that reads df as _briefer_df and returns its result with the
+    dtypes given, or None when duckdb is not installed or fails to run it.
+    query is the SQL and its parameters.
+    """
+    try:
+        import duckdb
+    except ImportError:
+        return None
+
+    sql, params = query
+    con = duckdb.connect()
+    try:
+        con.register("_briefer_df", df)
+        result = con.execute(sql, params).df()
+    except duckdb.Error:
+        return None
+    finally:
+        con.close()
+
+    return [result.iloc[:, i].astype(dtype, copy=False) for i, dtype in enumerate(dtypes)]
+
+
+def _briefer_duckdb_group_by(df, keys, aggregates, where=("TRUE", [])):
+    """
+    Groups df like groupby(sort=True, dropna=True) does and aggregates the
+    groups, returning the keys and the aggregates of each group as Series,
+    or None when DuckDB can't. keys are the SQL and the dtype of each key
+    and aggregates the column and the function of each aggregate.
+    """
+    if not df.columns.is_unique or not all(isinstance(c, str) for c in df.columns):
+        return None
+
+    aggregates_sql = []
+    dtypes = [dtype for _, dtype in keys]
+    for column_name, func in aggregates:
+        column = df[column_name]
+        aggregate = _briefer_duckdb_supported(column) and _briefer_duckdb_aggregate(column, func)
+        if not aggregate:
+            return None
+        template, dtype = aggregate
+        aggregates_sql.append(template.replace("{}", _briefer_duckdb_identifier(column_name)))
+        dtypes.append(dtype)
+
+    keys_sql = [sql for sql, _ in keys]
+    group_by = ", ".join(str(i + 1) for i in range(len(keys)))
+    sql = f"""
+SELECT {", ".join(keys_sql + aggregates_sql)}
+FROM _briefer_df
+WHERE ({where[0]}) AND {" AND ".join(f"({k}) IS NOT NULL" for k in keys_sql)}
+GROUP BY {group_by}
+ORDER BY {group_by}
+"""
+    return _briefer_duckdb_query(df, (sql, where[1]), dtypes)
+`
+}
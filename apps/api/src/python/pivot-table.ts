@@ -19,6 +19,367 @@ import {
 import { z } from 'zod'
 import AggregateError from 'aggregate-error'
 import { logger } from '../logger.js'
+import { AggregationEngine } from '../config/base.js'
+import { getDuckDBAggregationCode } from './duckdb-aggregation.js'
+
+// Python code building pivot tables like DataFrame.pivot_table does, out of
+// groups and aggregates kept in the kernel across runs, so pivots of the same
+// dataframe that vary in their metrics or keys, and the pages of a pivot,
+// reuse what was computed for the previous ones. It is meant to be prepended
+// to the code that builds the pivot with _briefer_pivot_table.
+export function getPivotTableEngineCode(): string {
+  return `${getDuckDBAggregationCode()}
+
+def _briefer_make_pivot_cache():
+    import collections
+    import weakref
+
+    class BrieferPivotCache:
+        """
+        What building pivot tables computed out of dataframes, so building
+        another pivot of the same dataframe or reading another page of a pivot
+        reuses it. Dataframes get factorized once per column and grouped once
+        per set of keys, metrics get aggregated once per function and the
+        sorts of pivots are kept as the order of their rows. The least
+        recently used values are dropped once they take more than max_bytes.
+
+        Values are kept while the objects they were computed from are alive
+        and only pivot tables, which run stored in the history, ran since, as
+        any other code stored in the history can change them in place.
+        """
+
+        version = 1
+
+        def __init__(self, max_bytes):
+            self.max_bytes = max_bytes
+            self.bytes = 0
+            self.entries = collections.OrderedDict()
+            self.execution_count = None
+
+        def check_history(self):
+            """Drops everything when code other than a pivot table ran since the last one."""
+            try:
+                execution_count = get_ipython().execution_count
+            except NameError:
+                execution_count = None
+
+            if execution_count is None or self.execution_count is None or execution_count != self.execution_count + 1:
+                self.clear()
+            self.execution_count = execution_count
+
+        def get(self, obj, key):
+            entry_key = (id(obj), key)
+            entry = self.entries.get(entry_key)
+            if entry is None or entry[0]() is not obj:
+                return None
+
+            self.entries.move_to_end(entry_key)
+            return entry[1]
+
+        def set(self, obj, key, value, nbytes):
+            entry_key = (id(obj), key)
+            if entry_key in self.entries:
+                self._remove(entry_key)
+            if nbytes > self.max_bytes:
+                return value
+
+            def on_collected(ref):
+                entry = self.entries.get(entry_key)
+                if entry is not None and entry[0] is ref:
+                    self._remove(entry_key)
+
+            self.entries[entry_key] = (weakref.ref(obj, on_collected), value, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+            return value
+
+        def clear(self):
+            self.entries.clear()
+            self.bytes = 0
+
+        def _remove(self, entry_key):
+            _, _, nbytes = self.entries.pop(entry_key)
+            self.bytes -= nbytes
+
+    return BrieferPivotCache(max_bytes=256 * 1024 * 1024)
+
+if getattr(globals().get("_briefer_pivot_cache"), "version", None) != 1:
+    _briefer_pivot_cache = _briefer_make_pivot_cache()
+del _briefer_make_pivot_cache
+
+
+def _briefer_pivot_factorize(df, column):
+    """The codes and sorted uniques of a column, like groupby factorizes it."""
+    import numpy as np
+    import pandas as pd
+
+    key = ("factorized", column)
+    factorized = _briefer_pivot_cache.get(df, key)
+    if factorized is None:
+        codes, uniques = pd.factorize(df[column], sort=True)
+        if len(uniques) < 2**31:
+            codes = codes.astype(np.int32)
+        factorized = _briefer_pivot_cache.set(
+            df, key, (codes, uniques), codes.nbytes + uniques.memory_usage(deep=True)
+        )
+    return factorized
+
+
+def _briefer_pivot_groups(df, keys):
+    """
+    The groups of df.groupby(keys, sort=True, dropna=True): the positions of
+    the rows in a group, None when all of them are, the group of each of
+    those rows and the index of the groups.
+    """
+    import numpy as np
+    import pandas as pd
+
+    key = ("groups", tuple(keys))
+    groups = _briefer_pivot_cache.get(df, key)
+    if groups is not None:
+        return groups
+
+    factorized = [_briefer_pivot_factorize(df, k) for k in keys]
+    valid = np.logical_and.reduce([codes >= 0 for codes, _ in factorized])
+    rows = None if valid.all() else np.flatnonzero(valid)
+    codes = [c if rows is None else c[rows] for c, _ in factorized]
+
+    # the combination of the codes of every key, which sorts like the keys do
+    ids = codes[0].astype(np.int64)
+    size = len(factorized[0][1])
+    for c, (_, uniques) in zip(codes[1:], factorized[1:]):
+        if size * len(uniques) >= 2**62:
+            ids, observed = pd.factorize(ids, sort=True)
+            size = len(observed)
+        ids = ids * len(uniques) + c
+        size *= len(uniques)
+
+    if size <= 4 * len(ids):
+        present = np.bincount(ids, minlength=size) > 0
+        ids = (np.cumsum(present) - 1)[ids]
+        count = int(present.sum())
+    else:
+        ids, observed = pd.factorize(ids, sort=True)
+        count = len(observed)
+    if count < 2**31:
+        ids = ids.astype(np.int32)
+
+    # any row of a group has the codes of its keys
+    first = np.empty(count, dtype=np.intp)
+    first[ids] = np.arange(len(ids))
+    if len(keys) == 1:
+        index = factorized[0][1].take(codes[0][first]).rename(keys[0])
+    else:
+        index = pd.MultiIndex(
+            levels=[uniques for _, uniques in factorized],
+            codes=[c[first] for c in codes],
+            names=keys,
+            verify_integrity=False,
+        )
+
+    nbytes = ids.nbytes + (rows.nbytes if rows is not None else 0) + index.memory_usage()
+    return _briefer_pivot_cache.set(df, key, (rows, ids, index), nbytes)
+
+
+def _briefer_pivot_aggregates(df, keys, metrics):
+    """
+    The aggregate of each metric by the groups of keys, like groupby
+    aggregates them. Those not in the cache are aggregated together, out of
+    a single groupby.
+    """
+    import numpy as np
+
+    def stats(metric):
+        column, func = metric["name"], metric["aggregateFunction"]
+        dtype = df[column].dtype
+        if func == "mean" and isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+            # a sum over a count, which metrics of other functions may have already aggregated
+            return [(column, "sum"), (column, "count")]
+        return [(column, func)]
+
+    results = {}
+    missing = []
+    for stat in dict.fromkeys(stat for m in metrics for stat in stats(m)):
+        result = _briefer_pivot_cache.get(df, ("aggregate", tuple(keys), *stat))
+        if result is None:
+            missing.append(stat)
+        else:
+            results[stat] = result
+
+    if missing:
+        rows, ids, index = _briefer_pivot_groups(df, keys)
+        frame = df[list(dict.fromkeys(column for column, _ in missing))]
+        if rows is not None:
+            frame = frame.iloc[rows]
+        grouped = frame.groupby(ids, sort=True)
+        for column, func in missing:
+            result = grouped[column].agg(func).set_axis(index)
+            results[(column, func)] = _briefer_pivot_cache.set(
+                df, ("aggregate", tuple(keys), column, func), result, result.memory_usage(index=False)
+            )
+
+    aggregates = []
+    for m in metrics:
+        stat = stats(m)
+        if len(stat) == 2:
+            aggregates.append(results[stat[0]] / results[stat[1]])
+        else:
+            aggregates.append(results[stat[0]])
+    return aggregates
+
+
+def _briefer_pivot_duckdb_aggregates(df, keys, metrics):
+    """
+    The index of the groups of keys and the aggregate of each metric by them,
+    aggregated by DuckDB, or None when it can't. Like the ones of pandas,
+    aggregates are kept in the cache and those not in it are aggregated
+    together, out of a single query.
+    """
+    import pandas as pd
+
+    if not all(_briefer_duckdb_supported(df[k]) for k in keys):
+        return None
+
+    results = {}
+    missing = []
+    for stat in dict.fromkeys((m["name"], m["aggregateFunction"]) for m in metrics):
+        result = _briefer_pivot_cache.get(df, ("duckdb aggregate", tuple(keys), *stat))
+        if result is None:
+            missing.append(stat)
+        else:
+            results[stat] = result
+
+    index = _briefer_pivot_cache.get(df, ("duckdb index", tuple(keys)))
+    if missing or index is None:
+        grouped = _briefer_duckdb_group_by(
+            df,
+            [(_briefer_duckdb_identifier(k), df[k].dtype) for k in keys],
+            missing
+        )
+        # pandas keeps the types of the keys of pivots without groups
+        if grouped is None or len(grouped[0]) == 0:
+            return None
+
+        if len(keys) == 1:
+            index = pd.Index(grouped[0], name=keys[0])
+        elif not any(df[k].hasnans for k in keys):
+            index = pd.MultiIndex.from_arrays(grouped[:len(keys)], names=keys)
+        else:
+            # like the index of groupby, which unstack orders rows by, the
+            # levels have every value of the keys, even those that are only
+            # in rows with a null key, which belong to no group
+            levels = []
+            for k in keys:
+                c = _briefer_duckdb_identifier(k)
+                uniques = _briefer_duckdb_query(
+                    df,
+                    (f"SELECT DISTINCT {c} FROM _briefer_df WHERE {c} IS NOT NULL ORDER BY 1", []),
+                    [df[k].dtype]
+                )
+                if uniques is None:
+                    return None
+                levels.append(pd.Index(uniques[0], name=k))
+            index = pd.MultiIndex(
+                levels=levels,
+                codes=[level.get_indexer(values) for level, values in zip(levels, grouped)],
+                names=keys,
+                verify_integrity=False,
+            )
+        index = _briefer_pivot_cache.set(df, ("duckdb index", tuple(keys)), index, index.memory_usage())
+        for stat, result in zip(missing, grouped[len(keys):]):
+            results[stat] = _briefer_pivot_cache.set(
+                df, ("duckdb aggregate", tuple(keys), *stat), result.set_axis(index), result.memory_usage(index=False)
+            )
+
+    return index, [results[(m["name"], m["aggregateFunction"])] for m in metrics]
+
+
+def _briefer_pivot_table(df, rows, columns, metrics, engine="pandas"):
+    """
+    The same as df.pivot_table with the rows, columns and metrics given, built
+    out of the groups and the aggregates kept in the cache, so pivots of a
+    dataframe that vary in their metrics or move their keys between rows and
+    columns don't group the dataframe again.
+
+    With the duckdb engine, DuckDB groups and aggregates the dataframe
+    instead, unless it can't do it like pandas.
+    """
+    import pandas as pd
+
+    keys = rows + columns
+    names = [m["name"] for m in metrics]
+    cacheable = (
+        len(keys) > 0
+        and df.columns.is_unique
+        and len(set(keys)) == len(keys)
+        and len(set(names)) == len(names)
+        and not set(keys) & set(names)
+        and all(k in df.columns and not isinstance(df[k].dtype, pd.CategoricalDtype) for k in keys)
+    )
+    if not cacheable:
+        return df.pivot_table(
+            index=rows,
+            columns=columns,
+            values=names,
+            aggfunc={m["name"]: m["aggregateFunction"] for m in metrics}
+        )
+
+    aggregates = None
+    if engine == "duckdb":
+        aggregates = _briefer_pivot_duckdb_aggregates(df, keys, metrics)
+    if aggregates is None:
+        _, _, index = _briefer_pivot_groups(df, keys)
+        aggregates = index, _briefer_pivot_aggregates(df, keys, metrics)
+    index, aggregates = aggregates
+    agged = pd.DataFrame(dict(zip(names, aggregates)), index=index)
+
+    # what pivot_table does with the aggregates of its groups
+    if len(agged.columns):
+        agged = agged.dropna(how="all")
+    table = agged
+    if table.index.nlevels > 1 and rows:
+        table = agged.unstack(columns)
+    table = table.sort_index(axis=1)
+    if not rows and columns:
+        table = table.T
+    return table.dropna(how="all", axis=1)
+
+
+def _briefer_pivot_table_order(pivot_table, sort):
+    """The positions of the rows of pivot_table in the order of sort, which is kept in the cache."""
+    import json
+    import numpy as np
+    import pandas as pd
+
+    key = ("order", json.dumps(sort, sort_keys=True, default=str))
+    order = _briefer_pivot_cache.get(pivot_table, key)
+    if order is not None:
+        return order
+
+    if sort["_tag"] == "row":
+        positions = pd.Series(np.arange(len(pivot_table)), index=pivot_table.index)
+        order = positions.sort_index(level=sort["row"], ascending=sort["order"] == "asc").to_numpy()
+    elif sort["_tag"] == "column":
+        if len(sort["columnValues"]) == 1:
+            by = sort["columnValues"][0]
+        else:
+            by = ()
+            for cv in sort["columnValues"]:
+                by += (cv,)
+
+        # pages show missing values as 0, so they are sorted as 0 too
+        ordered = pivot_table[sort["metric"]].replace([np.nan], 0).sort_values(
+            by=by,
+            ascending=sort["order"] == "asc"
+        )
+        order = pivot_table.index.get_indexer(ordered.index)
+    else:
+        return None
+
+    return _briefer_pivot_cache.set(pivot_table, key, order, order.nbytes)
+`
+}
 
 function getCode(
   dataframe: DataFrame,
@@ -28,7 +389,8 @@ function getCode(
   sort: PivotTableSort | null,
   varName: string,
   page: number,
-  operation: 'create' | 'read'
+  operation: 'create' | 'read',
+  engine: AggregationEngine
 ): string {
   const rowNames = rows
     .map((r) => r.column?.name?.toString())
@@ -57,6 +419,8 @@ function getCode(
   const code = `
 import json
 
+${getPivotTableEngineCode()}
+
 def _briefer_print_pivot_table_page(pivot_table, rows, columns, metrics, sort, page=1, page_size=50):
     import numpy as np
 
@@ -66,33 +430,20 @@ def _briefer_print_pivot_table_page(pivot_table, rows, columns, metrics, sort, p
     elif page < 1:
         page = 1
 
-    pivot_table = pivot_table.replace([np.nan], 0)
-
+    order = None
     if sort:
         try:
-            if sort["_tag"] == "row":
-                pivot_table = pivot_table.sort_index(level=sort["row"], ascending=sort["order"] == "asc")
-            elif sort["_tag"] == "column":
-                if len(sort["columnValues"]) == 1:
-                    by = sort["columnValues"][0]
-                else:
-                    by = ()
-                    for cv in sort["columnValues"]:
-                        by += (cv,)
-
-                pivot_table = pivot_table.reindex(
-                    pivot_table[sort["metric"]].sort_values(
-                        by=by,
-                        ascending=sort["order"] == "asc"
-                    ).index
-                )
-
+            order = _briefer_pivot_table_order(pivot_table, sort)
         except Exception as e:
             print(json.dumps({"log": "Failed to sort pivot table", "error": str(e)}, default=str))
             pass
 
-
-    table = pivot_table.iloc[page_size * (page - 1): page_size * page]
+    # only the rows of the page are taken out of the pivot
+    if order is None:
+        table = pivot_table.iloc[page_size * (page - 1): page_size * page]
+    else:
+        table = pivot_table.iloc[order[page_size * (page - 1): page_size * page]]
+    table = table.replace([np.nan], 0)
 
     result = {
       "page": page,
@@ -107,17 +458,8 @@ def _briefer_print_pivot_table_page(pivot_table, rows, columns, metrics, sort, p
     print(json.dumps({"success": True, "result": result}, default=str, allow_nan=False))
 
 
-def _briefer_create_pivot_table(df, rows, columns, metrics, sort, page=1, page_size=50):
-    aggfunc = {}
-    for m in metrics:
-        aggfunc[m["name"]] = m["aggregateFunction"]
-
-    pivot_table = df.pivot_table(
-        index=rows,
-        columns=columns,
-        values=[m["name"] for m in metrics],
-        aggfunc=aggfunc
-    )
+def _briefer_create_pivot_table(df, rows, columns, metrics, sort, page=1, page_size=50, engine="pandas"):
+    pivot_table = _briefer_pivot_table(df, rows, columns, metrics, engine)
 
     _briefer_print_pivot_table_page(pivot_table, rows, columns, metrics, sort, page, page_size)
 
@@ -125,6 +467,8 @@ def _briefer_create_pivot_table(df, rows, columns, metrics, sort, page=1, page_s
 
 
 def _briefer_pivot_table_run():
+    _briefer_pivot_cache.check_history()
+
     if "${dataframe.name}" in globals():
         df = globals()["${dataframe.name}"]
         rows = json.loads(${JSON.stringify(JSON.stringify(rowNames))})
@@ -134,6 +478,7 @@ def _briefer_pivot_table_run():
         page = ${page}
         page_size = ${pageSize}
         operation = "${operation}"
+        engine = "${engine}"
 
         if operation == "read":
             if "${varName}" in globals():
@@ -154,7 +499,8 @@ def _briefer_pivot_table_run():
                     metrics=metrics,
                     sort=sort,
                     page=page,
-                    page_size=page_size
+                    page_size=page_size,
+                    engine=engine
                 )
 
         else:
@@ -165,7 +511,8 @@ def _briefer_pivot_table_run():
                 metrics=metrics,
                 sort=sort,
                 page=1,
-                page_size=page_size
+                page_size=page_size,
+                engine=engine
             )
     else:
         print(json.dumps({"success": False, "reason": "dataframe-not-found"}))
@@ -203,7 +550,8 @@ export async function createPivotTable(
   sort: PivotTableSort | null,
   varName: string,
   page: number,
-  operation: 'create' | 'read'
+  operation: 'create' | 'read',
+  engine: AggregationEngine = 'pandas'
 ): Promise<CreatePivotTableResult> {
   const code = getCode(
     dataframe,
@@ -213,7 +561,8 @@ export async function createPivotTable(
     sort,
     varName,
     page,
-    operation
+    operation,
+    engine
   )
 
   let outputs: Output[] = []
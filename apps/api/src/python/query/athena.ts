@@ -7,6 +7,9 @@ import {
 } from '@briefer/types'
 import { getDatabaseURL } from '@briefer/database'
 import { makeQuery } from './index.js'
+import { getQueryDumpWriterCode } from './dump.js'
+import { getCategoriesCollectorCode } from './categories.js'
+import { getPageSerializerCode } from './page.js'
 import { renderJinja } from '../index.js'
 
 export async function makeAthenaQuery(
@@ -75,7 +78,7 @@ export async function makeAthenaQuery(
     )
   }
 
-  const code = `
+  const code = `${getQueryDumpWriterCode()}${getCategoriesCollectorCode()}${getPageSerializerCode()}
 def briefer_make_athena_query():
     import boto3
     import botocore
@@ -93,26 +96,7 @@ def briefer_make_athena_query():
     actual_page_size = max(page_size, dashboard_page_size)
 
     def get_columns_result(columns):
-        json_columns = []
-
-        for col in columns:
-            categories = []
-            if col["np_type"] == "object":
-                try:
-                    categories = df[col["name"]].dropna().unique()
-
-                    # use dict.fromkeys instead of set to keep the order
-                    categories = list(dict.fromkeys(categories))
-
-                    categories = categories[:1000]
-                    json_columns.append({"name": col["name"], "type": col["np_type"], "categories": categories})
-                except Exception as e:
-                    print(json.dumps({"type": "log", "message": f"Error getting categories for column {col}: {e}"}))
-                    json_columns.append({"name": col["name"], "type": col["np_type"]})
-            else:
-                json_columns.append({"name": col["name"], "type": col["np_type"]})
-
-        return json_columns
+        return [{"name": col["name"], "type": col["np_type"]} for col in columns]
 
 
     def convert_type(t):
@@ -201,7 +185,7 @@ def briefer_make_athena_query():
     try:
         s3_staging_dir = "${s3StagingDir}"
         dump_file_base = f'/home/jupyteruser/.briefer/query-${queryId}'
-        parquet_file_path = f'{dump_file_base}.parquet.gzip'
+        parquet_file_path = f'{dump_file_base}.parquet'
         csv_file_path = f'{dump_file_base}.csv'
         flag_file_path = ${JSON.stringify(flagFilePath)}
         os.makedirs('/home/jupyteruser/.briefer', exist_ok=True)
@@ -296,15 +280,16 @@ def briefer_make_athena_query():
 
         df, columns = to_pandas(data)
 
-        rows = json.loads(df.head(actual_page_size).to_json(orient='records', date_format="iso"))
+        # convert all values to string to make sure we preserve the python values
+        # when displaying this data in the browser
+        page_rows = {"rows": _briefer_stringify_rows(df.head(page_size)).to_json(orient="records")}
 
         result = {
             "version": 3,
 
             "type": "success",
-            "rows": rows[:page_size],
             "count": len(df),
-            "columns": get_columns_result(columns),
+            "columns": _briefer_update_categories(get_columns_result(columns), df, {}),
 
             "page": 0,
             "pageSize": page_size,
@@ -314,7 +299,7 @@ def briefer_make_athena_query():
             "dashboardPageSize": dashboard_page_size,
             "dashboardPageCount": int(len(df) // dashboard_page_size + 1),
         }
-        print(json.dumps(result, ensure_ascii=False, default=str))
+        print(_briefer_json_dumps(result, page_rows, ensure_ascii=False, default=str))
 
         s3 = boto3.client(
             "s3",
@@ -352,7 +337,7 @@ def briefer_make_athena_query():
                 now = time.time()
                 if now - last_emitted_at > 1:
                     last_emitted_at = now
-                    print(json.dumps(result, ensure_ascii=False, default=str))
+                    print(_briefer_json_dumps(result, page_rows, ensure_ascii=False, default=str))
               
             s3.download_file(
               Bucket=s3_bucket,
@@ -379,8 +364,37 @@ def briefer_make_athena_query():
                 else:
                     dtype_dict[col_name] = convert_type(col_type)
 
-            df = pd.read_csv(f"{tmpdir}/{query_id}.csv", dtype=dtype_dict, parse_dates=parse_dates_list)
-            if not os.path.exists(flag_file_path):
+            count = 0
+            page_rows = None
+            json_columns = get_columns_result(columns)
+            categories = {}
+            aborted = False
+            dump = _BrieferQueryDumpWriter(parquet_file_path, csv_file_path, in_kernel=True)
+            try:
+                chunks = pd.read_csv(f"{tmpdir}/{query_id}.csv", dtype=dtype_dict, parse_dates=parse_dates_list, chunksize=100000)
+                for chunk in chunks:
+                    if not os.path.exists(flag_file_path):
+                        aborted = True
+                        break
+
+                    count += len(chunk)
+                    dump.write(chunk)
+                    if page_rows is None:
+                        rows = _briefer_stringify_rows(chunk.head(actual_page_size))
+                        page_rows = {
+                            "rows": rows.head(page_size).to_json(orient="records"),
+                            "dashboardRows": rows.head(dashboard_page_size).to_json(orient="records"),
+                        }
+
+                    _briefer_update_categories(json_columns, chunk, categories)
+            except BaseException:
+                dump.discard()
+                raise
+
+            # an aborted query still leaves the rows fetched so far on disk
+            dump.close()
+            if aborted:
+                dump.discard()
                 result = {
                     "type": "abort-error",
                     "message": "Query aborted",
@@ -388,31 +402,25 @@ def briefer_make_athena_query():
                 print(json.dumps(result, ensure_ascii=False, default=str))
                 return
 
-            rows = json.loads(df.head(actual_page_size).to_json(orient='records', date_format="iso"))
+            page_rows = page_rows or {"rows": "[]", "dashboardRows": "[]"}
             result = {
                 "version": 3,
 
                 "type": "success",
-                "columns": get_columns_result(columns),
-                "rows": rows[:page_size],
-                "count": len(df),
+                "columns": json_columns,
+                "count": count,
 
                 "page": 0,
                 "pageSize": page_size,
-                "pageCount": int(len(df) // page_size + 1),
+                "pageCount": int(count // page_size + 1),
 
                 "dashboardPage": 0,
                 "dashboardPageSize": dashboard_page_size,
-                "dashboardPageCount": int(len(df) // dashboard_page_size + 1),
-                "dashboardRows": rows[:dashboard_page_size],
+                "dashboardPageCount": int(count // dashboard_page_size + 1),
 
                 "queryDurationMs": query_status.get("QueryExecution", {}).get("Statistics", {}).get("TotalExecutionTimeInMillis", None),
             }
-            print(json.dumps(result, ensure_ascii=False, default=str))
-
-            os.makedirs('/home/jupyteruser/.briefer', exist_ok=True)
-            df.to_parquet(parquet_file_path, compression='gzip', index=False)
-            df.to_csv(csv_file_path, index=False)
+            print(_briefer_json_dumps(result, page_rows, ensure_ascii=False, default=str))
     except botocore.exceptions.ClientError as e:
         result = {
             "type": "syntax-error",
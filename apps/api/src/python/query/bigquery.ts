@@ -2,6 +2,9 @@ import { v4 as uuidv4 } from 'uuid'
 import { BigQueryDataSource, getCredentials } from '@briefer/database'
 import { RunQueryResult, SuccessRunQueryResult } from '@briefer/types'
 import { makeQuery } from './index.js'
+import { getQueryDumpWriterCode } from './dump.js'
+import { getCategoriesCollectorCode } from './categories.js'
+import { getPageSerializerCode } from './page.js'
 import { renderJinja } from '../index.js'
 import { getSQLAlchemySchema, pingSQLAlchemy } from './sqlalchemy.js'
 import { OnTable } from '../../datasources/structure.js'
@@ -35,7 +38,7 @@ export async function makeBigQueryQuery(
 
   const query = renderedQuery
 
-  const code = `
+  const code = `${getQueryDumpWriterCode()}${getCategoriesCollectorCode()}${getPageSerializerCode()}
 def _briefer_make_bq_query():
     from google.cloud import bigquery
     from google.cloud import bigquery_storage
@@ -50,28 +53,6 @@ def _briefer_make_bq_query():
     import threading
     import queue
 
-    def get_columns(df):
-        columns = []
-        for col, dtype in df.dtypes.items():
-            if pd.api.types.is_string_dtype(dtype) or pd.api.types.is_categorical_dtype(dtype):
-                try:
-                    categories = list(df[col].dropna().unique())
-
-                    # use dict.fromkeys instead of set to keep the order
-                    categories = list(dict.fromkeys(categories))
-
-                    categories = categories[:1000]
-                    columns.append({"name": col, "type": dtype.name, "categories": categories})
-                except Exception as e:
-                    print(json.dumps({"type": "log", "message": f"Error getting categories for column {col}: {e}"}))
-                    columns.append({"name": col, "type": dtype.name})
-            else:
-                columns.append({"name": col, "type": dtype.name})
-
-        return columns
-
-
-
     print(json.dumps({"type": "log", "message": "Starting BQ query"}))
 
     def get_query_schema(sql, client):
@@ -96,7 +77,7 @@ def _briefer_make_bq_query():
 
     aborted = False
     dump_file_base = f'/home/jupyteruser/.briefer/query-${queryId}'
-    parquet_file_path = f'{dump_file_base}.parquet.gzip'
+    parquet_file_path = f'{dump_file_base}.parquet'
     csv_file_path = f'{dump_file_base}.csv'
 
 
@@ -168,70 +149,80 @@ def _briefer_make_bq_query():
             }
             df = query_result.to_dataframe()
             convert_columns(df, columns_by_type)
-            df.to_parquet(parquet_file_path, compression='gzip', index=False, engine="fastparquet")
-            df.to_csv(csv_file_path, index=False)
+            dump = _BrieferQueryDumpWriter(parquet_file_path, csv_file_path, in_kernel=True)
+            dump.write(df)
+            dump.close()
             print(json.dumps(result, default=str))
             return df
 
         bq_storage_client = bigquery_storage.BigQueryReadClient(credentials=credentials)
         df_iter = query_result.to_dataframe_iterable(bqstorage_client=bq_storage_client)
-        df = pd.DataFrame()
 
-        initial_rows = []
+        initial_rows = None
+        page_rows = {"rows": "[]", "dashboardRows": "[]"}
         columns = None
+        categories = {}
         last_emitted_at = 0
-        chunks = []
         rows_count = 0
-        for chunk in df_iter:
-            if not os.path.exists(flag_file_path):
-                print(json.dumps({"type": "log", "message": "Query aborted"}))
-                aborted = True
-                break
-
-            chunk = rename_duplicates(chunk)
-            rows_count += len(chunk)
-            chunks.append(chunk)
-
-            if len(initial_rows) < actual_page_size:
-                df = pd.concat(chunks, ignore_index=True)
-                convert_columns(df, columns_by_type)
-                initial_rows = json.loads(df.head(actual_page_size).to_json(orient='records', date_format="iso"))
-
-                # convert all values to string to make sure we preserve the python values
-                # when displaying this data in the browser
-                for row in initial_rows:
-                    for key in row:
-                        row[key] = str(row[key])
+        dump = _BrieferQueryDumpWriter(parquet_file_path, csv_file_path, in_kernel=True)
+        try:
+            for chunk in df_iter:
+                if not os.path.exists(flag_file_path):
+                    print(json.dumps({"type": "log", "message": "Query aborted"}))
+                    aborted = True
+                    break
+
+                chunk = rename_duplicates(chunk)
+                convert_columns(chunk, columns_by_type)
+                rows_count += len(chunk)
+                dump.write(chunk)
+
+                missing_rows = actual_page_size - (0 if initial_rows is None else len(initial_rows))
+                if missing_rows > 0:
+                    # convert all values to string to make sure we preserve the python values
+                    # when displaying this data in the browser
+                    chunk_rows = _briefer_stringify_rows(chunk.head(missing_rows))
+                    initial_rows = chunk_rows if initial_rows is None else pd.concat([initial_rows, chunk_rows])
+                    page_rows = {
+                        "rows": initial_rows.head(page_size).to_json(orient="records"),
+                        "dashboardRows": initial_rows.head(dashboard_page_size).to_json(orient="records"),
+                    }
 
                 if columns is None:
-                    columns = get_columns(df)
-
-            now = time.time()
-            if now - last_emitted_at > 1:
-                result = {
-                    "version": 3,
-
-                    "type": "success",
-                    "columns": columns,
-                    "rows": initial_rows[:page_size],
-                    "count": rows_count,
-
-                    "page": 0,
-                    "pageSize": page_size,
-                    "pageCount": int(rows_count // page_size + 1),
-
-                    "dashboardPage": 0,
-                    "dashboardPageSize": dashboard_page_size,
-                    "dashboardPageCount": int(rows_count // dashboard_page_size + 1),
-                    "dashboardRows": initial_rows[:dashboard_page_size],
-                }
-                print(json.dumps({"type": "log", "message": f"Emitting {rows_count} rows"}))
-                print(json.dumps(result, default=str))
-                last_emitted_at = now
+                    columns = [{"name": col, "type": dtype.name} for col, dtype in chunk.dtypes.items()]
+                _briefer_update_categories(columns, chunk, categories)
+
+                now = time.time()
+                if now - last_emitted_at > 1:
+                    result = {
+                        "version": 3,
+
+                        "type": "success",
+                        "columns": columns,
+                        "count": rows_count,
+
+                        "page": 0,
+                        "pageSize": page_size,
+                        "pageCount": int(rows_count // page_size + 1),
+
+                        "dashboardPage": 0,
+                        "dashboardPageSize": dashboard_page_size,
+                        "dashboardPageCount": int(rows_count // dashboard_page_size + 1),
+                    }
+                    print(json.dumps({"type": "log", "message": f"Emitting {rows_count} rows"}))
+                    print(_briefer_json_dumps(result, page_rows, default=str))
+                    last_emitted_at = now
+        except BaseException as e:
+            print(json.dumps({"type": "log", "message": f"Error dumping df: {e}"}))
+            dump.discard()
+            raise
 
-        print(json.dumps({"type": "log", "message": "Waiting for dump worker to finish"}))
+        # an aborted query still leaves the rows fetched so far on disk
+        dump.close()
+        print(json.dumps({"type": "log", "message": f"Dumped {dump.rows} rows"}))
 
         if aborted or not os.path.exists(flag_file_path):
+            dump.discard()
             print(json.dumps({"type": "log", "message": "Query aborted"}))
             result = {
                 "type": "abort-error",
@@ -240,22 +231,11 @@ def _briefer_make_bq_query():
             print(json.dumps(result, default=str))
             return None
 
-        if len(initial_rows) < actual_page_size:
-            initial_rows = json.loads(df.head(actual_page_size).to_json(orient='records', date_format="iso"))
-
-            # convert all values to string to make sure we preserve the python values
-            # when displaying this data in the browser
-            for row in initial_rows:
-                for key in row:
-                    row[key] = str(row[key])
-
-        columns = get_columns(df)
         result = {
             "version": 3,
 
             "type": "success",
-            "columns": columns,
-            "rows": initial_rows[:page_size],
+            "columns": columns or [],
             "count": rows_count,
 
             "page": 0,
@@ -265,29 +245,8 @@ def _briefer_make_bq_query():
             "dashboardPage": 0,
             "dashboardPageSize": dashboard_page_size,
             "dashboardPageCount": int(rows_count // dashboard_page_size + 1),
-            "dashboardRows": initial_rows[:dashboard_page_size],
         }
-
-        df = pd.concat(chunks, ignore_index=True)
-        convert_columns(df, columns_by_type)
-
-        os.makedirs('/home/jupyteruser/.briefer', exist_ok=True)
-
-        try:
-            # write to parquet
-            print(json.dumps({"type": "log", "message": f"Dumping {len(df)} rows as parquet"}))
-            df.to_parquet(parquet_file_path, compression='gzip', index=False)
-
-            # write to csv
-            print(json.dumps({"type": "log", "message": f"Dumping {len(df)} rows as csv"}))
-            df.to_csv(csv_file_path, index=False, header=True)
-
-            print(json.dumps({"type": "log", "message": f"Dumped {len(df)} rows"}))
-        except Exception as e:
-            print(json.dumps({"type": "log", "message": f"Error dumping df: {e}"}))
-            raise
-
-        print(json.dumps(result, default=str))
+        print(_briefer_json_dumps(result, page_rows, default=str))
     except BadRequest as e:
         error = {
             "type": "syntax-error",
@@ -0,0 +1,62 @@
+// Python code shared by the query runners and the dataframe listing to find
+// the categories of string columns. It is meant to be prepended to the code
+// that needs it, which can then call _briefer_update_categories.
+export function getCategoriesCollectorCode(): string {
+  return `
+class _BrieferCategories:
+    """
+    Collects the first distinct values of a column, in insertion order, as
+    it gets fed chunk by chunk. Values are deduplicated block by block until
+    the limit is reached, from then on the column isn't scanned anymore.
+    """
+
+    block_size = 10000
+
+    def __init__(self, limit=1000):
+        self.limit = limit
+        self.values = {}
+
+    @property
+    def saturated(self):
+        return len(self.values) >= self.limit
+
+    @property
+    def categories(self):
+        return list(self.values)[:self.limit]
+
+    def update(self, series):
+        for start in range(0, len(series), self.block_size):
+            if self.saturated:
+                return
+
+            for value in series.iloc[start:start + self.block_size].dropna().unique():
+                self.values[value] = None
+                if self.saturated:
+                    return
+
+
+def _briefer_update_categories(columns, df, collectors):
+    """
+    Feeds the string columns of df to their collector in collectors, which
+    is keyed by column name, and updates their categories in columns.
+    """
+    import pandas as pd
+
+    for col in columns:
+        if col["name"] not in df.columns:
+            continue
+
+        try:
+            series = df[col["name"]]
+            if not (pd.api.types.is_string_dtype(series.dtype) or pd.api.types.is_categorical_dtype(series.dtype)):
+                continue
+
+            collector = collectors.setdefault(col["name"], _BrieferCategories())
+            collector.update(series)
+            col["categories"] = collector.categories
+        except:
+            pass
+
+    return columns
+`
+}
@@ -0,0 +1,124 @@
+import {
+  describeBenchmark,
+  runPythonJSON,
+  setupPythonKernel,
+} from '../test-utils'
+import { getConvertDataFrameCode } from './convert'
+
+type BenchmarkResult = {
+  frame: string
+  rows: number
+  legacyMs: number
+  vectorizedMs: number
+  sameOutput: boolean
+}
+
+describeBenchmark('_briefer_convert_df', () => {
+  const kernel = setupPythonKernel()
+
+  it('is faster than the per value implementation on mixed type frames', async () => {
+    const rows = Number(process.env['BENCHMARK_ROWS'] ?? 500_000)
+    const code = `${getConvertDataFrameCode()}
+def _briefer_benchmark_convert_df():
+    import json
+    import time
+    import decimal
+    import numpy as np
+    import pandas as pd
+
+    # the implementation _briefer_convert_df replaced, kept as the baseline
+    def legacy_convert_df(df):
+        for column in df.columns:
+            col_type = df[column].dtype
+            if col_type == 'object':
+                are_all_non_null_values_strings = True
+                is_memoryview = False
+                is_bytes = False
+                for value in df[column].dropna():
+                    if isinstance(value, memoryview):
+                        is_memoryview = True
+                        break
+                    if isinstance(value, bytes):
+                        is_bytes = True
+                        break
+                    if not isinstance(value, str):
+                        are_all_non_null_values_strings = False
+                        break
+
+                if is_memoryview or is_bytes:
+                    df[column] = df[column].apply(lambda x: str(x.tobytes() if is_memoryview else x) if x is not None else None)
+                    continue
+
+                if are_all_non_null_values_strings:
+                    continue
+
+                try:
+                    df[column] = df[column].apply(lambda x: json.dumps(x))
+                except:
+                    df[column] = df[column].astype(str)
+        return df
+
+    rows = ${rows}
+    rng = np.random.default_rng(42)
+    def with_nulls(values):
+        return [None if i % 10 == 0 else v for i, v in enumerate(values)]
+
+    frames = {
+        "text": lambda: pd.DataFrame({
+            "name": with_nulls([f"name {i}" for i in rng.integers(0, 1000, rows)]),
+            "email": [f"user{i}@example.com" for i in rng.integers(0, rows, rows)],
+            "country": pd.Series(rng.choice(["US", "BR", "DE"], rows), dtype=object),
+        }),
+        "jsonb": lambda: pd.DataFrame({
+            "id": np.arange(rows),
+            "payload": with_nulls([{"id": int(i), "tags": ["a", "b"], "score": float(i) / 3} for i in rng.integers(0, 1000, rows)]),
+            "items": [[int(i), int(i) + 1] for i in rng.integers(0, 1000, rows)],
+        }),
+        "bytea": lambda: pd.DataFrame({
+            "id": np.arange(rows),
+            "hash": with_nulls([memoryview(int(i).to_bytes(8, "little")) for i in rng.integers(0, 2**32, rows)]),
+            "raw": [int(i).to_bytes(4, "little") for i in rng.integers(0, 2**16, rows)],
+        }),
+        "mixed": lambda: pd.DataFrame({
+            "name": [f"name {i}" for i in rng.integers(0, 1000, rows)],
+            "amount": with_nulls([decimal.Decimal(int(i)) / 100 for i in rng.integers(0, 10000, rows)]),
+            "quantity": pd.Series(with_nulls(rng.integers(0, 100, rows).tolist()), dtype=object),
+            "meta": with_nulls([{"k": int(i)} for i in rng.integers(0, 10, rows)]),
+        }),
+    }
+
+    for name, make_frame in frames.items():
+        df = make_frame()
+        legacy_df = df.copy()
+        start = time.perf_counter()
+        legacy_convert_df(legacy_df)
+        legacy_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        _briefer_convert_df(df)
+        vectorized_ms = (time.perf_counter() - start) * 1000
+
+        print(json.dumps({
+            "frame": name,
+            "rows": rows,
+            "legacyMs": round(legacy_ms),
+            "vectorizedMs": round(vectorized_ms),
+            "sameOutput": bool(df.equals(legacy_df)),
+        }))
+
+_briefer_benchmark_convert_df()
+del _briefer_benchmark_convert_df
+del _briefer_convert_df`
+
+    const results = await runPythonJSON<BenchmarkResult>(
+      kernel.runPython,
+      code
+    )
+    console.table(results)
+
+    expect(results).toHaveLength(4)
+    for (const result of results) {
+      expect(result.sameOutput).toBe(true)
+    }
+  }, 600_000)
+})
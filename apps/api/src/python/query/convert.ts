@@ -0,0 +1,53 @@
+// Python code that normalizes the object columns of a query result so they
+// can be written to parquet. It is meant to be prepended to the code of a
+// runner, which can then call _briefer_convert_df on each chunk.
+export function getConvertDataFrameCode(): string {
+  return `
+def _briefer_convert_df(df):
+    """
+    Strings are kept as is, binary values become their string representation
+    and everything else gets serialized as JSON, or as a string when it is not
+    JSON serializable.
+    """
+    import json
+    import pandas as pd
+
+    # values coming from a database can't reference themselves, skipping the
+    # circular reference check makes encoding noticeably faster
+    encode_json = json.JSONEncoder(check_circular=False).encode
+
+    for column in df.columns:
+        values = df[column]
+        if values.dtype != "object":
+            continue
+
+        # infer_dtype scans the whole column in C, this is a lot cheaper
+        # than checking the type of each value in python
+        kind = pd.api.types.infer_dtype(values, skipna=True)
+        if kind == "string" or kind == "empty":
+            continue
+
+        if kind == "bytes":
+            df[column] = values.map(str, na_action="ignore")
+            continue
+
+        if kind == "mixed":
+            # memoryview is not a type infer_dtype knows about, columns of
+            # binary values are all memoryview so looking at one is enough
+            first_value = values.to_numpy()[values.notna().to_numpy().argmax()]
+            if isinstance(first_value, memoryview):
+                df[column] = values.map(lambda x: str(x.tobytes()), na_action="ignore")
+                continue
+
+        if kind in ["decimal", "date", "datetime", "time", "timedelta", "period", "interval"]:
+            df[column] = list(map(str, values.to_numpy()))
+            continue
+
+        try:
+            df[column] = list(map(encode_json, values.to_numpy()))
+        except:
+            df[column] = list(map(str, values.to_numpy()))
+
+    return df
+`
+}
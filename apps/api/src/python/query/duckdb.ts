@@ -1,5 +1,8 @@
 import { RunQueryResult, SuccessRunQueryResult } from '@briefer/types'
 import { makeQuery } from './index.js'
+import { getQueryDumpWriterCode } from './dump.js'
+import { getCategoriesCollectorCode } from './categories.js'
+import { getPageSerializerCode } from './page.js'
 import { renderJinja } from '../index.js'
 
 export async function makeDuckDBQuery(
@@ -24,7 +27,7 @@ export async function makeDuckDBQuery(
 
   const flagFilePath = `/home/jupyteruser/.briefer/query-${queryId}.flag`
 
-  const code = `
+  const code = `${getQueryDumpWriterCode()}${getCategoriesCollectorCode()}${getPageSerializerCode()}
 def _briefer_make_duckdb_query():
     import duckdb
     import json
@@ -32,7 +35,7 @@ def _briefer_make_duckdb_query():
     import os
     
     dump_file_base = f'/home/jupyteruser/.briefer/query-${queryId}'
-    parquet_file_path = f'{dump_file_base}.parquet.gzip'
+    parquet_file_path = f'{dump_file_base}.parquet'
     csv_file_path = f'{dump_file_base}.csv'
     os.makedirs('/home/jupyteruser/.briefer', exist_ok=True)
 
@@ -65,51 +68,58 @@ def _briefer_make_duckdb_query():
             print(json.dumps(result, ensure_ascii=False, default=str))
             return
 
-        df = query.df()
         actual_page_size = max(page_size, dashboard_page_size)
-        rows = json.loads(df.head(actual_page_size).to_json(orient='records', date_format='iso'))
-
-        # convert all values to string to make sure we preserve the python values
-        # when displaying this data in the browser
-        for row in rows:
-            for key in row:
-                row[key] = str(row[key])
-
-        columns = [{"name": col, "type": dtype.name} for col, dtype in df.dtypes.items()]
-        for col in columns:
-            dtype = df[col["name"]].dtype
-            if pd.api.types.is_string_dtype(dtype) or pd.api.types.is_categorical_dtype(dtype):
-                try:
-                    categories = df[col["name"]].dropna().unique()
-                    categories = list(categories)
-
-                    # use dict.fromkeys instead of set to keep the order
-                    categories = list(dict.fromkeys(categories))
-
-                    categories = categories[:1000]
-                    col["categories"] = categories
-                except:
-                    pass
+        rows = None
+        columns = None
+        categories = {}
+        count = 0
+        dump = _BrieferQueryDumpWriter(parquet_file_path, csv_file_path, in_kernel=True)
+        try:
+            while True:
+                # each vector holds 2048 rows
+                chunk = query.fetch_df_chunk(50)
+                if columns is not None and len(chunk) == 0:
+                    break
+
+                count += len(chunk)
+                dump.write(chunk)
+                if rows is None:
+                    # convert all values to string to make sure we preserve the python values
+                    # when displaying this data in the browser
+                    rows = _briefer_stringify_rows(chunk.head(actual_page_size))
+
+                if columns is None:
+                    columns = [{"name": col, "type": dtype.name} for col, dtype in chunk.dtypes.items()]
+
+                _briefer_update_categories(columns, chunk, categories)
+
+                if len(chunk) == 0:
+                    break
+        except BaseException:
+            dump.discard()
+            raise
+        dump.close()
+
         result = {
             "version": 3,
 
             "type": "success",
             "columns": columns,
-            "rows": rows[:page_size],
-            "count": len(df),
+            "count": count,
 
             "page": 0,
             "pageSize": page_size,
-            "pageCount": int(len(df) // page_size + 1),
+            "pageCount": int(count // page_size + 1),
 
             "dashboardPage": 0,
             "dashboardPageSize": dashboard_page_size,
-            "dashboardPageCount": int(len(df) // dashboard_page_size + 1),
-            "dashboardRows": rows[:dashboard_page_size],
+            "dashboardPageCount": int(count // dashboard_page_size + 1),
+        }
+        page_rows = {
+            "rows": rows.head(page_size).to_json(orient="records"),
+            "dashboardRows": rows.head(dashboard_page_size).to_json(orient="records"),
         }
-        print(json.dumps(result, ensure_ascii=False, default=str))
-        df.to_parquet(parquet_file_path, compression='gzip', index=False)
-        df.to_csv(csv_file_path, index=False)
+        print(_briefer_json_dumps(result, page_rows, ensure_ascii=False, default=str))
 
     except duckdb.ProgrammingError as e:
         error = {
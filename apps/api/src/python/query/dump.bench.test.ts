@@ -0,0 +1,98 @@
+import { QueryDumpCompression } from '../../config/base'
+import {
+  describeBenchmark,
+  runPythonJSON,
+  setupPythonKernel,
+} from '../test-utils'
+import { getQueryDumpWriterCode } from './dump'
+
+const compressions: QueryDumpCompression[] = [
+  'gzip',
+  'zstd',
+  'snappy',
+  'lz4',
+  'none',
+]
+
+type BenchmarkResult = {
+  frame: string
+  compression: QueryDumpCompression
+  rows: number
+  writeMs: number
+  readMs: number
+  sizeMB: number
+}
+
+describeBenchmark('query dump compression', () => {
+  const kernel = setupPythonKernel()
+
+  it('compares write time, read time and size of each compression', async () => {
+    const rows = Number(process.env['BENCHMARK_ROWS'] ?? 1_000_000)
+    const code = `${getQueryDumpWriterCode('zstd')}
+def _briefer_benchmark_query_dump():
+    import json
+    import os
+    import tempfile
+    import time
+    import numpy as np
+    import pandas as pd
+
+    rows = ${rows}
+    rng = np.random.default_rng(42)
+    frames = {
+        "numeric": pd.DataFrame({
+            "id": np.arange(rows),
+            "quantity": rng.integers(0, 1000, rows),
+            "price": rng.random(rows) * 100,
+            "ratio": np.where(rng.random(rows) < 0.1, np.nan, rng.random(rows)),
+        }),
+        "mixed": pd.DataFrame({
+            "id": np.arange(rows),
+            "created_at": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, rows), unit="s"),
+            "country": rng.choice(["US", "BR", "DE", "FR", "IN", "JP", None], rows),
+            "email": [f"user{i}@example.com" for i in rng.integers(0, rows, rows)],
+            "amount": rng.random(rows) * 1000,
+            "active": rng.random(rows) < 0.5,
+        }),
+    }
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, df in frames.items():
+            for compression in ${JSON.stringify(compressions)}:
+                parquet_file_path = os.path.join(tmpdir, f"{name}-{compression}.parquet")
+
+                start = time.perf_counter()
+                dump = _BrieferQueryDumpWriter(parquet_file_path, f"{parquet_file_path}.csv", compression=compression)
+                for i in range(0, len(df), 100000):
+                    dump.write(df.iloc[i:i + 100000])
+                dump.close()
+                write_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                read_rows = len(pd.read_parquet(parquet_file_path, engine="pyarrow"))
+                read_ms = (time.perf_counter() - start) * 1000
+
+                print(json.dumps({
+                    "frame": name,
+                    "compression": compression,
+                    "rows": read_rows,
+                    "writeMs": round(write_ms),
+                    "readMs": round(read_ms),
+                    "sizeMB": round(os.path.getsize(parquet_file_path) / 1024 / 1024, 2),
+                }))
+
+_briefer_benchmark_query_dump()
+del _briefer_benchmark_query_dump`
+
+    const results = await runPythonJSON<BenchmarkResult>(
+      kernel.runPython,
+      code
+    )
+    console.table(results)
+
+    expect(results).toHaveLength(compressions.length * 2)
+    for (const result of results) {
+      expect(result.rows).toBe(rows)
+    }
+  }, 600_000)
+})
@@ -0,0 +1,112 @@
+import { runPythonJSON, setupPythonKernel } from '../test-utils'
+import { getQueryDumpWriterCode } from './dump'
+
+describe('_BrieferQueryDumpWriter', () => {
+  const kernel = setupPythonKernel()
+
+  it('widens the schema when a column changes type between chunks', async () => {
+    const code = `${getQueryDumpWriterCode('zstd')}
+def _briefer_test_query_dump_widening():
+    import json
+    import os
+    import tempfile
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        parquet_file_path = os.path.join(tmpdir, "query.parquet")
+        dump = _BrieferQueryDumpWriter(parquet_file_path, f"{parquet_file_path}.csv", row_group_size=10)
+        dump.write(pd.DataFrame({"id": range(25), "name": [None] * 25}))
+        dump.write(pd.DataFrame({"id": range(5), "name": ["a"] * 5}))
+        dump.write(pd.DataFrame({"id": [0.5] * 5, "name": ["b"] * 5}))
+        dump.close()
+
+        table = pq.read_table(parquet_file_path)
+        arrow_table = pa.ipc.open_file(dump.arrow_file_path).read_all()
+        print(json.dumps({
+            "types": [str(t) for t in table.schema.types],
+            "rows": table.num_rows,
+            "names": table.column("name").drop_null().to_pylist(),
+            "arrowRows": arrow_table.num_rows,
+            "files": sorted(os.listdir(tmpdir)),
+        }))
+
+_briefer_test_query_dump_widening()
+del _briefer_test_query_dump_widening`
+
+    const [result] = await runPythonJSON(kernel.runPython, code)
+    expect(result).toEqual({
+      types: ['double', 'string'],
+      rows: 35,
+      names: ['a', 'a', 'a', 'a', 'a', 'b', 'b', 'b', 'b', 'b'],
+      arrowRows: 35,
+      files: ['query.arrow', 'query.parquet'],
+    })
+  })
+
+  it('leaves the previous dump in place when discarded', async () => {
+    const code = `${getQueryDumpWriterCode('zstd')}
+def _briefer_test_query_dump_discard():
+    import json
+    import os
+    import tempfile
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        parquet_file_path = os.path.join(tmpdir, "query.parquet")
+        dump = _BrieferQueryDumpWriter(parquet_file_path, f"{parquet_file_path}.csv")
+        dump.write(pd.DataFrame({"id": range(3)}))
+        dump.close()
+
+        dump = _BrieferQueryDumpWriter(parquet_file_path, f"{parquet_file_path}.csv", row_group_size=1)
+        dump.write(pd.DataFrame({"id": range(10)}))
+        dump.discard()
+
+        print(json.dumps({
+            "rows": pq.read_table(parquet_file_path).num_rows,
+            "files": sorted(os.listdir(tmpdir)),
+        }))
+
+_briefer_test_query_dump_discard()
+del _briefer_test_query_dump_discard`
+
+    const [result] = await runPythonJSON(kernel.runPython, code)
+    expect(result).toEqual({ rows: 3, files: ['query.parquet'] })
+  })
+
+  it('leaves the result in memory for the kernel when in_kernel', async () => {
+    const code = `${getQueryDumpWriterCode('zstd')}
+def _briefer_test_query_dump_in_kernel():
+    import json
+    import os
+    import tempfile
+    import pandas as pd
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        parquet_file_path = os.path.join(tmpdir, "query.parquet")
+        dump = _BrieferQueryDumpWriter(parquet_file_path, f"{parquet_file_path}.csv", in_kernel=True)
+        dump.write(pd.DataFrame({"id": range(3)}))
+        dump.close()
+        rows = _briefer_query_results[dump.arrow_file_path].num_rows
+        files = sorted(os.listdir(tmpdir))
+        dump.discard()
+
+        print(json.dumps({
+            "rows": rows,
+            "files": files,
+            "discarded": dump.arrow_file_path not in _briefer_query_results,
+        }))
+
+_briefer_test_query_dump_in_kernel()
+del _briefer_test_query_dump_in_kernel`
+
+    const [result] = await runPythonJSON(kernel.runPython, code)
+    expect(result).toEqual({
+      rows: 3,
+      files: ['query.parquet'],
+      discarded: true,
+    })
+  })
+})
@@ -0,0 +1,281 @@
+import { PythonErrorOutput } from '@briefer/types'
+import { executeCode, PythonExecutionError } from '../index.js'
+import { config } from '../../config/index.js'
+import { QueryDumpCompression } from '../../config/base.js'
+
+export function getQueryParquetPath(queryId: string): string {
+  return `/home/jupyteruser/.briefer/query-${queryId}.parquet`
+}
+
+// Uncompressed arrow copy of a query result, it only lives until the kernel
+// that ran the query loads it as the result dataframe.
+export function getQueryArrowPath(queryId: string): string {
+  return `/home/jupyteruser/.briefer/query-${queryId}.arrow`
+}
+
+// Python expression evaluating to the parquet dump of a query, it expects os
+// to be imported. Results dumped before the compression became configurable
+// are still found under their legacy .parquet.gzip suffix.
+export function getQueryParquetPathCode(queryId: string): string {
+  const path = JSON.stringify(getQueryParquetPath(queryId))
+  const legacyPath = JSON.stringify(`${getQueryParquetPath(queryId)}.gzip`)
+  return `(${path} if os.path.exists(${path}) or not os.path.exists(${legacyPath}) else ${legacyPath})`
+}
+
+// Python code shared by the query runners to persist their results. It is
+// meant to be prepended to the code of a runner, which can then use
+// _BrieferQueryDumpWriter to write the result as it gets fetched.
+export function getQueryDumpWriterCode(
+  compression: QueryDumpCompression = config().QUERY_DUMP_COMPRESSION
+): string {
+  return `
+class _BrieferQueryDumpWriter:
+    """
+    Persists a query result chunk by chunk, as parquet row groups, so memory
+    is bounded by the chunk size instead of the result size.
+    The file is written next to its final path and moved into place on close,
+    this way readers never see a half written file. A query aborted between
+    chunks still leaves behind a usable file with the rows fetched so far,
+    when the runner gets killed instead the partial files are discarded and
+    the previous dump stays in place.
+    The csv export is only generated when downloaded, closing the writer
+    removes the one from the previous run so it can't go stale.
+    The kernel loads the result without decompressing the parquet. Runners
+    that run in the kernel, in_kernel, leave the arrow tables in memory for
+    it. The others write an uncompressed arrow file next to the parquet one,
+    which the kernel memory maps. When the result won't be loaded, eg. the
+    query got aborted, discard drops it.
+    """
+
+    def __init__(self, parquet_file_path, csv_file_path, row_group_size=100000, compression=${JSON.stringify(
+    compression
+  )}, in_kernel=False):
+        import os
+
+        os.makedirs(os.path.dirname(parquet_file_path), exist_ok=True)
+        self.parquet_file_path = parquet_file_path
+        self.csv_file_path = csv_file_path
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.tmp_parquet_file_path = f"{parquet_file_path}.tmp"
+        self.arrow_file_path = f"{os.path.splitext(parquet_file_path)[0]}.arrow"
+        self.tmp_arrow_file_path = f"{self.arrow_file_path}.tmp"
+        self.in_kernel = in_kernel
+        self.schema = None
+        self.writer = None
+        self.arrow_writer = None
+        self.arrow_tables = []
+        self.pending = []
+        self.pending_rows = 0
+        self.rows = 0
+
+    def write(self, df):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.schema is None:
+            self.schema = table.schema
+        elif not table.schema.equals(self.schema):
+            table = self._conform(table)
+
+        self.pending.append(table)
+        self.pending_rows += table.num_rows
+        if self.pending_rows >= self.row_group_size:
+            self._flush()
+
+        self.rows += len(df)
+
+    def close(self):
+        import os
+        import pyarrow as pa
+
+        if self.writer is None and not self.pending:
+            # nothing was ever written, still leave an empty file behind
+            self.schema = self.schema or pa.schema([])
+            self.pending.append(self.schema.empty_table())
+
+        try:
+            self._flush()
+            self.writer.close()
+            self.writer = None
+            os.replace(self.tmp_parquet_file_path, self.parquet_file_path)
+            if self.in_kernel:
+                results = globals().setdefault("_briefer_query_results", {})
+                results[self.arrow_file_path] = pa.concat_tables(self.arrow_tables)
+                self.arrow_tables = []
+            else:
+                self.arrow_writer.close()
+                self.arrow_writer = None
+                os.replace(self.tmp_arrow_file_path, self.arrow_file_path)
+        except BaseException:
+            self.discard()
+            raise
+
+        # the csv export and dumps with the legacy suffix would be stale now
+        for path in [self.csv_file_path, f"{self.parquet_file_path}.gzip"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def discard(self):
+        """
+        Drops the partial files and the arrow copy, which nobody is going to
+        read anymore. The parquet dump, previous or just closed, is kept.
+        """
+        import os
+
+        self.arrow_tables = []
+        globals().get("_briefer_query_results", {}).pop(self.arrow_file_path, None)
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.arrow_writer is not None:
+            self.arrow_writer.close()
+            self.arrow_writer = None
+
+        for path in [
+            self.tmp_parquet_file_path,
+            self.tmp_arrow_file_path,
+            f"{self.tmp_parquet_file_path}.old",
+            self.arrow_file_path,
+        ]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self.pending:
+            return
+
+        table = pa.concat_tables(self.pending)
+        self.pending = []
+        self.pending_rows = 0
+        if self.writer is None:
+            self._open()
+        self._write(table)
+
+    def _open(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.writer = pq.ParquetWriter(self.tmp_parquet_file_path, self.schema, compression=self.compression)
+        if not self.in_kernel:
+            self.arrow_writer = pa.ipc.new_file(self.tmp_arrow_file_path, self.schema)
+
+    def _write(self, table):
+        self.writer.write_table(table)
+        if self.in_kernel:
+            self.arrow_tables.append(table)
+        else:
+            self.arrow_writer.write_table(table)
+
+    def _conform(self, table):
+        """
+        Makes a chunk fit the schema of the file. When a column changes type
+        between chunks, eg. it was all null in the first one, the schema is
+        widened and the rows written so far are rewritten with it, one row
+        group at a time so they never have to be loaded all at once.
+        """
+        import os
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        try:
+            return table.cast(self.schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            pass
+
+        fields = []
+        for field in self.schema:
+            other = table.schema.field(field.name).type
+            if field.type == other or pa.types.is_null(other):
+                fields.append(field)
+            elif pa.types.is_null(field.type):
+                fields.append(field.with_type(other))
+            else:
+                try:
+                    unified = pa.unify_schemas(
+                        [pa.schema([field]), pa.schema([field.with_type(other)])],
+                        promote_options="permissive",
+                    )
+                    fields.append(unified.field(0))
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    fields.append(field.with_type(pa.string()))
+        schema = pa.schema(fields, metadata=self.schema.metadata)
+
+        self.schema = schema
+        self.pending = [t.cast(schema) for t in self.pending]
+        if self.writer is not None:
+            self.writer.close()
+            if self.arrow_writer is not None:
+                self.arrow_writer.close()
+            written_file_path = f"{self.tmp_parquet_file_path}.old"
+            os.replace(self.tmp_parquet_file_path, written_file_path)
+            self._open()
+            self.arrow_tables = []
+            for batch in pq.ParquetFile(written_file_path).iter_batches(batch_size=self.row_group_size):
+                self._write(pa.Table.from_batches([batch]).cast(schema))
+            os.remove(written_file_path)
+
+        return table.cast(schema)
+`
+}
+
+// Generates the csv export of a query from its parquet dump, unless an up to
+// date one already exists. Runs in its own session so downloads don't have to
+// wait for whatever is executing in the document.
+export async function exportQueryCSV(
+  workspaceId: string,
+  queryId: string
+): Promise<void> {
+  const code = `
+def _briefer_export_query_csv():
+    import os
+    import pyarrow.parquet as pq
+
+    parquet_file_path = ${getQueryParquetPathCode(queryId)}
+    csv_file_path = f'/home/jupyteruser/.briefer/query-${queryId}.csv'
+    if not os.path.exists(parquet_file_path):
+        return
+
+    if os.path.exists(csv_file_path) and os.path.getmtime(csv_file_path) >= os.path.getmtime(parquet_file_path):
+        return
+
+    tmp_csv_file_path = f"{csv_file_path}.tmp"
+    parquet_file = pq.ParquetFile(parquet_file_path)
+    with open(tmp_csv_file_path, "w", newline="") as f:
+        if parquet_file.metadata.num_row_groups == 0:
+            parquet_file.schema_arrow.empty_table().to_pandas().to_csv(f, index=False)
+
+        for i in range(parquet_file.metadata.num_row_groups):
+            df = parquet_file.read_row_group(i).to_pandas()
+            df.to_csv(f, index=False, header=i == 0)
+
+    os.replace(tmp_csv_file_path, csv_file_path)
+
+_briefer_export_query_csv()
+del _briefer_export_query_csv`
+
+  let pythonError: PythonErrorOutput | null = null
+  await (
+    await executeCode(
+      workspaceId,
+      'csv-export',
+      code,
+      (outputs) => {
+        for (const output of outputs) {
+          if (output.type === 'error') {
+            pythonError = output
+          }
+        }
+      },
+      { storeHistory: false }
+    )
+  ).promise
+
+  if (pythonError) {
+    const { type, ename, evalue, traceback } = pythonError
+    throw new PythonExecutionError(type, ename, evalue, traceback)
+  }
+}
@@ -28,6 +28,9 @@ import { updateConnStatus } from '../../datasources/index.js'
 import { getJupyterManager } from '../../jupyter/index.js'
 import { makeSQLServerQuery } from './sqlserver.js'
 import { makeDatabricksSQLQuery } from './databrickssql.js'
+import { getQueryArrowPath, getQueryParquetPathCode } from './dump.js'
+import { getCategoriesCollectorCode } from './categories.js'
+import { getPageSerializerCode, getSortPermutationCode } from './page.js'
 
 export async function makeSQLQuery(
   workspaceId: string,
@@ -271,8 +274,38 @@ export async function makeQuery(
   )
   abortFns.push(abortQuery)
 
+  // the kernel only drops the arrow copy of the result, in memory or on disk,
+  // once it loads it, so it has to be dropped here whenever that is not
+  // going to happen
+  const discardArrowResult = async () => {
+    const arrowFilePath = JSON.stringify(getQueryArrowPath(queryId))
+    const code = `def _briefer_discard_query_result():
+    import os
+
+    globals().get("_briefer_query_results", {}).pop(${arrowFilePath}, None)
+    if os.path.exists(${arrowFilePath}):
+        os.remove(${arrowFilePath})
+
+_briefer_discard_query_result()
+del _briefer_discard_query_result`
+
+    try {
+      await (
+        await executeCode(workspaceId, sessionId, code, () => {}, {
+          storeHistory: false,
+        })
+      ).promise
+    } catch (err) {
+      logger().error(
+        { err, workspaceId, sessionId, queryId },
+        'Failed to discard query arrow result'
+      )
+    }
+  }
+
   const resultPromise = queryPromise.then(async (): Promise<RunQueryResult> => {
     if (aborted) {
+      await discardArrowResult()
       return {
         type: 'abort-error',
         message: 'Query aborted',
@@ -280,24 +313,48 @@ export async function makeQuery(
     }
 
     if (error) {
+      await discardArrowResult()
       throw error
     }
 
     if (!result) {
+      await discardArrowResult()
       throw new Error('No result')
     }
 
     if (result.type !== 'success') {
+      await discardArrowResult()
       return result
     }
 
     const code = `
 def _briefer_read_query():
+    import os
     import pandas as pd
+    import pyarrow as pa
+
+    # runners that run in the kernel leave the result in memory, the others
+    # an uncompressed arrow copy that can be memory mapped, only fall back to
+    # the parquet dump when neither is around
+    arrow_file_path = ${JSON.stringify(getQueryArrowPath(queryId))}
+    result = globals().get("_briefer_query_results", {}).pop(arrow_file_path, None)
+    if result is not None:
+        # nothing else references the tables, so they can be freed as they get converted
+        return result.to_pandas(self_destruct=True)
+
+    if os.path.exists(arrow_file_path):
+        try:
+            with pa.memory_map(arrow_file_path) as source:
+                return pa.ipc.open_file(source).read_all().to_pandas()
+        except Exception:
+            pass
+        finally:
+            os.remove(arrow_file_path)
+
     retries = 3
     while retries > 0:
         try:
-            return pd.read_parquet("/home/jupyteruser/.briefer/query-${queryId}.parquet.gzip")
+            return pd.read_parquet(${getQueryParquetPathCode(queryId)}, engine="pyarrow")
         except:
             retries -= 1
             if retries == 0:
@@ -333,6 +390,7 @@ del _briefer_read_query`
 
     if (aborted) {
       await abortDataframe()
+      await discardArrowResult()
       return {
         type: 'abort-error',
         message: 'Query aborted',
@@ -376,13 +434,19 @@ export async function readDataframePage(
   sort: TableSort | null
 ): Promise<ReadDataFramePageResult> {
   const code = `import json
+${getPageSerializerCode()}
+
+${getSortPermutationCode()}
 
 sort_config = json.loads(${JSON.stringify(JSON.stringify(sort))})
 
 if not ("${dataframeName}" in globals()):
+    import os
     import pandas as pd
     try:
-      ${dataframeName} = pd.read_parquet("/home/jupyteruser/.briefer/query-${queryId}.parquet.gzip")
+      ${dataframeName} = pd.read_parquet(${getQueryParquetPathCode(
+        queryId
+      )}, engine="pyarrow")
     except:
       print(json.dumps({"type": "not-found"}))
 
@@ -398,30 +462,29 @@ if "${dataframeName}" in globals():
   }
 
     df = ${dataframeName}
+    permutation = None
     if sort_config:
         try:
-            df = df.sort_values(by=sort_config["column"], ascending=sort_config["order"] == "asc")
+            permutation = _briefer_sort_permutation(df, "${dataframeName}", sort_config["column"], sort_config["order"] == "asc")
         except:
-            # try sorting as string
-            try:
-                df = df.sort_values(by=sort_config["column"], ascending=sort_config["order"] == "asc", key=lambda x: x.astype(str))
-            except:
-                pass
+            pass
 
-    rows = json.loads(df.iloc[start:end].to_json(orient="records", date_format="iso"))
-    dashboard_rows = json.loads(df.iloc[dashboard_start:dashboard_end].to_json(orient="records", date_format="iso"))
+    if permutation is not None:
+        page_df = df.take(permutation[start:end])
+        dashboard_page_df = df.take(permutation[dashboard_start:dashboard_end])
+    else:
+        page_df = df.iloc[start:end]
+        dashboard_page_df = df.iloc[dashboard_start:dashboard_end]
 
     # convert all values to string to make sure we preserve the python values
     # when displaying this data in the browser
-    for row in rows:
-        for key in row:
-            row[key] = str(row[key])
+    rows = _briefer_stringify_rows(page_df).to_json(orient="records")
+    dashboard_rows = dashboard_page_df.to_json(orient="records", date_format="iso")
 
     columns = [{"name": col, "type": dtype.name} for col, dtype in ${dataframeName}.dtypes.items()]
     result = {
       "version": 3,
       "type": "success",
-      "rows": rows,
       "count": len(${dataframeName}),
       "columns": columns,
 
@@ -434,9 +497,10 @@ if "${dataframeName}" in globals():
       "dashboardPageCount": int(len(${dataframeName}) / ${
     pageOptions.dashboardPageSize
   } + 1),
-      "dashboardRows": dashboard_rows,
     }
-    print(json.dumps(result))`
+    print(_briefer_json_dumps(result, {"rows": rows, "dashboardRows": dashboard_rows}))
+
+del _briefer_sort_permutation, _briefer_stringify_rows, _briefer_json_dumps`
 
   let result: ReadDataFramePageResult | null = null
   let error: Error | null = null
@@ -514,7 +578,7 @@ export async function listDataFrames(
   workspaceId: string,
   sessionId: string
 ): Promise<DataFrame[]> {
-  const code = `
+  const code = `${getCategoriesCollectorCode()}
 def _briefer_list_dataframes():
     import pandas as pd
     import json
@@ -526,22 +590,7 @@ def _briefer_list_dataframes():
             if isinstance(globals()[name], pd.DataFrame):
                 df = globals()[name]
                 columns = [{"name": str(col), "type": dtype.name} for col, dtype in df.dtypes.items()]
-
-                for col in columns:
-                    # Ignore if the column already has categories
-                    if "categories" in col:
-                        continue
-
-                    dtype = df[col["name"]].dtype
-                    if pd.api.types.is_string_dtype(dtype) or pd.api.types.is_categorical_dtype(dtype):
-                        try:
-                            categories = df[col["name"]].dropna().unique()
-                            categories = list(categories)
-                            categories = list(dict.fromkeys(categories))
-                            categories = categories[:1000] 
-                            col["categories"] = categories
-                        except:
-                            pass
+                _briefer_update_categories(columns, df, {})
 
                 dataframes.append({"name": name, "columns": columns})
         except Exception as e:
@@ -550,7 +599,9 @@ def _briefer_list_dataframes():
     print(json.dumps(dataframes, default=str))
 
 _briefer_list_dataframes()
-del _briefer_list_dataframes`
+del _briefer_list_dataframes
+del _briefer_update_categories
+del _BrieferCategories`
 
   let dataframes: DataFrame[] = []
   let error: Error | null = null
@@ -0,0 +1,46 @@
+import { runPythonJSON, setupPythonKernel } from '../test-utils'
+import { getSortPermutationCode } from './page'
+
+describe('_briefer_sort_permutation', () => {
+  const kernel = setupPythonKernel()
+
+  afterAll(async () => {
+    await runPythonJSON(
+      kernel.runPython,
+      `del _briefer_sort_permutation, _briefer_test_sort_df, _briefer_sort_cache`
+    )
+  })
+
+  it('reuses the permutation until the dataframe may have changed', async () => {
+    await runPythonJSON(
+      kernel.runPython,
+      `${getSortPermutationCode()}
+import pandas as pd
+_briefer_test_sort_df = pd.DataFrame({"n": [3, 1, 2]})`
+    )
+
+    const sort = `
+def _briefer_test_sort():
+    import json
+
+    first = _briefer_sort_permutation(_briefer_test_sort_df, "_briefer_test_sort_df", "n", True)
+    second = _briefer_sort_permutation(_briefer_test_sort_df, "_briefer_test_sort_df", "n", True)
+    print(json.dumps({"permutation": first.tolist(), "reused": first is second}))
+
+_briefer_test_sort()
+del _briefer_test_sort`
+
+    const [before] = await runPythonJSON(kernel.runPython, sort)
+    expect(before).toEqual({ permutation: [1, 2, 0], reused: true })
+
+    // a cell changing the dataframe in place, it bumps the execution count
+    await runPythonJSON(
+      kernel.runPython,
+      `_briefer_test_sort_df.loc[0, "n"] = 0`,
+      { storeHistory: true }
+    )
+
+    const [after] = await runPythonJSON(kernel.runPython, sort)
+    expect(after).toEqual({ permutation: [0, 1, 2], reused: true })
+  })
+})
@@ -0,0 +1,113 @@
+// Python code shared by readDataframePage and the query runners to serialize
+// the rows of a page. It is meant to be prepended to the code that builds the
+// page, which can then stringify the rows with _briefer_stringify_rows and
+// print the payload with _briefer_json_dumps.
+export function getPageSerializerCode(): string {
+  return `
+def _briefer_stringify_rows(df):
+    """
+    Returns a copy of df with every value converted to the string that gets
+    displayed in the browser, which is the str of the value the json encoding
+    of df decodes to. Integer and boolean columns are converted a whole block
+    at a time and the remaining columns are encoded with a single to_json, so
+    only cells that don't decode to a string get stringified in python. Floats
+    still are, as their str depends on the rounding to_json applies.
+    The result is meant to be encoded with to_json(orient="records").
+    """
+    import json
+    import numpy as np
+    import pandas as pd
+
+    cells = np.empty(df.shape, dtype=object)
+    blocks = {}
+    for position, dtype in enumerate(df.dtypes):
+        kind = dtype.kind if isinstance(dtype, np.dtype) and dtype.kind in "biu" else "O"
+        blocks.setdefault("i" if kind == "u" else kind, []).append(position)
+
+    for kind, positions in blocks.items():
+        if len(df) == 0:
+            break
+
+        block = df.iloc[:, positions]
+        if kind == "b":
+            cells[:, positions] = np.where(block.to_numpy(), "True", "False")
+        elif kind == "i":
+            cells[:, positions] = block.to_numpy().astype(str)
+        else:
+            values = json.loads(block.to_json(orient="values", date_format="iso"))
+            cells[:, positions] = [[v if v.__class__ is str else str(v) for v in row] for row in values]
+
+    return pd.DataFrame(cells, columns=df.columns, copy=False)
+
+
+def _briefer_json_dumps(payload, raw_values, **kwargs):
+    """
+    json.dumps for payloads with values that are already json encoded, eg.
+    rows encoded by to_json, raw_values maps their keys to the encoded text.
+    """
+    import json
+
+    encoded = [json.dumps(payload, **kwargs)[1:-1]]
+    encoded += [f"{json.dumps(key)}: {value}" for key, value in raw_values.items()]
+    return "{" + ", ".join(e for e in encoded if e) + "}"
+`
+}
+
+// Python code for readDataframePage to sort a dataframe before slicing the
+// page out of it. It is meant to be prepended to the code that builds the
+// page, which can then call _briefer_sort_permutation.
+export function getSortPermutationCode(): string {
+  return `
+def _briefer_sort_permutation(df, name, column, ascending):
+    """
+    Returns the positions of the rows of df sorted by column, or None when
+    the column can't be sorted. Permutations are cached per dataframe,
+    column and order, so paging through a sorted dataframe only sorts it
+    once. A cached permutation is only used for the very same dataframe
+    object it was computed for, and only until the next cell runs, as that
+    could have changed the dataframe in place.
+    """
+    import weakref
+
+    try:
+        execution_count = get_ipython().execution_count
+    except NameError:
+        execution_count = None
+
+    cache = globals().setdefault("_briefer_sort_cache", {})
+    key = (name, column, ascending)
+    entry = cache.pop(key, None)
+    if (
+        entry is not None
+        and entry["df"]() is df
+        and entry["rows"] == len(df)
+        and entry["execution_count"] == execution_count
+    ):
+        # re-insert it so the dict stays ordered from least to most recently used
+        cache[key] = entry
+        return entry["permutation"]
+
+    series = df[column].reset_index(drop=True)
+    try:
+        permutation = series.sort_values(ascending=ascending).index.to_numpy()
+    except:
+        # try sorting as string
+        try:
+            permutation = series.astype(str).sort_values(ascending=ascending).index.to_numpy()
+        except:
+            return None
+
+    cache[key] = {
+        "df": weakref.ref(df),
+        "rows": len(df),
+        "execution_count": execution_count,
+        "permutation": permutation,
+    }
+
+    # each permutation holds 8 bytes per row, only keep the latest ones
+    while len(cache) > 4:
+        del cache[next(iter(cache))]
+
+    return permutation
+`
+}
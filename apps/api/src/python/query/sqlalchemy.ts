@@ -6,6 +6,10 @@ import {
   SuccessRunQueryResult,
 } from '@briefer/types'
 import { makeQuery } from './index.js'
+import { getQueryDumpWriterCode } from './dump.js'
+import { getConvertDataFrameCode } from './convert.js'
+import { getCategoriesCollectorCode } from './categories.js'
+import { getPageSerializerCode } from './page.js'
 import { executeCode, PythonExecutionError, renderJinja } from '../index.js'
 import { DataSource, getDatabaseURL } from '@briefer/database'
 import { z } from 'zod'
@@ -45,7 +49,7 @@ export async function makeSQLAlchemyQuery(
 
   const flagFilePath = `/home/jupyteruser/.briefer/query-${jobId}.flag`
 
-  const code = `
+  const code = `${getQueryDumpWriterCode()}${getConvertDataFrameCode()}${getCategoriesCollectorCode()}${getPageSerializerCode()}
 def briefer_make_sqlalchemy_query():
     import pandas as pd
     import os
@@ -59,6 +63,10 @@ def briefer_make_sqlalchemy_query():
     from datetime import datetime
     from datetime import timedelta
     import multiprocessing
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
 
     print(json.dumps({"type": "log", "message": "Starting SQLAlchemy query"}))
 
@@ -78,47 +86,188 @@ def briefer_make_sqlalchemy_query():
         return df
 
     dump_file_base = f'/home/jupyteruser/.briefer/query-${queryId}'
-    parquet_file_path = f'{dump_file_base}.parquet.gzip'
+    parquet_file_path = f'{dump_file_base}.parquet'
     csv_file_path = f'{dump_file_base}.csv'
 
-    def convert_df(df):
-      for column in df.columns:
-          col_type = df[column].dtype
-          if col_type == 'object':
-              # check if string
-              # find out if all non-null values are strings
-              are_all_non_null_values_strings = True
-              is_memoryview = False
-              is_bytes = False
-              for value in df[column].dropna():
-                  if isinstance(value, memoryview):
-                      is_memoryview = True
-                      break
-                  if isinstance(value, bytes):
-                      is_bytes = True
-                      break
-                  if not isinstance(value, str):
-                      are_all_non_null_values_strings = False
-                      break
-
-              if is_memoryview or is_bytes:
-                  # convert to string
-                  df[column] = df[column].apply(lambda x: str(x.tobytes() if is_memoryview else x) if x is not None else None)
-
-                  continue
-
-              if are_all_non_null_values_strings:
-                  continue
-
-              try:
-                  # Attempt to serialize data as JSON string
-                  df[column] = df[column].apply(lambda x: json.dumps(x))
-              except:
-                  # If all fails, convert to string
-                  df[column] = df[column].astype(str)
-      return df
-
-    def run_query(queue, engine, job_id, datasource_type, flag_file_path):
+    def arrow_table_to_df(table):
+        df = table.to_pandas()
+
+        # nested arrow values become numpy arrays, turn them into python objects
+        # so they get serialized the same way the DBAPI values are
+        for i, field in enumerate(table.schema):
+            if pa.types.is_nested(field.type):
+                df.isetitem(i, pd.Series(table.column(i).to_pylist(), dtype="object"))
+
+        return df
+
+    def coalesce_arrow_batches(batches, chunksize, schema=None, to_df=arrow_table_to_df):
+        """Groups arrow record batches or tables into dataframes of roughly chunksize rows."""
+        pending = []
+        pending_rows = 0
+        yielded = False
+        for batch in batches:
+            if isinstance(batch, pa.RecordBatch):
+                batch = pa.Table.from_batches([batch])
+
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= chunksize:
+                yield to_df(pa.concat_tables(pending))
+                yielded = True
+                pending = []
+                pending_rows = 0
+
+        if pending:
+            yield to_df(pa.concat_tables(pending))
+        elif not yielded:
+            yield to_df(schema.empty_table()) if schema is not None else pd.DataFrame()
+
+    # postgres types ADBC gives back as the same values psycopg2 does: bool,
+    # int8, int2, int4, text, float4, float8, bpchar, varchar, date and
+    # timestamp. numeric and json come back as strings, so queries with
+    # columns of other types are read through psycopg2.
+    adbc_postgres_types = {16, 20, 21, 23, 25, 700, 701, 1042, 1043, 1082, 1114}
+
+    def describe_postgres_query(conn, query):
+        """
+        The type oids of the columns of a query, found by planning it under a
+        LIMIT 0, which doesn't run it. It goes through the connection the query
+        would otherwise run on, in a savepoint so a failure leaves it usable.
+        """
+        with conn.begin_nested():
+            result = conn.exec_driver_sql(f"SELECT * FROM (\n{query.strip().rstrip(';')}\n) AS _briefer_describe LIMIT 0")
+            return [column[1] for column in result.cursor.description]
+
+    def as_dbapi_df(table):
+        """
+        Turns an arrow table of the postgres types in adbc_postgres_types into
+        the dataframe pd.read_sql_query makes out of the rows psycopg2 returns.
+        """
+        df = arrow_table_to_df(table)
+        for i, field in enumerate(table.schema):
+            column = df.iloc[:, i]
+            if table.column(i).null_count == len(table):
+                # columns that are all nulls are objects for pandas
+                df.isetitem(i, pd.Series([None] * len(df), index=df.index, dtype="object"))
+            elif pa.types.is_integer(field.type) and column.dtype.kind == "i":
+                df.isetitem(i, column.astype("int64"))
+            elif pa.types.is_floating(field.type):
+                df.isetitem(i, column.astype("float64"))
+            elif pa.types.is_timestamp(field.type):
+                try:
+                    df.isetitem(i, column.astype("datetime64[ns]"))
+                except pd.errors.OutOfBoundsDatetime:
+                    df.isetitem(i, pd.Series(table.column(i).to_pylist(), index=df.index, dtype="object"))
+
+        return df
+
+    def read_postgres_arrow(engine, connect_args, conn, query, chunksize):
+        try:
+            import adbc_driver_postgresql.dbapi
+            from psycopg2.extensions import make_dsn
+        except ImportError:
+            return None
+
+        try:
+            type_codes = describe_postgres_query(conn, query)
+        except DBAPIError as e:
+            # eg. statements that aren't a SELECT, psycopg2 runs them as they are
+            # and reports the errors of the ones that are wrong
+            print(json.dumps({"type": "log", "message": f"Failed to describe query, falling back: {str(e.orig)}"}))
+            return None
+
+        if not all(t in adbc_postgres_types for t in type_codes):
+            print(json.dumps({"type": "log", "message": "Query has columns ADBC can't read as psycopg2 does, falling back"}))
+            return None
+
+        # the same connection parameters psycopg2 gets from the engine
+        _, params = engine.dialect.create_connect_args(engine.url)
+        try:
+            adbc_conn = adbc_driver_postgresql.dbapi.connect(make_dsn(**{**params, **connect_args}))
+        except Exception as e:
+            print(json.dumps({"type": "log", "message": f"Failed to open ADBC connection, falling back: {str(e)}"}))
+            return None
+
+        def chunks():
+            try:
+                with adbc_conn.cursor() as cursor:
+                    cursor.execute(query)
+                    reader = cursor.fetch_record_batch()
+                    yield from coalesce_arrow_batches(reader, chunksize, reader.schema, as_dbapi_df)
+            finally:
+                adbc_conn.close()
+
+        return chunks()
+
+    def read_snowflake_arrow(conn, query, chunksize):
+        from snowflake.connector.errors import NotSupportedError
+
+        cursor = conn.connection.dbapi_connection.cursor()
+        cursor.execute(query)
+
+        def chunks():
+            try:
+                try:
+                    batches = cursor.fetch_arrow_batches()
+                except NotSupportedError:
+                    # the query has already run, so read the rows from the same cursor
+                    print(json.dumps({"type": "log", "message": "Arrow result format not available, fetching rows"}))
+                    columns = [c[0] for c in cursor.description]
+                    yielded = False
+                    while True:
+                        data = cursor.fetchmany(chunksize)
+                        # an empty dataframe only when there are no rows at all
+                        if data or not yielded:
+                            yield pd.DataFrame.from_records(data, columns=columns)
+                            yielded = True
+                        if len(data) < chunksize:
+                            return
+
+                yield from coalesce_arrow_batches(batches, chunksize)
+            finally:
+                cursor.close()
+
+        return chunks()
+
+    def read_arrow_chunks(engine, connect_args, conn, query, datasource_type, chunksize):
+        """
+        Returns an iterator of dataframes built from Arrow record batches fetched
+        straight from the driver, or None when the driver can't produce them, in
+        which case the caller should use pd.read_sql_query.
+        """
+        if pa is None:
+            return None
+
+        if datasource_type == "psql":
+            return read_postgres_arrow(engine, connect_args, conn, query, chunksize)
+
+        if datasource_type == "snowflake":
+            return read_snowflake_arrow(conn, query, chunksize)
+
+        # redshift_connector and the trino client have no native arrow support
+        return None
+
+    def get_driver_errors(datasource_type):
+        """Errors raised by the drivers used directly by the arrow fetch path."""
+        errors = []
+        try:
+            if datasource_type == "psql":
+                import adbc_driver_manager
+                errors.append(adbc_driver_manager.Error)
+            elif datasource_type == "snowflake":
+                from snowflake.connector.errors import Error as SnowflakeError
+                errors.append(SnowflakeError)
+        except ImportError:
+            pass
+
+        return tuple(errors)
+
+    def is_query_canceled(e):
+        # 57014 is the sqlstate of canceled queries, which ADBC and the snowflake
+        # connector raise themselves instead of wrapping psycopg2's QueryCanceled
+        return isinstance(e.__cause__, QueryCanceled) or getattr(e, "sqlstate", None) == "57014"
+
+    def run_query(queue, engine, connect_args, job_id, datasource_type, flag_file_path):
         aborted = False
         try:
             # if oracle, initialize the oracle client
@@ -126,12 +275,16 @@ def briefer_make_sqlalchemy_query():
                 import oracledb
                 oracledb.init_oracle_client()
 
+            driver_errors = get_driver_errors(datasource_type)
             try:
                 with engine.connect() as conn:
                     print(json.dumps({"type": "log", "message": "Running query"}))
-                    chunks = pd.read_sql_query(text(${JSON.stringify(
-                      renderedQuery
-                    )}), con=conn, chunksize=100000)
+                    query = ${JSON.stringify(renderedQuery)}
+                    chunks = read_arrow_chunks(engine, connect_args, conn, query, datasource_type, 100000)
+                    if chunks is None:
+                        chunks = pd.read_sql_query(text(query), con=conn, chunksize=100000)
+                    else:
+                        print(json.dumps({"type": "log", "message": "Fetching result as Arrow record batches"}))
                     page_size = ${resultOptions.pageSize}
                     dashboard_page_size = ${resultOptions.dashboardPageSize}
                     actual_page_size = max(page_size, dashboard_page_size)
@@ -139,73 +292,60 @@ def briefer_make_sqlalchemy_query():
                     columns = None
                     last_emitted_at = 0
                     count = 0
-                    df = pd.DataFrame()
+                    categories = {}
+                    dump = _BrieferQueryDumpWriter(parquet_file_path, csv_file_path)
                     print(json.dumps({"type": "log", "message": "Iterating over chunks"}))
-                    for chunk in chunks:
-                        if not os.path.exists(flag_file_path):
-                            aborted = True
-                            break
-
-                        count += len(chunk)
-                        print(json.dumps({"type": "log", "message": f"Got chunk {len(chunk)} rows"}))
-                        chunk = rename_duplicates(chunk)
-                        df = convert_df(pd.concat([df, chunk], ignore_index=True))
-                        if rows is None:
-                            rows = json.loads(df.head(actual_page_size).to_json(orient='records', date_format="iso"))
-
-                            # convert all values to string to make sure we preserve the python values
-                            # when displaying this data in the browser
-                            for row in rows:
-                                for key in row:
-                                    row[key] = str(row[key])
-
-                        if columns is None:
-                            columns = [{"name": col, "type": dtype.name} for col, dtype in chunk.dtypes.items()]
-
-                        for col in columns:
-                            if col["name"] not in chunk.columns:
-                                continue
-
-                            categories = col.get("categories", [])
-                            if len(categories) >= 1000:
-                                continue
-
-                            dtype = chunk[col["name"]].dtype
-                            if pd.api.types.is_string_dtype(dtype) or pd.api.types.is_categorical_dtype(dtype):
-                                try:
-                                    chunk_categories = chunk[col["name"]].dropna().unique()
-                                    categories.extend(list(chunk_categories))
-
-                                    # use dict.fromkeys instead of set to keep the order
-                                    categories = list(dict.fromkeys(categories))
-
-                                    categories = categories[:1000]
-                                    col["categories"] = categories
-                                except:
-                                    pass
-
-                        # only emit every 1 second
-                        now = time.time()
-                        if now - last_emitted_at > 1:
-                            result = {
-                                "version": 3,
-
-                                "type": "success",
-                                "columns": columns,
-                                "rows": rows[:page_size],
-                                "count": count,
-
-                                "page": 0,
-                                "pageSize": page_size,
-                                "pageCount": int(len(df) // page_size + 1),
-
-                                "dashboardPage": 0,
-                                "dashboardPageSize": dashboard_page_size,
-                                "dashboardPageCount": int(len(df) // dashboard_page_size + 1),
-                                "dashboardRows": rows[:dashboard_page_size],
-                            }
-                            print(json.dumps(result, ensure_ascii=False, default=str))
-                            last_emitted_at = now
+                    try:
+                        for chunk in chunks:
+                            if not os.path.exists(flag_file_path):
+                                aborted = True
+                                break
+
+                            count += len(chunk)
+                            print(json.dumps({"type": "log", "message": f"Got chunk {len(chunk)} rows"}))
+                            chunk = _briefer_convert_df(rename_duplicates(chunk))
+                            dump.write(chunk)
+                            if rows is None:
+                                # convert all values to string to make sure we preserve the python values
+                                # when displaying this data in the browser
+                                rows = _briefer_stringify_rows(chunk.head(actual_page_size))
+                                page_rows = {
+                                    "rows": rows.head(page_size).to_json(orient="records"),
+                                    "dashboardRows": rows.head(dashboard_page_size).to_json(orient="records"),
+                                }
+
+                            if columns is None:
+                                columns = [{"name": col, "type": dtype.name} for col, dtype in chunk.dtypes.items()]
+
+                            _briefer_update_categories(columns, chunk, categories)
+
+                            # only emit every 1 second
+                            now = time.time()
+                            if now - last_emitted_at > 1:
+                                result = {
+                                    "version": 3,
+
+                                    "type": "success",
+                                    "columns": columns,
+                                    "count": count,
+
+                                    "page": 0,
+                                    "pageSize": page_size,
+                                    "pageCount": int(count // page_size + 1),
+
+                                    "dashboardPage": 0,
+                                    "dashboardPageSize": dashboard_page_size,
+                                    "dashboardPageCount": int(count // dashboard_page_size + 1),
+                                }
+                                print(_briefer_json_dumps(result, page_rows, ensure_ascii=False, default=str))
+                                last_emitted_at = now
+                    except BaseException:
+                        dump.discard()
+                        raise
+
+                    # a query aborted between chunks still leaves the rows fetched so far on disk
+                    print(json.dumps({"type": "log", "message": f"Dumped {dump.rows} rows"}))
+                    dump.close()
 
                     duration_ms = None
                     # query trino to get query execution time
@@ -233,18 +373,8 @@ def briefer_make_sqlalchemy_query():
                                 break
 
 
-                    # make sure .briefer directory exists
-                    os.makedirs('/home/jupyteruser/.briefer', exist_ok=True)
-
-                    # write to parquet
-                    print(json.dumps({"type": "log", "message": f"Dumping {len(df)} rows as parquet."}))
-                    df.to_parquet(parquet_file_path, compression='gzip', index=False)
-
-                    # write to csv
-                    print(json.dumps({"type": "log", "message": f"Dumping {len(df)} rows as csv."}))
-                    df.to_csv(csv_file_path, index=False)
-
                     if aborted or not os.path.exists(flag_file_path):
+                        dump.discard()
                         print(json.dumps({"type": "log", "message": f"Query aborted 1 {aborted} {os.path.exists(flag_file_path)}"}))
                         result = {
                             "type": "abort-error",
@@ -258,24 +388,22 @@ def briefer_make_sqlalchemy_query():
 
                         "type": "success",
                         "columns": columns,
-                        "rows": rows[:page_size],
                         "count": count,
 
                         "page": 0,
                         "pageSize": 50,
-                        "pageCount": int(len(df) // page_size + 1),
+                        "pageCount": int(count // page_size + 1),
 
                         "dashboardPage": 0,
                         "dashboardPageSize": dashboard_page_size,
-                        "dashboardPageCount": int(len(df) // dashboard_page_size + 1),
-                        "dashboardRows": rows[:dashboard_page_size],
+                        "dashboardPageCount": int(count // dashboard_page_size + 1),
 
                         "queryDurationMs": duration_ms,
                     }
-                    print(json.dumps(result, ensure_ascii=False, default=str))
+                    print(_briefer_json_dumps(result, page_rows, ensure_ascii=False, default=str))
                 queue.put(None)
-            except (DatabaseError, DBAPIError) as e:
-                if isinstance(e.__cause__, QueryCanceled):
+            except (DatabaseError, DBAPIError, *driver_errors) as e:
+                if is_query_canceled(e):
                     error = {
                         "type": "abort-error",
                         "message": "Query aborted",
@@ -297,13 +425,16 @@ def briefer_make_sqlalchemy_query():
     flag_file_path = ${JSON.stringify(flagFilePath)}
     print(json.dumps({"type": "log", "message": "Connecting to database"}))
 
+    connect_args = {}
     if datasource_type == "psql":
         try:
             # set timeout of queries to 10 minutes
+            connect_args = {"options": "-c statement_timeout=600000"}
             engine = create_engine(${JSON.stringify(
               databaseUrl
-            )}, connect_args={"options": "-c statement_timeout=600000"})
+            )}, connect_args=connect_args)
         except:
+            connect_args = {}
             engine = create_engine(${JSON.stringify(databaseUrl)})
     else:
         engine = create_engine(${JSON.stringify(databaseUrl)})
@@ -319,6 +450,8 @@ def briefer_make_sqlalchemy_query():
         if process is not None and process.is_alive():
             process.terminate()
             process.join()
+            # the runner got killed mid fetch, drop whatever it left half written
+            _BrieferQueryDumpWriter(parquet_file_path, csv_file_path).discard()
 
     try:
         os.makedirs('/home/jupyteruser/.briefer', exist_ok=True)
@@ -326,7 +459,7 @@ def briefer_make_sqlalchemy_query():
         open(flag_file_path, "a").close()
 
         queue = multiprocessing.Queue()
-        process = multiprocessing.Process(target=run_query, args=(queue, engine, job_id, datasource_type, flag_file_path))
+        process = multiprocessing.Process(target=run_query, args=(queue, engine, connect_args, job_id, datasource_type, flag_file_path))
         process.start()
 
         while process.is_alive():
@@ -436,9 +569,16 @@ export async function getSQLAlchemySchema(
   const code = `
 import csv
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sqlalchemy import create_engine
 from sqlalchemy import inspect
 from sqlalchemy import text
+from sqlalchemy.engine.default import DefaultDialect
+from sqlalchemy.engine.reflection import ObjectKind
+
+# the fingerprints and tables of the schemas read by previous refreshes, so
+# schemas that didn't change since are not read again
+briefer_schema_cache = globals().get("briefer_schema_cache", {})
 
 class BrieferAggregateException(Exception):
     def __init__(self, exceptions):
@@ -494,40 +634,171 @@ def get_columns(engine, inspector, table_name, schema_name):
 
     return inspector.get_columns(table_name, schema=schema_name)
 
-def schema_from_tables(engine, inspector, tables, default_schema):
+def get_schema_columns(engine, inspector, schema_name, table_names):
+    """
+    The columns of the tables of a schema read with a single query, by table
+    name, or None when the dialect reflects tables one at a time.
+    """
+    if ${JSON.stringify(ds.type)} == "redshift":
+        with engine.connect() as conn:
+            columns_query = """
+                SELECT table_name, column_name, data_type
+                FROM svv_columns
+                WHERE table_schema = :schema
+                ORDER BY table_name, ordinal_position
+            """
+            rows = conn.execute(text(columns_query), {"schema": schema_name}).fetchall()
+
+        columns = {table_name: [] for table_name in table_names}
+        for table_name, column_name, data_type in rows:
+            if table_name in columns:
+                columns[table_name].append({"name": column_name, "type": data_type})
+        return columns
+
+    # postgres and oracle reflect every table of a schema at once
+    if type(engine.dialect).get_multi_columns is DefaultDialect.get_multi_columns:
+        return None
+
+    columns = inspector.get_multi_columns(schema=schema_name, filter_names=table_names, kind=ObjectKind.ANY)
+    return {table_name: columns.get((schema_name, table_name), []) for table_name in table_names}
+
+def get_schema_fingerprint(engine, schema_name):
+    """
+    Something that changes whenever tables of a schema are altered, or None
+    when the database doesn't keep track of it.
+    """
+    queries = {
+        "postgresql": """
+            SELECT md5(string_agg(
+                a.attrelid::text || ':' || a.attnum || ':' || a.attname || ':' || a.atttypid || ':' || a.atttypmod,
+                ',' ORDER BY a.attrelid, a.attnum
+            ))
+            FROM pg_catalog.pg_attribute a
+            JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema
+              AND a.attnum > 0
+              AND NOT a.attisdropped
+              AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+        """,
+        "oracle": """
+            SELECT MAX(last_ddl_time)
+            FROM all_objects
+            WHERE owner = :schema AND object_type IN ('TABLE', 'VIEW')
+        """,
+        "mssql": """
+            SELECT MAX(o.modify_date)
+            FROM sys.objects o
+            JOIN sys.schemas s ON s.schema_id = o.schema_id
+            WHERE s.name = :schema AND o.type IN ('U', 'V')
+        """,
+        "snowflake": """
+            SELECT MAX(last_ddl)
+            FROM information_schema.tables
+            WHERE table_schema = :schema
+        """,
+    }
+    query = queries.get(engine.dialect.name)
+    if query is None:
+        return None
+
+    try:
+        # oracle and snowflake give schema names in lower case
+        schema = schema_name
+        if engine.dialect.requires_name_normalize:
+            schema = engine.dialect.denormalize_name(schema_name)
+        with engine.connect() as conn:
+            fingerprint = conn.execute(text(query), {"schema": schema}).scalar()
+    except Exception as e:
+        print(json.dumps({"log": f"Failed to get fingerprint of schema {schema_name}: {str(e)}"}))
+        return None
+
+    return None if fingerprint is None else str(fingerprint)
+
+def read_tables(engine, inspector, schema_name, table_names):
+    """
+    Yields the name and the columns of each table of a schema as soon as they
+    are read, or its name and the exception raised reading it. The tables are
+    read with a single query when the dialect can, or else 8 at a time.
+    """
+    try:
+        schema_columns = get_schema_columns(engine, inspector, schema_name, table_names)
+    except Exception as e:
+        print(json.dumps({"log": f"Failed to get columns of schema {schema_name}, getting them by table: {str(e)}"}))
+        schema_columns = None
+
+    if schema_columns is not None:
+        for table_name in table_names:
+            yield table_name, schema_columns[table_name], None
+        return
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {
+            executor.submit(get_columns, engine, inspector, table_name, schema_name): table_name
+            for table_name in table_names
+        }
+        for future in as_completed(futures):
+            try:
+                columns = future.result()
+            except Exception as e:
+                yield futures[future], None, e
+                continue
+            yield futures[future], columns, None
+
+def print_table(schema_name, table_name, columns, default_schema):
+    progress = {
+        "type": "progress",
+        "schema": schema_name,
+        "tableName": table_name,
+        "table": {
+            "columns": columns
+        },
+        "defaultSchema": default_schema
+    }
+    print(json.dumps(progress, default=str))
+
+def schema_from_tables(engine, inspector, tables, default_schema, data_source_id):
     made_progress = False
     exceptions = []
+    schemas = {}
     for table in tables:
         parts = table.split(".")
         if len(parts) < 2:
             print(json.dumps({"log": f"Table {table} does not have a schema"}))
             continue
-        schema_name = parts[0]
-        table_name = ".".join(parts[1:])
-        print(json.dumps({"log": f"Getting schema for table {table}"}))
-        columns = []
-        try:
-            for column in get_columns(engine, inspector, table_name, schema_name):
-                columns.append({
-                    "name": column["name"],
-                    "type": str(column["type"])
-                })
-        except Exception as e:
-            print(json.dumps({"log": f"Got error when trying to get columns for table {table}: {str(e)}"}))
-            exceptions.append(e)
+        schemas.setdefault(parts[0], []).append(".".join(parts[1:]))
+
+    for schema_name, table_names in schemas.items():
+        # taken before the tables are read, so that a change made while they
+        # are gets them read again by the next refresh
+        fingerprint = get_schema_fingerprint(engine, schema_name)
+        version = (fingerprint, sorted(table_names))
+        cache_key = (data_source_id, schema_name)
+        cached = briefer_schema_cache.get(cache_key)
+        if fingerprint is not None and cached is not None and cached[0] == version:
+            print(json.dumps({"log": f"Schema {schema_name} did not change, skipping {len(table_names)} tables"}))
+            for table_name, columns in cached[1]:
+                made_progress = True
+                print_table(schema_name, table_name, columns, default_schema)
             continue
 
-        made_progress = True
-        progress = {
-            "type": "progress",
-            "schema": schema_name,
-            "tableName": table_name,
-            "table": {
-                "columns": columns
-            },
-            "defaultSchema": default_schema
-        }
-        print(json.dumps(progress, default=str))
+        print(json.dumps({"log": f"Getting schema for {len(table_names)} tables of schema {schema_name}"}))
+        schema_tables = []
+        schema_exceptions = []
+        for table_name, columns, error in read_tables(engine, inspector, schema_name, table_names):
+            if error is not None:
+                print(json.dumps({"log": f"Got error when trying to get columns for table {schema_name}.{table_name}: {str(error)}"}))
+                schema_exceptions.append(error)
+                continue
+
+            columns = [{"name": column["name"], "type": str(column["type"])} for column in columns]
+            schema_tables.append((table_name, columns))
+            made_progress = True
+            print_table(schema_name, table_name, columns, default_schema)
+
+        exceptions += schema_exceptions
+        if fingerprint is not None and not schema_exceptions:
+            briefer_schema_cache[cache_key] = (version, schema_tables)
 
     if not made_progress and len(exceptions) > 0:
         raise BrieferAggregateException(exceptions)
@@ -557,7 +828,7 @@ def get_data_source_structure(data_source_id, credentials_info=None):
             tables = inspector.get_table_names()
             views = inspector.get_view_names()
             print(json.dumps({"log": f"Got {len(tables)} tables and {len(views)} views for BigQuery datasource"}))
-            schema_from_tables(engine, inspector, tables + views, default_schema)
+            schema_from_tables(engine, inspector, tables + views, default_schema, data_source_id)
         else:
             tables = []
             exceptions = []
@@ -571,11 +842,8 @@ def get_data_source_structure(data_source_id, credentials_info=None):
                     print(json.dumps({"log": f"Failed to get tables for schema {schema_name}: {str(e)}"}))
                     continue
 
-                if len(tables) >= 20:
-                    schema_from_tables(engine, inspector, tables, default_schema)
-                    tables = []
-
-            schema_from_tables(engine, inspector, tables, default_schema)
+            # tables are read schema by schema, and printed as they are read
+            schema_from_tables(engine, inspector, tables, default_schema, data_source_id)
             if len(tables) == 0 and len(exceptions) > 0:
                 raise BrieferAggregateException(exceptions)
     finally:
@@ -0,0 +1,173 @@
+import * as services from '@jupyterlab/services'
+import { Output } from '@briefer/types'
+import { executeCode } from './index.js'
+import { IJupyterManager } from '../jupyter'
+import { JupyterManager } from '../jupyter/manager'
+import { getVar } from '../config'
+
+// Benchmarks need a running jupyter server and take a while, so they only run
+// when asked for, eg: RUN_BENCHMARKS=1 yarn test dump.bench
+export const describeBenchmark = process.env['RUN_BENCHMARKS']
+  ? describe
+  : describe.skip
+
+// Starts a dedicated kernel and returns an executeCode replacement bound to
+// it, so tests can run python without going through the session cache.
+export async function getPythonRunner(
+  manager: IJupyterManager,
+  workspaceId: string,
+  sessionId: string
+): Promise<{ dispose: () => Promise<void>; runPython: typeof executeCode }> {
+  const serverSettings = await manager.getServerSettings(workspaceId)
+  const kernelManager = new services.KernelManager({
+    serverSettings,
+  })
+  const sessionManager = new services.SessionManager({
+    kernelManager,
+    serverSettings,
+  })
+
+  const session = await sessionManager.startNew({
+    path: sessionId,
+    type: 'notebook',
+    name: sessionId,
+    kernel: { name: 'python' },
+  })
+
+  const kernel = session.kernel
+  if (!kernel) {
+    session.dispose()
+    throw new Error(`Got null kernel for session ${sessionId}`)
+  }
+
+  return {
+    dispose: async () => {
+      await kernel.shutdown()
+      session.dispose()
+      sessionManager.dispose()
+      kernelManager.dispose()
+    },
+    runPython: async function runPython(
+      _workspaceId: string,
+      _sessionId: string,
+      code: string,
+      onOutputs: (outputs: Output[]) => void,
+      opts: { storeHistory: boolean }
+    ): ReturnType<typeof executeCode> {
+      const future = kernel.requestExecute({
+        code,
+        allow_stdin: true,
+        store_history: opts.storeHistory,
+      })
+
+      future.onIOPub = (message) => {
+        switch (message.header.msg_type) {
+          case 'stream':
+            if ('name' in message.content) {
+              onOutputs([
+                {
+                  type: 'stdio',
+                  name: message.content.name,
+                  text: message.content.text,
+                },
+              ])
+              break
+            }
+          case 'error':
+            if (
+              'ename' in message.content &&
+              'evalue' in message.content &&
+              'traceback' in message.content
+            ) {
+              onOutputs([
+                {
+                  type: 'error',
+                  ename: message.content.ename,
+                  evalue: message.content.evalue,
+                  traceback: message.content.traceback,
+                },
+              ])
+            }
+        }
+      }
+
+      return {
+        abort: async () => {},
+        promise: future.done.then(() => {}),
+      }
+    },
+  }
+}
+
+export type PythonKernel = {
+  manager: IJupyterManager
+  runPython: typeof executeCode
+}
+
+// Connects to the local jupyter server and starts a kernel before the tests
+// of the describe block it is called in, shutting both down after them.
+export function setupPythonKernel(): PythonKernel {
+  const kernel = {} as PythonKernel
+  let dispose = async () => {}
+
+  beforeAll(async () => {
+    kernel.manager = new JupyterManager(
+      'http',
+      'localhost',
+      8888,
+      getVar('JUPYTER_TOKEN')
+    )
+    const pythonRunner = await getPythonRunner(
+      kernel.manager,
+      'workspaceId',
+      'sessionId'
+    )
+    kernel.runPython = pythonRunner.runPython
+    dispose = pythonRunner.dispose
+  })
+
+  afterAll(async () => {
+    await dispose()
+    await kernel.manager.stop()
+  })
+
+  return kernel
+}
+
+// Runs code in the kernel and returns what it printed, one json value per
+// line, throwing when the code raises.
+export async function runPythonJSON<T>(
+  runPython: typeof executeCode,
+  code: string,
+  opts: { storeHistory: boolean } = { storeHistory: false }
+): Promise<T[]> {
+  const results: T[] = []
+  let error: string | null = null
+  await (
+    await runPython(
+      'workspaceId',
+      'sessionId',
+      code,
+      (outputs) => {
+        for (const output of outputs) {
+          if (output.type === 'stdio' && output.name === 'stdout') {
+            for (const line of output.text.trim().split('\n')) {
+              if (line.trim() !== '') {
+                results.push(JSON.parse(line))
+              }
+            }
+          } else if (output.type === 'error') {
+            error = `${output.ename}: ${output.evalue}`
+          }
+        }
+      },
+      opts
+    )
+  ).promise
+
+  if (error) {
+    throw new Error(error)
+  }
+
+  return results
+}
@@ -0,0 +1,187 @@
+import { DataFrame, DataFrameColumn } from '@briefer/types'
+import { VisualizationV2BlockInput } from '@briefer/editor'
+import { createVisualizationV2 } from './visualizations-v2'
+import { describeBenchmark, setupPythonKernel } from './test-utils'
+
+type BenchmarkResult = {
+  chart: string
+  rows: number
+  points: number
+  ms: number
+  cachedMs: number
+}
+
+const idColumn: DataFrameColumn = { type: 'int', name: 'id' }
+const amountColumn: DataFrameColumn = { type: 'int', name: 'amount' }
+const priceColumn: DataFrameColumn = { type: 'float', name: 'price' }
+const categoryColumn: DataFrameColumn = { type: 'str', name: 'category' }
+const createdAtColumn: DataFrameColumn = {
+  type: 'datetime64',
+  name: 'created_at',
+}
+
+const df: DataFrame = {
+  name: 'bench_df',
+  columns: [
+    idColumn,
+    amountColumn,
+    priceColumn,
+    categoryColumn,
+    createdAtColumn,
+  ],
+}
+
+function getInput(
+  chartType: VisualizationV2BlockInput['chartType'],
+  xAxis: DataFrameColumn,
+  column: DataFrameColumn,
+  groupBy: DataFrameColumn | null
+): VisualizationV2BlockInput {
+  return {
+    dataframeName: df.name,
+    chartType,
+    xAxis,
+    xAxisName: null,
+    xAxisSort: 'ascending',
+    xAxisGroupFunction: null,
+    xAxisDateFormat: null,
+    xAxisNumberFormat: null,
+    yAxes: [
+      {
+        id: 'yAxis-1',
+        name: null,
+        series: [
+          {
+            id: 'series-1',
+            chartType: null,
+            column,
+            aggregateFunction: 'sum',
+            groupBy,
+            name: null,
+            color: null,
+            groups: null,
+            dateFormat: null,
+            numberFormat: null,
+          },
+        ],
+      },
+    ],
+    histogramFormat: 'count',
+    histogramBin: { type: 'auto' },
+    filters: [],
+    dataLabels: {
+      show: false,
+      frequency: 'all',
+    },
+  }
+}
+
+describeBenchmark('.createVisualizationV2', () => {
+  const kernel = setupPythonKernel()
+
+  it('builds datasets of large charts', async () => {
+    const rows = Number(process.env['BENCHMARK_ROWS'] ?? 200_000)
+    await (
+      await kernel.runPython(
+        'workspaceId',
+        'sessionId',
+        `import numpy as np
+import pandas as pd
+_rng = np.random.default_rng(42)
+bench_df = pd.DataFrame({
+    "id": np.arange(${rows}),
+    "amount": _rng.integers(0, 1000, ${rows}),
+    "price": _rng.random(${rows}) * 100,
+    "category": _rng.choice([f"category {i}" for i in range(20)], ${rows}),
+    "created_at": pd.Timestamp("2024-01-01") + pd.to_timedelta(_rng.integers(0, 3 * 10**7, ${rows}), unit="s"),
+})
+del _rng`,
+        () => {},
+        { storeHistory: false }
+      )
+    ).promise
+
+    const charts: [string, VisualizationV2BlockInput][] = [
+      ['line', getInput('line', idColumn, priceColumn, null)],
+      [
+        'groupedLine',
+        getInput('line', createdAtColumn, priceColumn, categoryColumn),
+      ],
+      [
+        'groupedColumn',
+        getInput(
+          'groupedColumn',
+          createdAtColumn,
+          amountColumn,
+          categoryColumn
+        ),
+      ],
+      [
+        'hundredPercentStackedColumn',
+        getInput(
+          'hundredPercentStackedColumn',
+          createdAtColumn,
+          amountColumn,
+          categoryColumn
+        ),
+      ],
+      [
+        'hundredPercentStackedArea',
+        getInput(
+          'hundredPercentStackedArea',
+          amountColumn,
+          priceColumn,
+          categoryColumn
+        ),
+      ],
+      ['scatterPlot', getInput('scatterPlot', priceColumn, amountColumn, null)],
+    ]
+
+    const results: BenchmarkResult[] = []
+    for (const [chart, input] of charts) {
+      const start = Date.now()
+      const result = await (
+        await createVisualizationV2(
+          'workspaceId',
+          'sessionId',
+          df,
+          input,
+          kernel.manager,
+          kernel.runPython
+        )
+      ).promise
+      const ms = Date.now() - start
+
+      // the same chart again, which the kernel has cached by now
+      const cachedStart = Date.now()
+      const cached = await (
+        await createVisualizationV2(
+          'workspaceId',
+          'sessionId',
+          df,
+          input,
+          kernel.manager,
+          kernel.runPython
+        )
+      ).promise
+      const cachedMs = Date.now() - cachedStart
+
+      expect(result.success).toBe(true)
+      expect(cached).toEqual(result)
+      if (result.success) {
+        results.push({
+          chart,
+          rows,
+          points: result.data.dataset.reduce(
+            (n, d) => n + d.source.length,
+            0
+          ),
+          ms,
+          cachedMs,
+        })
+      }
+    }
+
+    console.table(results)
+  }, 600_000)
+})
@@ -1,98 +1,11 @@
-import * as services from '@jupyterlab/services'
-import { DataFrame, DataFrameColumn, Output } from '@briefer/types'
+import { DataFrame, DataFrameColumn } from '@briefer/types'
 import { createVisualizationV2 } from './visualizations-v2'
 import { JupyterManager } from '../jupyter/manager'
 import { getVar } from '../config'
-import { executeCode } from './index.js'
+import { getPythonRunner } from './test-utils'
 import { VisualizationV2BlockInput } from '@briefer/editor'
 import { IJupyterManager } from '../jupyter'
 
-async function getPythonRunner(
-  manager: IJupyterManager,
-  workspaceId: string,
-  sessionId: string
-): Promise<{ dispose: () => Promise<void>; runPython: typeof executeCode }> {
-  const serverSettings = await manager.getServerSettings(workspaceId)
-  const kernelManager = new services.KernelManager({
-    serverSettings,
-  })
-  const sessionManager = new services.SessionManager({
-    kernelManager,
-    serverSettings,
-  })
-
-  const session = await sessionManager.startNew({
-    path: sessionId,
-    type: 'notebook',
-    name: sessionId,
-    kernel: { name: 'python' },
-  })
-
-  const kernel = session.kernel
-  if (!kernel) {
-    session.dispose()
-    throw new Error(`Got null kernel for session ${sessionId}`)
-  }
-
-  return {
-    dispose: async () => {
-      await kernel.shutdown()
-      session.dispose()
-      sessionManager.dispose()
-      kernelManager.dispose()
-    },
-    runPython: async function runPython(
-      _workspaceId: string,
-      _sessionId: string,
-      code: string,
-      onOutputs: (outputs: Output[]) => void,
-      opts: { storeHistory: boolean }
-    ): ReturnType<typeof executeCode> {
-      const future = kernel.requestExecute({
-        code,
-        allow_stdin: true,
-        store_history: opts.storeHistory,
-      })
-
-      future.onIOPub = (message) => {
-        switch (message.header.msg_type) {
-          case 'stream':
-            if ('name' in message.content) {
-              onOutputs([
-                {
-                  type: 'stdio',
-                  name: message.content.name,
-                  text: message.content.text,
-                },
-              ])
-              break
-            }
-          case 'error':
-            if (
-              'ename' in message.content &&
-              'evalue' in message.content &&
-              'traceback' in message.content
-            ) {
-              onOutputs([
-                {
-                  type: 'error',
-                  ename: message.content.ename,
-                  evalue: message.content.evalue,
-                  traceback: message.content.traceback,
-                },
-              ])
-            }
-        }
-      }
-
-      return {
-        abort: async () => {},
-        promise: future.done.then(() => {}),
-      }
-    },
-  }
-}
-
 describe('.createVisualizationV2', () => {
   let manager: IJupyterManager
   let pythonRunner: Awaited<ReturnType<typeof getPythonRunner>>
@@ -999,4 +912,128 @@ df = pd.DataFrame({
       },
     ])
   })
+
+  describe('with more points than can be drawn', () => {
+    const bigCode = `import numpy as np
+import pandas as pd
+big_df = pd.DataFrame({'x': np.arange(100000), 'y': np.sin(np.arange(100000) / 500)})
+big_df.loc[12345, 'y'] = -1000
+big_df.loc[54321, 'y'] = 1000
+big_df['parity'] = np.where(big_df['x'] % 2 == 0, 'even', 'odd')`
+
+    const xDFColumn: DataFrameColumn = { type: 'int', name: 'x' }
+    const yDFColumn: DataFrameColumn = { type: 'float', name: 'y' }
+    const parityDFColumn: DataFrameColumn = { type: 'str', name: 'parity' }
+    const bigDF: DataFrame = {
+      name: 'big_df',
+      columns: [xDFColumn, yDFColumn, parityDFColumn],
+    }
+
+    const getInput = (
+      chartType: VisualizationV2BlockInput['chartType'],
+      groupBy: DataFrameColumn | null
+    ): VisualizationV2BlockInput => ({
+      dataframeName: 'big_df',
+      chartType,
+      xAxis: xDFColumn,
+      xAxisName: null,
+      xAxisSort: 'ascending',
+      xAxisGroupFunction: null,
+      xAxisDateFormat: null,
+      xAxisNumberFormat: null,
+      yAxes: [
+        {
+          id: 'yAxis-1',
+          name: null,
+          series: [
+            {
+              id: 'series-1',
+              chartType: null,
+              column: yDFColumn,
+              aggregateFunction: 'sum',
+              groupBy,
+              name: null,
+              color: null,
+              groups: null,
+              dateFormat: null,
+              numberFormat: null,
+            },
+          ],
+        },
+      ],
+      histogramFormat: 'count',
+      histogramBin: { type: 'auto' },
+      filters: [],
+      dataLabels: {
+        show: false,
+        frequency: 'all',
+      },
+    })
+
+    beforeEach(async () => {
+      await (
+        await pythonRunner.runPython(
+          'workspaceId',
+          'sessionId',
+          bigCode,
+          () => {},
+          { storeHistory: true }
+        )
+      ).promise
+    })
+
+    it('should downsample lines keeping their peaks', async () => {
+      const result = await (
+        await createVisualizationV2(
+          'workspaceId',
+          'sessionId',
+          bigDF,
+          getInput('line', null),
+          manager,
+          pythonRunner.runPython
+        )
+      ).promise
+
+      expect(result.success).toBe(true)
+      if (!result.success) {
+        return
+      }
+
+      expect(result.tooManyDataPoints).toBe(false)
+      expect(result.data.dataset).toHaveLength(1)
+      const values = result.data.dataset[0].source.map((row) => row['series-1'])
+      expect(values).toHaveLength(2000)
+      expect(values).toContain(1000)
+      expect(values).toContain(-1000)
+    })
+
+    it('should downsample the groups of an area chart on the same x values', async () => {
+      const result = await (
+        await createVisualizationV2(
+          'workspaceId',
+          'sessionId',
+          bigDF,
+          getInput('area', parityDFColumn),
+          manager,
+          pythonRunner.runPython
+        )
+      ).promise
+
+      expect(result.success).toBe(true)
+      if (!result.success) {
+        return
+      }
+
+      expect(result.tooManyDataPoints).toBe(false)
+      const [even, odd] = result.data.dataset
+      // even and odd rows never share an x, they only line up once downsampled
+      expect(even.source.length).toBeLessThanOrEqual(2000)
+      expect(even.source.map((row) => row['x'])).toEqual(
+        odd.source.map((row) => row['x'])
+      )
+      const oddValues = odd.source.map((row) => row['series-1'])
+      expect(oddValues).toContain(1000)
+      expect(oddValues).toContain(-1000)
+    })
+  })
 })
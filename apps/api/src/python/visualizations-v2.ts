@@ -16,8 +16,15 @@ import {
 import AggregateError from 'aggregate-error'
 import { z } from 'zod'
 import { logger } from '../logger.js'
+import { getChartCacheCode } from './chart-cache.js'
+import { getDuckDBAggregationCode } from './duckdb-aggregation.js'
+import { AggregationEngine } from '../config/base.js'
 
-function getCode(dataframe: DataFrame, input: VisualizationV2BlockInput) {
+function getCode(
+  dataframe: DataFrame,
+  input: VisualizationV2BlockInput,
+  engine: AggregationEngine
+) {
   const filters = input.filters.filter((f) => {
     if (isUnfinishedVisualizationFilter(f)) {
       return false
@@ -34,9 +41,24 @@ from datetime import datetime
 import numpy as np
 import math
 from jinja2 import Template
-
+${getChartCacheCode()}
+${getDuckDBAggregationCode()}
 class _BrieferNpEncoder(json.JSONEncoder):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timestamps = {}
+
     def default(self, obj):
+        # datasets can have millions of these, skip the slower dtype checks for them
+        if isinstance(obj, np.integer):
+            return int(obj)
+        if isinstance(obj, pd.Timestamp):
+            # the same x values repeat in the dataset of every group
+            key = (obj, obj.tzinfo)
+            text = self.timestamps.get(key)
+            if text is None:
+                text = self.timestamps[key] = str(obj)
+            return text
         if pd.api.types.is_integer_dtype(obj):
             return int(obj)
         if pd.api.types.is_float_dtype(obj):
@@ -80,7 +102,56 @@ def _briefer_convert_to_utc_safe(datetime_series, comparison_value):
 
     return localized_series, comparison_value_utc
 
-def _briefer_create_visualization(df, options):
+def _briefer_row_values(column):
+    """
+    A column of df.values as a list of the values iterrows gives for it. It
+    builds each row as a Series of df.values, so numbers are numpy scalars,
+    which json encodes like python ones, and datetimes are Timestamps.
+    """
+    if column.dtype.kind in "iufc":
+        return column.tolist()
+    if column.dtype.kind in "mM":
+        return list(pd.Series(column))
+    return list(column)
+
+def _briefer_lttb(x, y, points):
+    """
+    Positions of the points of a line Largest-Triangle-Three-Buckets keeps to
+    draw it with the given number of points. The first and last points are
+    always kept, the others are split in buckets and each bucket keeps the
+    point that makes the largest triangle with the point kept before it and
+    the average of the next bucket, which preserves the peaks and the shape
+    of the line. x must be sorted, in either direction.
+    """
+    n = len(x)
+    if n <= points or points < 3:
+        return np.arange(n)
+
+    x = x - x[0]
+    edges = np.linspace(1, n - 1, points - 1).astype(np.intp)
+    kept = np.empty(points, dtype=np.intp)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + np.argmax(areas)
+        kept[i + 1] = a
+    return kept
+
+def _briefer_min_max(keys, y):
+    """Positions of the lowest and of the highest y of each key."""
+    lows = np.lexsort((y, keys))
+    highs = np.lexsort((-y, keys))
+    sorted_keys = keys[lows]
+    starts = np.concatenate([[0], np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1])
+    return lows[starts], highs[starts]
+
+def _briefer_create_visualization(df, options, aggregation_engine="pandas"):
     colors = [
         "#5470c6",
         "#91cc75",
@@ -174,6 +245,58 @@ def _briefer_create_visualization(df, options):
 
         return df
 
+    def duckdb_group_dataframe(df, where, options, series):
+        """
+        The same as group_dataframe for the rows of df where matches, which
+        DuckDB filters, groups and aggregates, or None when it can't do it
+        like pandas.
+        """
+        if not options["xAxis"]:
+            return None
+
+        x_name = options["xAxis"]["name"]
+        y_group_by = series["groupBy"]["name"] if series["groupBy"] else None
+        if y_group_by in ("index", "_grouped", series["id"]):
+            return None
+        for column_name in [x_name, y_group_by, series["column"]["name"]]:
+            if column_name and (column_name not in df.columns or not _briefer_duckdb_supported(df[column_name])):
+                return None
+
+        x_sql = _briefer_duckdb_identifier(x_name)
+        x_dtype = df[x_name].dtype
+        if x_dtype.kind == "M" and options["xAxisGroupFunction"]:
+            # the starts of the periods group_dataframe groups datetimes by
+            parts = {
+                "year": "year",
+                "quarter": "quarter",
+                "month": "month",
+                "week": "week",
+                "date": "day",
+                "hours": "hour",
+                "minutes": "minute",
+                "seconds": "second"
+            }
+            x_sql = f"date_trunc('{parts.get(options['xAxisGroupFunction'], 'second')}', {x_sql})"
+            x_dtype = np.dtype("datetime64[ns]")
+
+        keys = [(x_sql, x_dtype)]
+        if y_group_by:
+            keys.append((_briefer_duckdb_identifier(y_group_by), df[y_group_by].dtype))
+        grouped = _briefer_duckdb_group_by(
+            df,
+            keys,
+            [(series["column"]["name"], series["aggregateFunction"] or "count")],
+            where
+        )
+        if grouped is None:
+            return None
+
+        columns = {"index": np.arange(len(grouped[0])), "_grouped": grouped[0]}
+        if y_group_by:
+            columns[y_group_by] = grouped[1]
+        columns[series["id"]] = grouped[-1]
+        return pd.DataFrame(columns)
+
     def sort_dataframe(df, options):
         if options["xAxis"]:
             return df.sort_values(
@@ -186,17 +309,118 @@ def _briefer_create_visualization(df, options):
 
         return df
 
+    # line and area series with more points than this get downsampled, it is
+    # about two points per pixel of a wide chart
+    downsample_points = 2000
+
+    def downsample_series_df(df, result, options, series):
+        """
+        Returns the rows of a line or area series downsampled to about
+        downsample_points per group, or None when it doesn't need to or can't
+        be downsampled.
+
+        Lines are downsampled with LTTB, which keeps points of the line as
+        they are. When the x values of the series have to line up, as the
+        values of the same x get stacked, normalized or filled in for other
+        groups, the x axis of the chart is split in downsample_points / 2
+        buckets instead. Each group keeps its lowest and highest point of
+        each bucket, in the order they come, moved to the start and to the
+        middle of the bucket.
+        """
+        x_name = options["xAxis"]["name"] if options["xAxis"] else None
+        y_name = series["id"]
+        if not x_name or len(result) <= downsample_points:
+            return None
+        if result[x_name].dtype.kind not in "iufM" or result[y_name].dtype.kind not in "biuf":
+            return None
+
+        if series["groupBy"]:
+            codes, _ = pd.factorize(result[series["groupBy"]["name"]], use_na_sentinel=False)
+        else:
+            codes = np.zeros(len(result), dtype=np.intp)
+        order = np.argsort(codes, kind="stable")
+        groups = np.split(order, np.flatnonzero(np.diff(codes[order])) + 1)
+        if max(len(rows) for rows in groups) <= downsample_points:
+            return None
+
+        is_datetime = result[x_name].dtype.kind == "M"
+
+        def to_numbers(column):
+            if is_datetime:
+                return pd.DatetimeIndex(column).as_unit("ns").asi8
+            return column.to_numpy(dtype=np.int64 if column.dtype.kind in "iu" else float)
+
+        x = to_numbers(result[x_name])
+        y = np.nan_to_num(result[y_name].to_numpy(dtype=float, na_value=np.nan))
+
+        def stacked_or_normalized(chart_type):
+            _, _, is_stacked, is_normalized = extract_chart_type(chart_type)
+            return is_stacked or is_normalized
+
+        on_grid = any(
+            s["groupBy"] or stacked_or_normalized(s["chartType"] or options["chartType"])
+            for y_axis in options["yAxes"] for s in y_axis["series"] if s.get("column")
+        )
+        if not on_grid:
+            kept = np.concatenate([rows[_briefer_lttb(x[rows].astype(float), y[rows], downsample_points)] for rows in groups])
+            return result.iloc[np.sort(kept)]
+
+        # the same buckets for every series, out of the x values of the whole chart
+        buckets = downsample_points // 2
+        chart_x = to_numbers(chart_x_values(df, x_name))
+        x_min, x_max = min(chart_x.min(), x.min()), max(chart_x.max(), x.max())
+        if x.dtype.kind == "f":
+            width = (x_max - x_min) / buckets or 1.0
+            bucket = np.clip(np.floor((x - x_min) / width), 0, buckets - 1).astype(np.int64)
+            half = width / 2
+        else:
+            width = max(-(-(x_max - x_min) // buckets), 2)
+            if is_datetime and width > 10**9:
+                # buckets of whole seconds, so their times read well
+                width = -(-width // (2 * 10**9)) * 2 * 10**9
+                x_min -= x_min % 10**9
+            bucket = np.clip((x - x_min) // width, 0, buckets - 1)
+            half = width // 2
+        bucket_starts = x_min + bucket * width
+
+        lows, highs = _briefer_min_max(codes * buckets + bucket, y)
+        lows_first = x[lows] <= x[highs]
+        first = np.where(lows_first, lows, highs)
+        second = np.where(lows_first, highs, lows)[lows != highs]
+        kept = np.concatenate([first, second])
+        snapped = np.concatenate([bucket_starts[first], bucket_starts[second] + half])
+
+        order = np.argsort(kept)
+        downsampled = result.iloc[kept[order]].copy()
+        snapped = snapped[order]
+        if is_datetime:
+            snapped = pd.to_datetime(snapped, unit="ns")
+            if result[x_name].dt.tz is not None:
+                snapped = snapped.tz_localize("UTC").tz_convert(result[x_name].dt.tz)
+        downsampled[x_name] = snapped
+        return downsampled
+
     def get_series_df(df, options, y_axis, series):
-        # Prepare data by grouping
-        result = group_dataframe(df.copy(), options, y_axis, series)
+        result = None
+        if duckdb_where is not None:
+            result = duckdb_group_dataframe(df, duckdb_where, options, series)
+        if result is None:
+            # Prepare data by grouping
+            result = group_dataframe(apply_filters(df, filters).copy(), options, y_axis, series)
         if "_grouped" in result:
             result[options["xAxis"]["name"]] = result["_grouped"]
             result = result.drop(columns=["_grouped"])
 
         result = sort_dataframe(result, options)
 
+        downsampled = None
+        if extract_chart_type(series["chartType"] or options["chartType"])[0] == "line":
+            downsampled = downsample_series_df(df, result, options, series)
+
         capped = False
-        if len(result) > 50000:
+        if downsampled is not None:
+            result = downsampled
+        elif len(result) > 50000:
             if options["chartType"] == "number" or options["chartType"] == "trend":
                 # number chart type are never considered capped we just pick the tail
                 # they don't ever care about more than 2 points anyways
@@ -214,11 +438,10 @@ def _briefer_create_visualization(df, options):
 
         return result, capped
 
-    def apply_filters(df, filters):
+    def render_filters(filters):
+        """The filters with their rendered values, leaving out the ones that fail to render."""
+        rendered = []
         for filter in filters:
-            column_name = filter['column']['name']
-            operator = filter['operator']
-
             value = _briefer_render_filter_value(filter)
 
             # if the value is None, rendering failed, skip this filter
@@ -228,6 +451,14 @@ def _briefer_create_visualization(df, options):
             if filter["value"] != value:
                 filter["renderedValue"] = value
 
+            rendered.append((filter, value))
+        return rendered
+
+    def apply_filters(df, filters):
+        for filter, value in filters:
+            column_name = filter['column']['name']
+            operator = filter['operator']
+
             if pd.api.types.is_numeric_dtype(df[column_name]):
                 value = pd.to_numeric(value, errors='coerce')
                 if operator == 'eq':
@@ -301,7 +532,48 @@ def _briefer_create_visualization(df, options):
 
         return "category"
 
-    df = apply_filters(df, options["filters"])
+    def duckdb_filters(df, filters):
+        """The SQL condition and parameters of all filters, or None when any of them can't be written in SQL."""
+        conditions = []
+        params = []
+        for filter, value in filters:
+            column_name = filter["column"]["name"]
+            condition = None
+            if column_name in df.columns:
+                condition = _briefer_duckdb_filter(df, column_name, filter["operator"], value)
+            if condition is None:
+                return None
+            conditions.append(f"({condition[0]})")
+            params += condition[1]
+        return " AND ".join(conditions) or "TRUE", params
+
+    def chart_x_values(df, x_name):
+        """The x values of the rows of the chart, only the lowest and the highest when DuckDB filters them."""
+        if filters:
+            c = _briefer_duckdb_identifier(x_name)
+            values = _briefer_duckdb_query(
+                df,
+                (f"SELECT min({c}), max({c}) FROM _briefer_df WHERE {duckdb_where[0]}", duckdb_where[1]),
+                [df[x_name].dtype] * 2
+            )
+            if values is not None:
+                return pd.concat(values).dropna()
+        return apply_filters(df, filters)[x_name].dropna()
+
+    # with the duckdb engine, DuckDB filters the rows of charts with an x axis
+    # as it groups them, and pandas only filters them when DuckDB can't. From
+    # here on, filters are the ones df still has to be filtered by
+    filters = render_filters(options["filters"])
+    duckdb_where = None
+    if aggregation_engine == "duckdb" and options["xAxis"] and options["chartType"] != "histogram":
+        duckdb_where = duckdb_filters(df, filters)
+        if duckdb_where is None:
+            df = apply_filters(df, filters)
+            filters = []
+            duckdb_where = ("TRUE", [])
+    else:
+        df = apply_filters(df, filters)
+        filters = []
 
     x_axis = {
         "type": get_axis_type(df, options["xAxis"], options),
@@ -418,18 +690,26 @@ def _briefer_create_visualization(df, options):
                     group_options[g_option["group"]] = g_option
 
                 y_name = series["id"]
-
-                # Group rows by their group value first to avoid iterating through all rows for each group
-                grouped_rows = {}
+                x_name = options["xAxis"]["name"] if options["xAxis"] else None
+
+                # take whole columns out of the same array iterrows builds its rows from,
+                # so values keep the types they had when the datasets were built row by row
+                values = series_dataframe.values
+                ys = values[:, series_dataframe.columns.get_loc(y_name)]
+                xs = values[:, series_dataframe.columns.get_loc(x_name)] if x_name else None
+
+                if should_normalize and x_name:
+                    # one total per x value, the first series of the y axis to have it sets it
+                    sums = series_dataframe.groupby(x_name, sort=False)[y_name].sum()
+                    for x_value, total in zip(sums.index, sums.to_numpy()):
+                        if not totals.get(x_value):
+                            totals[x_value] = total
+
+                # positions of the rows of each group, in the order of the dataframe
                 if series["groupBy"]:
-                    for _, row in series_dataframe.iterrows():
-                        group_value = row[series["groupBy"]["name"]]
-                        if group_value not in grouped_rows:
-                            grouped_rows[group_value] = []
-                        grouped_rows[group_value].append(row)
+                    grouped_rows = series_dataframe.groupby(series["groupBy"]["name"], sort=False, observed=True).indices
                 else:
-                    # Store just the rows without the index for consistency
-                    grouped_rows[None] = [row for _, row in series_dataframe.iterrows()]
+                    grouped_rows = {None: slice(None)}
 
                 for group in groups:
                     color_index += 1
@@ -445,26 +725,18 @@ def _briefer_create_visualization(df, options):
                         "source": [],
                     }
 
-                    # Process only rows for this specific group
-                    group_rows = grouped_rows.get(group, [])
-                    for row in group_rows:  # No need to unpack since we're just storing rows
-                        y_value = row[y_name]
-                        row_data = {}
-
-                        if options["xAxis"]:
-                            x_name = options["xAxis"]["name"]
-                            x_value = row[x_name]
-                            row_data[x_name] = x_value
-
+                    rows = grouped_rows.get(group, [])
+                    group_ys = _briefer_row_values(ys[rows])
+                    if x_name:
+                        group_xs = _briefer_row_values(xs[rows])
                         if should_normalize:
-                            total = totals.get(x_value)
-                            if not total:
-                                total = series_dataframe[series_dataframe[x_name] == x_value][y_name].sum()
-                                totals[x_value] = total
-                            y_value = y_value / total if total != 0 else 1
-
-                        row_data[y_name] = y_value
-                        dataset["source"].append(row_data)
+                            group_ys = [
+                                y_value / totals[x_value] if totals.get(x_value) else 1
+                                for x_value, y_value in zip(group_xs, group_ys)
+                            ]
+                        dataset["source"] = [{x_name: x_value, y_name: y_value} for x_value, y_value in zip(group_xs, group_ys)]
+                    else:
+                        dataset["source"] = [{y_name: y_value} for y_value in group_ys]
 
                     data["dataset"].append(dataset)
 
@@ -567,9 +839,20 @@ def _briefer_create_visualization(df, options):
 
 
 if "${dataframe.name}" in globals():
-    df = ${dataframe.name}.copy()
-    options = json.loads(${JSON.stringify(strInput)})
-    _briefer_create_visualization(df, options)
+    _briefer_chart_cache.run(
+        ${dataframe.name},
+        _briefer_chart_cache.key(
+            json.loads(${JSON.stringify(JSON.stringify(filters))}),
+            _briefer_render_filter_value,
+            "v2",
+            json.loads(${JSON.stringify(strInput)})
+        ),
+        lambda: _briefer_create_visualization(
+            ${dataframe.name}.copy(),
+            json.loads(${JSON.stringify(strInput)}),
+            "${engine}"
+        )
+    )
 else:
     output = json.dumps({
         "type":"result",
@@ -612,11 +895,12 @@ export async function createVisualizationV2(
   dataframe: DataFrame,
   input: VisualizationV2BlockInput,
   jupyterManager: IJupyterManager,
-  executePython: typeof executeCode
+  executePython: typeof executeCode,
+  engine: AggregationEngine = 'pandas'
 ): Promise<CreateVisualizationTask> {
   await jupyterManager.ensureRunning(workspaceId)
 
-  const code = getCode(dataframe, input)
+  const code = getCode(dataframe, input, engine)
 
   let outputs: Output[] = []
   const { promise: execute, abort } = await executePython(
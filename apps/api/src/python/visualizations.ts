@@ -27,6 +27,8 @@ import { logger } from '../logger.js'
 import { z } from 'zod'
 import AggregateError from 'aggregate-error'
 import { getJupyterManager } from '../jupyter/index.js'
+import { getQueryParquetPathCode } from './query/dump.js'
+import { getChartCacheCode } from './chart-cache.js'
 
 type Order = 'ascending' | 'descending'
 
@@ -102,7 +104,7 @@ function getCode(
 import altair as alt
 import pandas as pd
 from jinja2 import Template
-
+${getChartCacheCode()}
 axisTitlePadding = 10
 
 def _briefer_get_timezone(series):
@@ -871,16 +873,16 @@ def _briefer_create_visualization(
 
 if not "${dataframe.name}" in globals():
     try:
+        import os
         import pandas as pd
-        ${dataframe.name} = pd.read_parquet("/home/jupyteruser/.briefer/query-${
-    dataframe.id
-  }.parquet.gzip")
+        ${dataframe.name} = pd.read_parquet(${getQueryParquetPathCode(
+          dataframe.id
+        )}, engine="pyarrow")
     except:
         pass
 
 if "${dataframe.name}" in globals():
-    _briefer_create_visualization(
-        ${dataframe.name}.copy(),
+    _briefer_visualization_args = [
         "${chartType}",
         ${xAxis ? JSON.stringify(xAxis.name) : 'None'},
         ${xAxisName ? `"${xAxisName}"` : 'None'},
@@ -893,7 +895,21 @@ if "${dataframe.name}" in globals():
         json.loads(${JSON.stringify(JSON.stringify(showDataLabels))}),
         ${numberValuesFormat ? `"${numberValuesFormat}"` : 'None'},
         json.loads(${JSON.stringify(JSON.stringify(filtering))})
+    ]
+    _briefer_chart_cache.run(
+        ${dataframe.name},
+        _briefer_chart_cache.key(
+            _briefer_visualization_args[-1],
+            _briefer_render_filter_value,
+            "altair",
+            _briefer_visualization_args
+        ),
+        lambda: _briefer_create_visualization(
+            ${dataframe.name}.copy(),
+            *_briefer_visualization_args
+        )
     )
+    del _briefer_visualization_args
 else:
     print(json.dumps({"type": "result", "success": False, "reason": "dataframe-not-found"}))`
 
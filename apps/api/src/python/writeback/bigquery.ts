@@ -3,6 +3,15 @@ import { Writeback } from './index.js'
 import { executeCode, renderJinja } from '../index.js'
 import { WriteBackResult, jsonString } from '@briefer/types'
 import { logger } from '../../logger.js'
+import { z } from 'zod'
+
+// printed by the kernel as the chunks of the dataframe are loaded
+const WriteBackProgress = z.object({
+  _tag: z.literal('progress'),
+  step: z.string(),
+  loadedRows: z.number(),
+  totalRows: z.number(),
+})
 
 export async function writebackBigQuery(
   workspaceId: string,
@@ -110,6 +119,24 @@ export async function writebackBigQuery(
                     if (line === '') {
                       continue
                     }
+
+                    const progress = jsonString
+                      .pipe(WriteBackProgress)
+                      .safeParse(line)
+                    if (progress.success) {
+                      logger().info(
+                        {
+                          workspaceId,
+                          sessionId,
+                          dataframeName,
+                          tableName,
+                          ...progress.data,
+                        },
+                        `Writeback progress`
+                      )
+                      continue
+                    }
+
                     const parsed = jsonString
                       .pipe(WriteBackResult)
                       .safeParse(line)
@@ -189,19 +216,22 @@ function getCode(
 ): string {
   const code = `
 def _briefer_writeback(df, table_name, overwrite_table, on_conflict, on_conflict_columns):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
     from google.api_core.exceptions import BadRequest
     from google.api_core.exceptions import Conflict
     from google.api_core.exceptions import NotFound
     from google.api_core.exceptions import PermissionDenied
+    import math
     import random
     import string
     import os
     import tempfile
 
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".parquet.gz")
     try:
         from google.cloud import bigquery
         from google.oauth2 import service_account
+        import pyarrow as pa
+        import pyarrow.parquet as pq
         import json
         import datetime
 
@@ -246,9 +276,6 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict, on_conflict
         table_name = f"{project_id}.{table_name}"
         client = bigquery.Client(credentials=credentials, project=project_id)
 
-        # Convert the dataframe to Parquet and save to temp_file
-        df.to_parquet(temp_file.name, compression='gzip', index=False, engine="fastparquet")
-
         job_config = bigquery.LoadJobConfig()
         job_config.source_format = bigquery.SourceFormat.PARQUET
 
@@ -261,14 +288,106 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict, on_conflict
             job_config.autodetect = True
             pass
 
+        # the dataframe is loaded in chunks of about 256MB, each with its own
+        # load job, so large dataframes are uploaded a few chunks at a time
+        # and the rows loaded are reported as chunks are done
+        chunk_bytes = 256 * 1024 * 1024
+        df_bytes = max(int(df.memory_usage(index=False, deep=True).sum()), 1)
+        chunk_rows = max(math.ceil(len(df) * chunk_bytes / df_bytes), 1)
+        chunks = [df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows)] or [df]
+
+        # the parquet schema comes from the whole dataframe, so every chunk
+        # gets the same one, even when a column is all null in some of them
+        try:
+            arrow_schema = pa.Schema.from_pandas(df, preserve_index=False)
+        except pa.ArrowException:
+            # objects arrow doesn't convert, which fastparquet writes as it
+            # can, inferring the types of each file, so there is a single one
+            arrow_schema = None
+            chunks = [df]
+
+        def write_parquet(chunk, path):
+            if arrow_schema is None:
+                chunk.to_parquet(path, compression='gzip', index=False, engine="fastparquet")
+                return
+
+            arrow_table = pa.Table.from_pandas(chunk, schema=arrow_schema, preserve_index=False)
+
+            # BigQuery doesn't load timestamps with nanoseconds
+            pq.write_table(
+                arrow_table,
+                path,
+                compression="snappy",
+                coerce_timestamps="us",
+                allow_truncated_timestamps=True
+            )
+
+        def load_chunk(chunk, destination):
+            chunk_file = tempfile.NamedTemporaryFile(delete=False, suffix=".parquet")
+            chunk_file.close()
+            try:
+                write_parquet(chunk, chunk_file.name)
+                with open(chunk_file.name, "rb") as f:
+                    # files over 5MB go up in a resumable upload, which retries
+                    # the parts that failed to upload instead of starting over
+                    job = client.load_table_from_file(f, destination, job_config=job_config)
+                return job.result().output_rows
+            finally:
+                os.unlink(chunk_file.name)
+
+        def load_dataframe(destination, exists):
+            """
+            Loads the chunks of the dataframe into destination, four at a time,
+            printing the rows loaded so far as each chunk is done. When the
+            table doesn't exist yet, the first chunk creates it before the
+            others are loaded. Returns the number of rows loaded.
+            """
+            loaded_rows = 0
+
+            def report(rows):
+                nonlocal loaded_rows
+                loaded_rows += rows
+                progress = {
+                    "_tag": "progress",
+                    "step": step,
+                    "loadedRows": loaded_rows,
+                    "totalRows": len(df)
+                }
+                print(json.dumps(progress), flush=True)
+
+            pending = chunks
+            if not exists:
+                report(load_chunk(chunks[0], destination))
+                pending = chunks[1:]
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(load_chunk, chunk, destination) for chunk in pending]
+                try:
+                    for future in as_completed(futures):
+                        report(future.result())
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+            return loaded_rows
+
         def writeback_new_table():
             nonlocal step
             step = "insert"
-            job = client.load_table_from_file(temp_file, table_name, job_config=job_config)
-            result = job.result()
-            inserted_rows = result.output_rows
-            updated_rows = 0
-            ignored_rows = 0
+            if len(chunks) == 1:
+                inserted_rows = load_dataframe(table_name, exists=False)
+            else:
+                # the chunks are staged in another table, which is copied over
+                # once they are all loaded, so a writeback that fails doesn't
+                # leave part of the dataframe in the new table
+                random_part = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
+                staging_table_name = f"{table_name}_{random_part}"
+                try:
+                    inserted_rows = load_dataframe(staging_table_name, exists=False)
+                    client.copy_table(staging_table_name, table_name).result()
+                finally:
+                    client.delete_table(staging_table_name, not_found_ok=True)
 
             result = {
                 "_tag": "success",
@@ -284,16 +403,40 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict, on_conflict
 
         def writeback_overwrite_table():
             nonlocal step
-            # delete all rows
-            step = "cleanup"
-            query = f"DELETE FROM {table_name} WHERE 1=1"
-            job = client.query(query)
-            job.result()
+            if len(chunks) == 1:
+                # delete all rows
+                step = "cleanup"
+                query = f"DELETE FROM {table_name} WHERE 1=1"
+                job = client.query(query)
+                job.result()
+
+                step = "insert"
+                inserted_rows = load_dataframe(table_name, exists=True)
+            else:
+                # the chunks are staged in another table, and the rows of the
+                # table are only replaced with them once they are all loaded,
+                # in a single transaction, so a writeback that fails leaves
+                # the table as it was
+                step = "insert"
+                random_part = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
+                staging_table_name = f"{table_name}_{random_part}"
+                try:
+                    client.create_table(bigquery.Table(staging_table_name, schema=table.schema))
+                    inserted_rows = load_dataframe(staging_table_name, exists=True)
+
+                    step = "cleanup"
+                    query = f"""
+                        BEGIN TRANSACTION;
+                        DELETE FROM {table_name} WHERE 1=1;
+                        INSERT INTO {table_name} ({", ".join(df_columns)})
+                        SELECT {", ".join(df_columns)} FROM {staging_table_name};
+                        COMMIT TRANSACTION;
+                    """
+                    job = client.query(query)
+                    job.result()
+                finally:
+                    client.delete_table(staging_table_name, not_found_ok=True)
 
-            step = "insert"
-            job = client.load_table_from_file(temp_file, table_name, job_config=job_config)
-            result = job.result()
-            inserted_rows = result.output_rows
             updated_rows = 0
             ignored_rows = 0
 
@@ -324,8 +467,7 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict, on_conflict
 
                         client.create_table(temp_table)
 
-                    job = client.load_table_from_file(temp_file, temp_table_name, job_config=job_config)
-                    job.result()
+                    load_dataframe(temp_table_name, exists=table is not None)
                     return temp_table_name
                 except Conflict as e:
                     pass
@@ -479,9 +621,6 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict, on_conflict
             "executedAt": executed_at
         }
         print(json.dumps(result))
-    finally:
-        temp_file.close()
-        os.unlink(temp_file.name)
 
 
 if "${dataframeName}" in globals():
@@ -32,7 +32,7 @@ export async function writebackPSQL(
     }
   }
 
-  const code = getCode(
+  const code = getWritebackPSQLCode(
     dataframeName,
     table,
     overwriteTable,
@@ -41,6 +41,7 @@ export async function writebackPSQL(
   )
 
   let result: WriteBackResult | null
+  const start = Date.now()
   const { promise, abort } = await executeCode(
     workspaceId,
     sessionId,
@@ -162,6 +163,24 @@ export async function writebackPSQL(
           executedAt,
           step: 'unknown',
         }
+      } else if (result._tag === 'success') {
+        const rows =
+          result.insertedRows + result.updatedRows + result.ignoredRows
+        const durationMs = Date.now() - start
+        logger().info(
+          {
+            workspaceId,
+            sessionId,
+            dataframeName,
+            tableName,
+            overwriteTable,
+            onConflict,
+            rows,
+            durationMs,
+            rowsPerSecond: Math.round((rows * 1000) / Math.max(durationMs, 1)),
+          },
+          `Wrote dataframe back to PostgreSQL`
+        )
       }
 
       return result
@@ -170,7 +189,7 @@ export async function writebackPSQL(
   }
 }
 
-function getCode(
+export function getWritebackPSQLCode(
   dataframeName: string,
   tableName: string,
   overwriteTable: boolean,
@@ -184,6 +203,7 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict):
     from sqlalchemy.exc import DatabaseError
     import pandas as pd
     import datetime
+    import io
     import random
     import string
 
@@ -193,6 +213,87 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict):
     def drop_table_if_exists(connection, table_name):
         connection.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
 
+    def random_suffix():
+        return ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+    def can_copy(connection, df):
+        # COPY FROM STDIN is a psycopg2 feature, so redshift still goes
+        # through to_sql, and so do the columns to_sql doesn't write as text
+        if connection.dialect.driver != "psycopg2":
+            return False
+        for _, column in df.items():
+            if pd.api.types.is_timedelta64_dtype(column) or pd.api.types.is_complex_dtype(column):
+                return False
+            if column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) in ("bytes", "complex", "timedelta", "mixed"):
+                return False
+        return True
+
+    def copy_dataframe(connection, df, table_name, chunk_rows=100_000):
+        """
+        Appends the rows of df to a table with the same columns with COPY FROM
+        STDIN, sending the dataframe as CSV a chunk of rows at a time, which
+        takes seconds for millions of rows where the INSERTs of to_sql take
+        minutes. Returns the number of rows copied.
+        """
+        quote = connection.dialect.identifier_preparer.quote
+        columns = ', '.join(quote(str(column)) for column in df.columns)
+        # nulls are written as a marker no value is going to be, so empty
+        # strings are still empty strings in the table
+        null = f"briefer_null_{random_suffix()}"
+        copy = f"COPY {quote(table_name)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{null}')"
+
+        cursor = connection.connection.cursor()
+        try:
+            for start in range(0, len(df), chunk_rows):
+                buffer = io.StringIO()
+                df.iloc[start:start + chunk_rows].to_csv(buffer, index=False, header=False, na_rep=null)
+                buffer.seek(0)
+                cursor.copy_expert(copy, buffer)
+        finally:
+            cursor.close()
+
+        return len(df)
+
+    def load_temp_table(connection, df, table_name):
+        """
+        Puts df in a new table with the columns to_sql would give it, for the
+        rows to be merged into table_name, returning the quoted name of the
+        table. With psycopg2 that is a temporary table, dropped on commit,
+        which is loaded with COPY.
+        """
+        temp_table_name = f"briefer_temp_{table_name}_{random_suffix()}"
+        if can_copy(connection, df):
+            create_table = pd.io.sql.get_schema(df, temp_table_name, con=connection).strip()
+            create_table = create_table.replace("CREATE TABLE", "CREATE TEMPORARY TABLE", 1)
+            connection.execute(text(f"{create_table} ON COMMIT DROP"))
+            copy_dataframe(connection, df, temp_table_name)
+        else:
+            df.to_sql(temp_table_name, connection, if_exists='replace', index=False)
+
+        return connection.dialect.identifier_preparer.quote(temp_table_name)
+
+    def append_dataframe(connection, df, table_name):
+        """
+        Appends the rows of df to the existing table_name, returning how many
+        were inserted. COPY parses the values straight into the types of the
+        table, uuid, json or enum columns included. Values that aren't valid
+        input for those types, eg. 1.0 for an integer column, are left to the
+        INSERTs of to_sql, which postgres casts to the types of the table.
+        """
+        if can_copy(connection, df):
+            from psycopg2 import DataError
+
+            savepoint = connection.begin_nested()
+            try:
+                inserted_rows = copy_dataframe(connection, df, table_name)
+                savepoint.commit()
+                return inserted_rows
+            except DataError:
+                savepoint.rollback()
+
+        # if_exists='append' is used to avoid the table being dropped
+        return df.to_sql(table_name, connection, if_exists='append', index=False)
+
     def insert_ignore(df, table_name, temp_table_name):
         insert_stmt = text(f"""
             WITH ins AS (
@@ -240,10 +341,17 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict):
         engine = create_engine(${JSON.stringify(databaseUrl)})
         inspector = inspect(engine)
 
-        # if table does not exist, just use to_sql
+        # if table does not exist, create it with to_sql
         if table_name not in inspector.get_table_names():
             step = "insert"
-            inserted_rows = df.to_sql(table_name, engine, if_exists='fail', index=False)
+            with engine.begin() as connection:
+                if can_copy(connection, df):
+                    # the schema comes from the whole dataframe, to_sql can only
+                    # tell the type of object columns, eg. dates, from their values
+                    connection.execute(text(pd.io.sql.get_schema(df, table_name, con=connection)))
+                    inserted_rows = copy_dataframe(connection, df, table_name)
+                else:
+                    inserted_rows = df.to_sql(table_name, connection, if_exists='fail', index=False)
             result = {
                 "_tag": "success",
                 "dataSourceId": "placeholder",
@@ -277,9 +385,8 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict):
                     clean_table(connection, table_name)
                     step = "insert"
 
-                    # then we use to_sql to put the dataframe in the table
-                    # if_exists='append' is used to avoid the table being dropped
-                    inserted_rows = df.to_sql(table_name, connection, if_exists='append', index=False)
+                    # then we put the dataframe in the table
+                    inserted_rows = append_dataframe(connection, df, table_name)
 
                     tx.commit()
                     result = {
@@ -318,10 +425,8 @@ def _briefer_writeback(df, table_name, overwrite_table, on_conflict):
         with engine.connect() as connection:
             tx = connection.begin()
             try:
-                random_part = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
-                temp_table_name = f"briefer_temp_{table_name}_{random_part}"
-                # first we use to_sql to put the dataframe in a new temporary table
-                df.to_sql(temp_table_name, connection, if_exists='replace', index=False)
+                # first we put the dataframe in a new temporary table
+                temp_table_name = load_temp_table(connection, df, table_name)
 
                 updated_rows = 0
                 inserted_rows = 0
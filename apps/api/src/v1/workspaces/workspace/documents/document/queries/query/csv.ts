@@ -3,6 +3,7 @@ import { Router } from 'express'
 import { uuidSchema } from '@briefer/types'
 import { z } from 'zod'
 import { getJupyterManager } from '../../../../../../../jupyter/index.js'
+import { exportQueryCSV } from '../../../../../../../python/query/dump.js'
 
 const csvRouter = Router({ mergeParams: true })
 
@@ -26,6 +27,19 @@ csvRouter.get('/', async (req, res) => {
 
   const jupyterManager = getJupyterManager()
   await jupyterManager.ensureRunning(workspaceId)
+
+  // queries only dump parquet, the csv gets generated the first time it is downloaded
+  try {
+    await exportQueryCSV(workspaceId, queryId.data)
+  } catch (err) {
+    req.log.error(
+      { err, workspaceId, queryId: queryId.data },
+      'Failed to export query csv'
+    )
+    res.status(500).end()
+    return
+  }
+
   const fileRes = await jupyterManager.getFile(workspaceId, filepath)
 
   if (!fileRes) {
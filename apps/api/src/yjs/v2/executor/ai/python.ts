@@ -34,6 +34,7 @@ async function editWithAI(
   event(workspace?.assistantModel ?? null)
 
   return pythonEditStreamed(
+    workspaceId,
     source,
     instructions,
     dataFrames,
@@ -53,12 +53,14 @@ async function editWithAI(
     event(assistantModelId)
 
     return sqlEditStreamed(
+      workspaceId,
       source,
       instructions,
       'DuckDB',
       onSuggestions,
       // TODO: what should be the schema when duckdb?
       null,
+      null,
       assistantModelId,
       workspace?.secrets?.openAiApiKey ?? null
     )
@@ -70,6 +72,7 @@ async function editWithAI(
     throw new Error(`Datasource with id ${datasourceId} not found`)
   }
 
+  const tableInfoStart = Date.now()
   const structure = await fetchDataSourceStructureFromCache(
     dataSource.data.id,
     dataSource.type
@@ -91,6 +94,7 @@ async function editWithAI(
     instructions,
     openAiApiKey
   )
+  const tableInfoSeconds = (Date.now() - tableInfoStart) / 1000
 
   event(assistantModelId)
 
@@ -120,11 +124,13 @@ async function editWithAI(
   })()
 
   return sqlEditStreamed(
+    workspaceId,
     source,
     instructions,
     dialect,
     onSuggestions,
     tableInfo,
+    tableInfoSeconds,
     assistantModelId,
     workspace?.secrets?.openAiApiKey ?? null
   )
@@ -11,6 +11,7 @@ import { logger } from '../../../logger.js'
 import { DataFrame } from '@briefer/types'
 import { createPivotTable } from '../../../python/pivot-table.js'
 import { WSSharedDocV2 } from '../index.js'
+import { config } from '../../../config/index.js'
 
 export type PivotTableEffects = {
   createPivotTable: typeof createPivotTable
@@ -136,7 +137,8 @@ export class PivotTableExecutor implements IPivotTableExecutor {
         attrs.sort,
         attrs.variable.value,
         attrs.page,
-        operation
+        operation,
+        config().AGGREGATION_ENGINE
       )
 
       if (aborted) {
@@ -24,6 +24,7 @@ import { advanceTutorial } from '../../../tutorials.js'
 import { broadcastTutorialStepStates } from '../../../websocket/workspace/tutorial.js'
 import { getJupyterManager } from '../../../jupyter/index.js'
 import { executeCode } from '../../../python/index.js'
+import { config } from '../../../config/index.js'
 
 export type VisualizationEffects = {
   createVisualization: typeof createVisualization
@@ -282,7 +283,8 @@ export class VisualizationExecutor implements IVisualizationExecutor {
         dataframe,
         attrs.input,
         getJupyterManager(),
-        executeCode
+        executeCode,
+        config().AGGREGATION_ENGINE
       )
 
       let abortP = Promise.resolve(aborted)
@@ -35,14 +35,17 @@ def run_ai(cfg):
     default_env = {
       "BASIC_AUTH_USERNAME": cfg["AI_BASIC_AUTH_USERNAME"],
       "BASIC_AUTH_PASSWORD": cfg["AI_BASIC_AUTH_PASSWORD"],
-      "PORT": "8000"
+      "PORT": "8000",
+      "WORKERS": "1",
+      # where the workers share their metrics, emptied on start
+      "AI_METRICS_DIR": "/tmp/briefer-ai-metrics",
     }
     env = os.environ.copy()
     for k, v in default_env.items():
         if k not in env:
             env[k] = v
 
-    ai = subprocess.run(["bash", "-c", "/app/ai/venv/bin/uvicorn api.app:app --host 0.0.0.0 --port ${PORT}"], env=env, cwd="/app/ai")
+    ai = subprocess.run(["bash", "-c", "rm -rf \"${AI_METRICS_DIR}\" && /app/ai/venv/bin/uvicorn api.app:app --host 0.0.0.0 --port ${PORT} --workers ${WORKERS}"], env=env, cwd="/app/ai")
     ai.check_returncode()
 
 